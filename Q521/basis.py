@@ -0,0 +1,364 @@
+import numpy as np
+from history import History, Cluster
+from corral import Corral
+from law import Mathieu, Dawson_Entry, Dawson_Exit, HM_Entry, HM_Exit
+
+"""
+Basis Object
+"""
+
+class Basis:
+    """
+    Fundamental solution engine for the regions of the
+    quadrupole whose x and y equations are linear in
+    position. Since the axial speed is constant in these
+    laws and every ion starts at z = 0 with the injection
+    speed, an ion of a given species is a linear combination
+    of two fundamental solutions per axis:
+
+        u(t) = u(0) * C(t) + v_u(0) * S(t)
+
+    with C(0) = 1, C'(0) = 0 and S(0) = 0, S'(0) = 1. Only
+    these solutions are integrated (two 'ions' per species)
+    through the 'Corral' queue, every real ion is then built
+    from them with a matrix product, so the integration cost
+    does not depend on the number of ions. The results match
+    a direct integration up to floating point rounding.
+    """
+
+    LINEAR_LAWS = (Mathieu, Dawson_Entry, Dawson_Exit, HM_Entry, HM_Exit)
+
+    def __init__(self, queue, filter):
+        """
+        Initialises the 'Basis' object
+
+        Parameters
+        ----------
+
+        queue: list
+            The 'Corral' objects describing the
+            quadrupole regions, in order. Only their
+            solver, law, time step and indices are
+            used; every law must be linear.
+
+        filter: QMF
+            The filter which is being used.
+
+        Return
+        ----------
+
+        None
+        """
+
+        for corral in queue:
+            if not isinstance(corral.law, self.LINEAR_LAWS):
+                raise TypeError(f"The law {type(corral.law).__name__} is not linear in the transverse position")
+
+        self.qmf = filter
+        self.queue = queue
+        self.nodes = 1 + max([corral.start + corral.steps for corral in queue if corral.steps])
+
+        self.tags = None
+        self.fundamental = None
+
+    def lockOn(self, ion):
+        """
+        Integrate the fundamental solutions of every
+        ion species in the input object.
+
+        Parameters
+        ----------
+
+        ion: History or Cluster
+            The object whose ion species are used.
+            Only the charge and mass are read, so
+            the coordinate arrays need not exist.
+
+        Return
+        ----------
+
+        None
+        """
+
+        if isinstance(ion, History):
+            species = [ion]
+        elif isinstance(ion, Cluster):
+            species = [ion[g] for g in range(len(ion))]
+
+        G = len(species)
+        self.tags = [s.tag for s in species]
+
+        # Two fundamental 'ions' per species -> [C, S, C, S, ...]
+        y = History(None, None, param=[
+            "Basis",
+            2 * G,
+            np.repeat([s.mass for s in species], 2),
+            np.repeat([s.charge for s in species], 2),
+            0,
+            0,
+            0,
+            0
+        ])
+
+        y.phaseTime = np.zeros([2, self.nodes])
+        y.pos = np.zeros([3, self.nodes, 2 * G])
+        y.vel = np.zeros([3, self.nodes, 2 * G])
+
+        y.phaseTime[1, 0] = self.qmf.iniPhase
+        y.pos[0:2, 0, 0::2] = 1
+        y.vel[0:2, 0, 1::2] = 1
+        y.vel[2, 0, :] = self.qmf.injSpeed
+
+        # Run the same regions as the queue, always in workspace mode
+        for corral in self.queue:
+            twin = Corral(type(corral.solver), type(corral.law), corral.h, corral.start, corral.steps, corral.qmf, True)
+            twin.timebase = corral.timebase
+            twin.backend = corral.backend
+            twin.tile = corral.tile
+            twin.lockOn(y)
+
+        self.fundamental = y
+
+    def matrix(self, g, j=None):
+        """
+        Fundamental solution matrices of species G,
+        stacked as [[C, S], [C', S']] per transverse
+        axis.
+
+        Parameters
+        ----------
+
+        g: int
+            Species index.
+        j: int
+            {Optional} Time index, if omitted the
+            whole trajectory is returned.
+
+        Return
+        ----------
+
+        Numpy ndarray
+            Array of shape (2, T, 2, 2), or (2, 2, 2)
+            if J is given, indexed as [axis, (time),
+            position/velocity, C/S].
+        """
+
+        y = self.fundamental
+        t = slice(None) if j is None else j
+
+        M = np.stack([
+            y.pos[0:2, t, 2 * g : 2 * g + 2],
+            y.vel[0:2, t, 2 * g : 2 * g + 2]
+        ], axis=-2)
+
+        return M
+
+    def check(self, pos, vel):
+        """
+        Verify that the ions start on the axis with
+        the injection speed, which the superposition
+        relies on.
+
+        Parameters
+        ----------
+
+        pos: Numpy ndarray
+            Initial positions, shape (3, N).
+        vel: Numpy ndarray
+            Initial velocities, shape (3, N).
+
+        Return
+        ----------
+
+        None
+        """
+
+        if np.any(pos[2] != 0) or np.any(vel[2] != self.qmf.injSpeed):
+            raise ValueError("Every ion must start at z = 0 with the injection speed")
+
+    def land(self, pos, vel, g=0):
+        """
+        Determine the final coordinates of an arbitrary
+        number of ions of species G, without building
+        their trajectories.
+
+        Parameters
+        ----------
+
+        pos: Numpy ndarray
+            Initial positions, shape (3, N).
+        vel: Numpy ndarray
+            Initial velocities, shape (3, N).
+        g: int
+            Species index (order of 'lockOn').
+
+        Return
+        ----------
+
+        tuple
+            The final positions and velocities,
+            each of shape (3, N).
+        """
+
+        self.check(pos, vel)
+
+        y = self.fundamental
+        M = self.matrix(g, -1)
+        N = pos.shape[1]
+
+        # Initial state per axis -> (2, 2, N) as [axis, u/v_u, ion]
+        A = np.stack([pos[0:2], vel[0:2]], axis=1)
+        B = np.matmul(M, A)
+
+        x = np.empty([3, N])
+        v = np.empty([3, N])
+        x[0:2] = B[:, 0]
+        v[0:2] = B[:, 1]
+        x[2] = y.pos[2, -1, 2 * g]
+        v[2] = y.vel[2, -1, 2 * g]
+
+        return x, v
+
+    def trace(self, ion):
+        """
+        Write the full trajectories of every ion onto
+        the input object, using the initial coordinates
+        already stored at time index 0. In endpoint
+        mode, only the final coordinates and the loss
+        records are written (see 'settle').
+
+        Parameters
+        ----------
+
+        ion: History or Cluster
+            The object which is being written to,
+            it must be the one given to 'lockOn'.
+
+        Return
+        ----------
+
+        None
+        """
+
+        if isinstance(ion, History):
+            species = [ion]
+        elif isinstance(ion, Cluster):
+            species = [ion[g] for g in range(len(ion))]
+
+        y = self.fundamental
+
+        for g, s in enumerate(species):
+            self.check(s.pos[:, 0, :], s.vel[:, 0, :])
+
+            if s.endpoint:
+                # A fused 'Cluster' keeps the beam statistics of every species together
+                if isinstance(ion, Cluster) and ion.fused is not None:
+                    self.settle(s, g, beam=ion.fused.beam, species=g)
+                else:
+                    self.settle(s, g)
+                continue
+
+            M = self.matrix(g)
+            A = np.stack([s.pos[0:2, 0, :], s.vel[0:2, 0, :]], axis=1)
+
+            # [axis, time, u/v_u, C/S] @ [axis, 1, C/S, ion]
+            B = np.matmul(M, A[:, np.newaxis])
+
+            s.phaseTime[:] = y.phaseTime
+            s.pos[0:2] = B[:, :, 0]
+            s.vel[0:2] = B[:, :, 1]
+            s.pos[2] = y.pos[2, :, 2 * g, np.newaxis]
+            s.vel[2] = y.vel[2, :, 2 * g, np.newaxis]
+
+    def settle(self, ion, g, block=4096, beam=None, species=0):
+        """
+        Endpoint-mode version of 'trace' for species G,
+        the positions are built in blocks of time points
+        to find the losses, the maximum radial excursion
+        and the beam statistics of every region, then
+        only the final coordinates are written. The lost
+        ions keep their position at the time of loss.
+
+        Parameters
+        ----------
+
+        ion: History
+            The species being written to.
+        g: int
+            Species index (order of 'lockOn').
+        block: int
+            Number of time points built at once.
+        beam: Beam
+            {Optional} The accumulators of the beam
+            statistics, those of the species if
+            omitted.
+        species: int
+            Index of the species in these
+            accumulators.
+
+        Return
+        ----------
+
+        None
+        """
+
+        y = self.fundamental
+        r = self.qmf.inscRadius
+        T = self.nodes
+        N = ion.number
+        n = np.arange(N)
+        beam = ion.beam if beam is None else beam
+
+        pos = np.array(ion.pos[:, 0, :])
+        vel = np.array(ion.vel[:, 0, :])
+        A = np.stack([pos[0:2], vel[0:2]], axis=1)
+        M = self.matrix(g)
+
+        # Velocities at the time of loss
+        lossVel = np.zeros([3, N])
+
+        for a in range(0, T, block):
+            b = min(a + block, T)
+
+            # Transverse coordinates of this block -> (axis, time, u/v_u, ion)
+            B = np.matmul(M[:, a:b], A[:, np.newaxis])
+            X = B[:, :, 0]
+
+            hit = np.abs(X[0]) >= r
+            hit |= np.abs(X[1]) >= r
+            first = np.argmax(hit, axis=0)
+            new = (ion.status != 0) & hit[first, n]
+
+            if np.any(new):
+                lost = np.flatnonzero(new)
+                j = first[lost]
+                ion.bury(a + j, lost, np.stack([X[0, j, lost], X[1, j, lost], y.pos[2, a + j, 2 * g]]))
+                lossVel[:, lost] = np.stack([B[0, j, 1, lost], B[1, j, 1, lost], y.vel[2, a + j, 2 * g]])
+
+            # Maximum radial excursion, up to the time of loss
+            limit = np.where(ion.lossIndex < 0, T, ion.lossIndex)
+            R = np.hypot(X[0], X[1])
+            R[np.arange(a, b)[:, np.newaxis] > limit] = 0
+            np.maximum(ion.peak, R.max(axis=0), out=ion.peak)
+
+            # Beam statistics of every region, over the ions not lost before each step
+            if beam is not None:
+                mask = np.arange(a, b)[:, np.newaxis] <= limit
+                V = [B[0, :, 1], B[1, :, 1], np.broadcast_to(y.vel[2, a:b, 2 * g, np.newaxis], X[0].shape)]
+
+                for corral in self.queue:
+                    lo = max(a, corral.start + 1)
+                    hi = min(b, corral.start + corral.steps + 1)
+                    if lo >= hi:
+                        continue
+
+                    k = slice(lo - a, hi - a)
+                    beam.enter(type(corral.law).__name__)
+                    beam.extend(X[:, k], [V[0][k], V[1][k], V[2][k]], mask[k], species)
+
+        x, v = self.land(pos, vel, g)
+        keep = ion.status != 0
+
+        ion.phaseTime[:] = y.phaseTime
+        ion.pos[:, 0, :] = np.where(keep, x, ion.lossPos)
+        ion.vel[:, 0, :] = np.where(keep, v, lossVel)
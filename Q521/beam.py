@@ -0,0 +1,236 @@
+import numpy as np
+
+"""
+Beam Object
+"""
+
+class Beam:
+    """
+    Online beam statistics for the endpoint-only recording
+    mode, where the trajectories are not stored. For every
+    quadrupole region, the RMS size and the RMS emittance
+    of each ion species are accumulated at every time step
+    from the surviving ions, so the memory used does not
+    depend on the number of time points.
+    """
+
+    KEYS = ["rmsX", "rmsY", "emitX", "emitY"]
+
+    def __init__(self, bounds, tags):
+        """
+        Initialises the 'Beam' object
+
+        Parameters
+        ----------
+
+        bounds: list
+            Offsets of each species along the ion
+            axis, that is [0, N_1, N_1 + N_2, ...].
+        tags: list
+            The tags of the ion species.
+
+        Return
+        ----------
+
+        None
+        """
+
+        self.bounds = np.asarray(bounds)
+        self.tags = list(tags)
+        self.labels = np.repeat(np.arange(len(self.tags)), np.diff(self.bounds))
+
+        self.regions = {} # Accumulators per region
+        self.region = None
+
+    def enter(self, name):
+        """
+        Select the region whose accumulators are
+        updated by the next calls of 'update'.
+
+        Parameters
+        ----------
+
+        name: string
+            Name of the region.
+
+        Return
+        ----------
+
+        None
+        """
+
+        G = len(self.tags)
+
+        if name not in self.regions:
+            self.regions[name] = {
+                "steps": np.zeros([G,]),
+                "sum": {key: np.zeros([G,]) for key in self.KEYS},
+                "last": {key: np.full([G,], np.nan) for key in self.KEYS}
+            }
+
+        self.region = self.regions[name]
+
+    def update(self, work, alive=None):
+        """
+        Accumulate the statistics of the ions held
+        in the workspace for the current region.
+
+        Parameters
+        ----------
+
+        work: History
+            The trimmed workspace object.
+        alive: Numpy ndarray
+            {Optional} Indices of the ions held in
+            the workspace, all of them if omitted.
+
+        Return
+        ----------
+
+        None
+        """
+
+        G = len(self.tags)
+        label = self.labels if alive is None else self.labels[alive]
+
+        def moment(w):
+            return np.bincount(label, weights=w, minlength=G)
+
+        n = np.bincount(label, minlength=G)
+        live = n > 0
+        n = np.maximum(n, 1)
+
+        for u, (key, emit) in enumerate([("rmsX", "emitX"), ("rmsY", "emitY")]):
+            x = work.pos[u]
+            p = work.vel[u] / work.vel[2] # Divergence u' = v_u / v_z
+
+            mx = moment(x) / n
+            mp = moment(p) / n
+            xx = moment(x * x) / n - mx ** 2
+            pp = moment(p * p) / n - mp ** 2
+            xp = moment(x * p) / n - mx * mp
+
+            rms = np.sqrt(np.maximum(xx, 0))
+            eps = np.sqrt(np.maximum(xx * pp - xp ** 2, 0))
+
+            self.region["sum"][key][live] += rms[live]
+            self.region["sum"][emit][live] += eps[live]
+            self.region["last"][key][live] = rms[live]
+            self.region["last"][emit][live] = eps[live]
+
+        self.region["steps"][live] += 1
+
+    def extend(self, pos, vel, mask, species=None):
+        """
+        Accumulate the statistics of several time
+        steps at once for the current region, as
+        many calls of 'update' would (used when the
+        coordinates are built by blocks of time
+        points, see 'Basis.settle').
+
+        Parameters
+        ----------
+
+        pos: Numpy ndarray
+            Positions, indexed as [axis, time, ion].
+        vel: Numpy ndarray
+            Velocities, indexed as [axis, time, ion].
+        mask: Numpy ndarray
+            Boolean array of shape (time, ion), true
+            where an ion is counted at that step.
+        species: int
+            {Optional} Index of the only species
+            held in the arrays, every species if
+            omitted.
+
+        Return
+        ----------
+
+        None
+        """
+
+        if species is None:
+            groups = [(g, slice(self.bounds[g], self.bounds[g + 1])) for g in range(len(self.tags))]
+        else:
+            groups = [(species, slice(None))]
+
+        for g, ions in groups:
+            w = mask[:, ions]
+
+            n = np.count_nonzero(w, axis=1)
+            live = n > 0
+            if not np.any(live):
+                continue
+            n = np.maximum(n, 1)
+
+            def moment(v):
+                return np.sum(v, axis=1, where=w)
+
+            for u, (key, emit) in enumerate([("rmsX", "emitX"), ("rmsY", "emitY")]):
+                x = pos[u][:, ions]
+                p = vel[u][:, ions] / vel[2][:, ions] # Divergence u' = v_u / v_z
+
+                mx = moment(x) / n
+                mp = moment(p) / n
+                xx = moment(x * x) / n - mx ** 2
+                pp = moment(p * p) / n - mp ** 2
+                xp = moment(x * p) / n - mx * mp
+
+                rms = np.sqrt(np.maximum(xx, 0))[live]
+                eps = np.sqrt(np.maximum(xx * pp - xp ** 2, 0))[live]
+
+                self.region["sum"][key][g] += rms.sum()
+                self.region["sum"][emit][g] += eps.sum()
+                self.region["last"][key][g] = rms[-1]
+                self.region["last"][emit][g] = eps[-1]
+
+            self.region["steps"][g] += np.count_nonzero(live)
+
+    def summary(self):
+        """
+        The mean (over the time steps) and final
+        statistics of every species, per region.
+
+        Parameters
+        ----------
+
+        None
+
+        Return
+        ----------
+
+        dict
+            Region name -> {"mean": {...}, "last": {...}},
+            each holding an array per statistic,
+            indexed by species.
+        """
+
+        y = {}
+        for name, region in self.regions.items():
+            steps = np.maximum(region["steps"], 1)
+            y[name] = {
+                "mean": {key: region["sum"][key] / steps for key in self.KEYS},
+                "last": dict(region["last"])
+            }
+        return y
+
+    def display(self):
+        """
+        Print the summary of the statistics.
+
+        Parameters
+        ----------
+
+        None
+
+        Return
+        ----------
+
+        None
+        """
+
+        for name, region in self.summary().items():
+            for g, tag in enumerate(self.tags):
+                mean = ", ".join([f"{key} = {region['mean'][key][g]:.4e}" for key in self.KEYS])
+                last = ", ".join([f"{key} = {region['last'][key][g]:.4e}" for key in self.KEYS])
+                print(f"Beam statistics in {name} for {tag} -> mean: {mean} | final: {last}")
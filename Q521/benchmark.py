@@ -0,0 +1,243 @@
+import io
+import sys
+import json
+import time
+import platform
+import argparse
+import contextlib
+import tracemalloc
+from datetime import datetime
+import numpy as np
+from qmf import QMF
+from history import Cluster
+from corral import Corral
+from law import Mathieu, Dawson_Entry, HM_Entry
+from solver import Euler, RK2, RK4
+
+"""
+Throughput Benchmark Functions
+"""
+
+SOLVERS = [Euler, RK2, RK4]
+LAWS = [Mathieu, Dawson_Entry, HM_Entry]
+NUMBERS = [100, 1000, 10000]
+
+def scenario(solver, law, number, ions="ionspec1.csv", steps=200, div=100, backend="numpy", seed=0):
+    """
+    Build a fixed benchmark scenario: the first species
+    of an ion file, with NUMBER ions, in the McIntosh
+    filter of 'filter1.csv'.
+
+    Parameters
+    ----------
+
+    solver: Generic_Solver (& sub-classes)
+        The solver class.
+    law: Generic_Law (& sub-classes)
+        The law class.
+    number: int
+        Number of ions.
+    ions: string
+        The ion file.
+    steps: int
+        Number of time steps.
+    div: int
+        Time steps per RF period.
+    backend: string
+        The 'Corral' backend.
+    seed: int
+        Seed of the initial conditions.
+
+    Return
+    ----------
+
+    function
+        Runs the scenario once, from the same
+        initial conditions on every call, and
+        returns the time spent integrating.
+    """
+
+    qmf = QMF("filter1.csv", "McIntosh Filter")
+    qmf.load_csv()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        cluster = Cluster(ions)
+        cluster.load_csv()
+
+    ion = cluster[0]
+    ion.number = number
+    h = 1 / (div * qmf.pureFrequency)
+
+    def run():
+        ion.setup(steps + 1, qmf, seed=seed)
+        corral = Corral(solver, law, h, 0, steps, qmf, True, True)
+        corral.backend = backend
+
+        start = time.perf_counter()
+        corral.lockOn(ion)
+        return time.perf_counter() - start
+
+    return run
+
+def measure(run, work, repeat=3):
+    """
+    Time a scenario (best of REPEAT runs), then run it
+    once more under tracemalloc for the peak memory
+    (set-up included).
+
+    Parameters
+    ----------
+
+    run: function
+        The scenario.
+    work: int
+        Ion-steps done by one run.
+    repeat: int
+        Number of timed runs.
+
+    Return
+    ----------
+
+    dict
+        The wall time (s), ion-steps per second
+        and peak traced memory (bytes).
+    """
+
+    wall = min([run() for k in range(repeat)])
+
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"ionSteps": work, "wall": wall, "rate": work / wall, "peak": peak}
+
+def suite(numbers=NUMBERS, steps=200, repeat=3, backend="numpy"):
+    """
+    Run every solver x law x ion count scenario of
+    the 'Corral' object.
+
+    Parameters
+    ----------
+
+    numbers: list
+        The ion counts.
+    steps: int
+        Number of time steps per scenario.
+    repeat: int
+        Number of timed runs per scenario.
+    backend: string
+        The 'Corral' backend.
+
+    Return
+    ----------
+
+    dict
+        The results keyed by scenario name, with
+        the metadata of the machine.
+    """
+
+    results = {}
+    for solver in SOLVERS:
+        for law in LAWS:
+            for number in numbers:
+                key = f"Q521/{solver.__name__}/{law.__name__}/N={number}"
+                run = scenario(solver, law, number, steps=steps, backend=backend)
+
+                with np.errstate(all="ignore"):
+                    results[key] = measure(run, number * steps, repeat)
+
+                print(f"{key:<36} {results[key]['rate']:>12.4g} ion-steps/s {results[key]['wall']:>9.4f} s {results[key]['peak'] / 2 ** 20:>9.2f} MiB")
+
+    return {"meta": describe(backend, steps, repeat), "results": results}
+
+def describe(backend, steps, repeat):
+    # Machine and settings of a benchmark run
+    return {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "backend": backend,
+        "steps": steps,
+        "repeat": repeat
+    }
+
+def compare(current, baseline, tolerance=0.1):
+    """
+    Compare two benchmark files and flag the scenarios
+    whose throughput dropped, or whose peak memory grew,
+    by more than the tolerance.
+
+    Parameters
+    ----------
+
+    current: dict
+        The new results (see 'suite').
+    baseline: dict
+        The stored baseline.
+    tolerance: float
+        Relative change allowed.
+
+    Return
+    ----------
+
+    list
+        The names of the regressed scenarios.
+    """
+
+    regressed = []
+    print(f"{'Scenario':<36} {'Rate':>10} {'Memory':>10}")
+
+    for key, new in current["results"].items():
+        old = baseline["results"].get(key)
+        if old is None:
+            continue
+
+        rate = new["rate"] / old["rate"]
+        memory = new["peak"] / old["peak"] if old["peak"] else 1
+
+        flag = rate < 1 - tolerance or memory > 1 + tolerance
+        if flag:
+            regressed.append(key)
+
+        print(f"{key:<36} {rate:>9.2f}x {memory:>9.2f}x {'REGRESSION' if flag else ''}")
+
+    return regressed
+
+def load(file):
+    # Read a benchmark file
+    with open(file) as f:
+        return json.load(f)
+
+def save(results, file):
+    # Write a benchmark file
+    with open(file, "w") as f:
+        json.dump(results, f, indent=4)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Q521 throughput benchmarks")
+    command = parser.add_subparsers(dest="command", required=True)
+
+    p = command.add_parser("run", help="Run the suite and write the results")
+    p.add_argument("--out", default="benchmark.json")
+    p.add_argument("--numbers", type=int, nargs="+", default=NUMBERS)
+    p.add_argument("--steps", type=int, default=200)
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--backend", default="numpy")
+
+    p = command.add_parser("compare", help="Compare results against a baseline")
+    p.add_argument("current")
+    p.add_argument("baseline")
+    p.add_argument("--tolerance", type=float, default=0.1)
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        save(suite(args.numbers, args.steps, args.repeat, args.backend), args.out)
+
+    elif args.command == "compare":
+        regressed = compare(load(args.current), load(args.baseline), args.tolerance)
+        print(f"{len(regressed)} regression(s)")
+        sys.exit(1 if regressed else 0)
@@ -0,0 +1,145 @@
+import io
+import contextlib
+import numpy as np
+from qmf import QMF
+from history import History, Cluster
+from corral import Corral
+from law import Mathieu
+from solver import Euler, RK2, RK4, RK8, Verlet, Yoshida
+
+"""
+Step Size Convergence Functions
+"""
+
+def integrate(solver, filter, ion, div, cycles):
+    """
+    Run a species through the ideal quadrupole field
+    (Mathieu law) for a number of RF cycles.
+
+    Parameters
+    ----------
+
+    solver: Generic_Solver (& sub-classes)
+        The solver class.
+    filter: QMF
+        The filter which is being used.
+    ion: History
+        The species, its arrays must already
+        be set up (only time index 0 is used).
+    div: int
+        Time steps per RF period.
+    cycles: int
+        Number of RF periods.
+
+    Return
+    ----------
+
+    tuple
+        The final positions and velocities,
+        each of shape (3, N).
+    """
+
+    h = 1 / (div * filter.pureFrequency)
+    steps = div * cycles
+
+    y = History(None, None, param=[ion.tag, ion.number, ion.mass, ion.charge, ion.spX, ion.spY, ion.spVX, ion.spVY])
+    y.setup(steps + 1, filter, endpoint=True)
+    y.pos[:, 0, :] = ion.pos[:, 0, :]
+    y.vel[:, 0, :] = ion.vel[:, 0, :]
+
+    corral = Corral(solver, Mathieu, h, 0, steps, filter, True, True)
+    corral.lockOn(y)
+
+    # The lost ions keep their coordinates at the time of loss
+    return y.pos[:, 0, :], y.vel[:, 0, :]
+
+class Reference(RK8):
+    """
+    DOP853 with a tight tolerance, used as the
+    reference solution
+    """
+
+    def __init__(self, specialClass=None):
+        super().__init__(specialClass, 1e-12)
+
+def convergence(filter, ion, solvers, divs, cycles=1000, reference=(Reference, 20)):
+    """
+    Step size versus error table of the solvers over a
+    long run in the ideal field, measured against a tight
+    reference integration.
+
+    Parameters
+    ----------
+
+    filter: QMF
+        The filter which is being used.
+    ion: History
+        The species (set up, only the initial
+        conditions are used).
+    solvers: list
+        The solver classes.
+    divs: list
+        The time steps per RF period to try.
+    cycles: int
+        Number of RF periods.
+    reference: tuple
+        The (solver, div) of the reference run.
+
+    Return
+    ----------
+
+    list
+        A (solver name, div, law evaluations, position
+        error / r_o, velocity error / (w * r_o)) tuple
+        per run, the errors being the largest over the
+        ions at the end of the run.
+    """
+
+    cost = {"Euler": 1, "RK2": 2, "RK4": 4, "Verlet": 1, "Yoshida": 3}
+
+    x0, v0 = integrate(reference[0], filter, ion, reference[1], cycles)
+    r = filter.inscRadius
+    u = filter.refVelocity
+
+    y = []
+    for solver in solvers:
+        for div in divs:
+            with np.errstate(all="ignore"):
+                x, v = integrate(solver, filter, ion, div, cycles)
+                ex = np.max(np.abs(x[0:2] - x0[0:2])) / r
+                ev = np.max(np.abs(v[0:2] - v0[0:2])) / u
+
+            y.append((solver.__name__, div, cost[solver.__name__] * div * cycles, ex, ev))
+
+    return y
+
+# Results for Sodium-A (a = 0.224, q = 0.691, beta_x = 0.87) in the
+# McIntosh filter, 50 ions over 1000 RF cycles, largest error at the end
+#
+#   Solver   div  Evaluations     dX / r_o   dV / w r_o
+#    Euler    50        50000    4.774e-03    6.641e-04
+#    Euler   200       200000    4.599e-04    2.925e-05
+#      RK4    20        80000    8.032e-04    9.781e-05
+#      RK4    50       200000    1.738e-05    1.824e-06
+#      RK4   100       400000    1.076e-06    1.127e-07
+#   Verlet    50        50000    5.055e-03    7.541e-04
+#   Verlet   200       200000    5.437e-04    5.509e-05
+#  Yoshida    50       150000    1.439e-04    1.492e-05
+#  Yoshida   100       300000    8.583e-06    8.943e-07
+#  Yoshida   200       600000    5.305e-07    5.524e-08
+
+if __name__ == "__main__":
+    qmf = QMF("filter1.csv", "McIntosh Filter")
+    qmf.load_csv()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        ion = Cluster("ionspec2.csv")
+        ion.load_csv()
+
+    species = ion[0]
+    species.number = 50
+    species.setup(1, qmf)
+
+    print(f"{'Solver':>8} {'div':>5} {'Evaluations':>12} {'dX / r_o':>12} {'dV / w r_o':>12}")
+    for name, div, evaluations, ex, ev in convergence(qmf, species, [Euler, RK2, RK4, Verlet, Yoshida], [10, 20, 50, 100, 200]):
+        print(f"{name:>8} {div:>5} {evaluations:>12} {ex:>12.3e} {ev:>12.3e}")
@@ -1,4 +1,7 @@
+import numpy as np
+import kernel
 from history import History, Cluster
+from solver import Generic_Adaptive
 
 """
 Corral Object
@@ -11,7 +14,7 @@ class Corral:
     conditions (like inside the span, or fringes).
     """
 
-    def __init__(self, solver, law, timeStep, startIndex, steps, filter):
+    def __init__(self, solver, law, timeStep, startIndex, steps, filter, workspace=True, compact=False):
         """
         Initialises the 'Corral' object
 
@@ -20,7 +23,8 @@ class Corral:
 
         solver: Generic_Solver (& sub-classes)
             The type of solver to be used in the
-            corral's calculations (Euler/RK4/RK2).
+            corral's calculations (Euler/RK4/RK2,
+            or the adaptive RK45/RK8).
             Note that the class is the input, not
             an instance.
         
@@ -49,6 +53,21 @@ class Corral:
         filter: QMF
             The filter which is being used.
 
+        workspace: bool
+            If true, the ions are advanced in place
+            inside pre-allocated buffers, otherwise
+            the legacy slice-and-copy path is used.
+            Both give identical results.
+
+        compact: bool
+            If true (workspace mode only), the ions
+            are checked against the inscribed radius
+            after every step, and the lost ones are
+            recorded and dropped from the working
+            arrays. Their coordinates are left at zero
+            after the loss index. Always done for
+            'History' objects in endpoint mode.
+
         Return
         ----------
 
@@ -60,6 +79,13 @@ class Corral:
         self.start  = startIndex
         self.steps = steps 
         self.qmf = filter
+        self.workspace = workspace
+        self.compact = compact
+        self.store = None # Optional 'Store' streaming the results to disk
+        self.timebase = None # Optional 'Timebase' shared by every region
+        self.backend = "numpy" # Either "numpy" or "numba" (compiled kernels, see 'kernel')
+        self.tile = None # Ions per block of the tiled mode, "auto" to fit the cache (see 'tiles')
+        self.telemetry = None # Optional 'Telemetry' receiving the progress of every step
 
         # Object Constructor Calls
         self.solver = solver()
@@ -78,7 +104,9 @@ class Corral:
             The object which is being written to.
             For 'Cluster' objects, the program will
             perform the simulation for each individual
-            'History' object in the container.
+            'History' object in the container, or for
+            all of them at once if it has been fused
+            (this requires the workspace mode).
 
         Return
         ----------
@@ -91,52 +119,369 @@ class Corral:
         if self.steps == None or self.steps == 0:
             pass
         
+        # If used in "Dive Mode", run the calculation as normal
+        elif isinstance(ion, History):
+            self.drive(ion)
+        
+        # If the 'Cluster' was fused, every species is run in one go
+        elif isinstance(ion, Cluster) and ion.fused is not None:
+            self.drive(ion.fused)
+
+        # If used in "Scan Mode", run the calculation for each
+        # 'History' object
+        elif isinstance(ion, Cluster):
+            # Get the Length of the 'Cluster' object ie Number of Ion Species
+            G = len(ion)
+            G = list(range(G))
+
+            # Iterate over each ion species (the progress is
+            # reported by the 'Telemetry' object, per species)
+            for g in G:
+                
+                # Note that we are referencing cluster[g]
+                self.drive(ion[g])
+
+    def drive(self, ion):
+        """
+        Run the time steps of this corral for a
+        single 'History' object.
+
+        Parameters
+        ----------
+
+        ion: History
+            The object which is being written to.
+
+        Return
+        ----------
+
+        None
+        """
+
+        # Create iterable list of each time step (index - 1)
+        I = range(self.start, self.start + self.steps)
+
+        # In endpoint mode the losses can only be found during the run
+        if ion.endpoint and not self.workspace:
+            raise ValueError("The endpoint recording mode needs the workspace mode")
+        if ion.beam is not None:
+            ion.beam.enter(type(self.law).__name__)
+
+        # The shared time base is only used if it matches this region
+        if self.timebase is not None and self.timebase.fits(self.qmf, self.h):
+            self.solver.timebase = self.timebase
         else:
-            # Create iterable list of each time step (index - 1)
-            I = list(range(self.start, self.start + self.steps))
+            self.solver.timebase = None
 
-            # If used in "Dive Mode", run the calculation as normal
-            if isinstance(ion, History):
+        # The compiled kernels run the whole region in a single loop,
+        # the Numpy paths are used whenever they cannot
+        if self.backend == "numba" and self.workspace and kernel.supports(self, ion):
+            self.begin(ion, self.steps)
+            kernel.drive(self, ion)
+            self.report(int(np.count_nonzero(ion.status)), self.steps)
 
-                for i in I:
-                    i += 1
-                    #print(f"Current Stage of the Corraling Process --------------> {100 * (i - I[0] - 1) / (I[-1] - I[0])}%")
+        elif self.workspace:
+            # Only the ions which have not been lost yet are loaded in compact mode
+            compact = self.compact or ion.endpoint
+            alive = np.flatnonzero(ion.status) if compact else None
 
-                    # Perform the numerical integration  
+            # Each tile goes through the whole region before the next one, the
+            # rows are only complete (and handed to the store) in the last tile
+            tiles = self.tiles(ion, alive)
+            self.begin(ion, self.steps * len(tiles))
+            for k, block in enumerate(tiles):
+                self.segment(ion, block, compact, k == len(tiles) - 1)
+
+        else:
+            self.begin(ion, self.steps)
+            for i in I:
+                i += 1
+
+                # Perform the numerical integration  
+                if self.solver.timebase is None:
                     ion.step(i, self.h, self.qmf.angFrequency) # Determine next index's time value
-                    tempIon = ion.fastEject(i - 1) # Extract a i-time slice of the array
-                    x, v = self.solver.predict(self.law, self.h, self.qmf, tempIon) # Use the solver to determine future values
-
-                    # Write these to the pre-allocated coordinate slots
-                    ion.pos[:, i, :] += x
-                    ion.vel[:, i, :] += v
-            
-            # If used in "Scan Mode", run the calculation for each
-            # 'History' object
-            elif isinstance(ion, Cluster):
-                # Get the Length of the 'Cluster' object ie Number of Ion Species
-                G = len(ion)
-                G = list(range(G))
-
-                # Iterate over each ion species
-                for g in G:
-                    
-                    # Notice that the progress meter is based on the number of completed Ion Species now
-                    try:
-                        print(f"Current Stage of the Cluster Corraling Process --------------> {100 * (g - G[0]) / (G[-1] - G[0])}%")
-                    except:
-                        pass
-                    
-                    # Iterate over each time point
-                    for i in I:
-                        i += 1
-                        
-                        # Perform the numerical integration for the 
-                        ion[g].step(i, self.h, self.qmf.angFrequency) # Note that we are referencing  cluster[g]
-                        tempIon = ion[g].fastEject(i - 1)
-                        x, v = self.solver.predict(self.law, self.h, self.qmf, tempIon)
-
-                        # Write these to the pre-allocated coordinate slots
-                        # of the appropriate g-th 'History' object
-                        ion[g].pos[:, i, :] += x
-                        ion[g].vel[:, i, :] += v
+                else:
+                    ion.phaseTime[:, i] = self.timebase.phaseTime[:, i]
+                tempIon = ion.fastEject(i - 1) # Extract a i-time slice of the array
+                self.solver.index = i - 1
+                x, v = self.solver.predict(self.law, self.h, self.qmf, tempIon) # Use the solver to determine future values
+
+                # Write these to the pre-allocated coordinate slots
+                ion.pos[:, i, :] += x
+                ion.vel[:, i, :] += v
+                if self.store is not None:
+                    self.store.mark(ion, i)
+                self.report(ion.number)
+
+        # Hand the remaining rows of this region to the store
+        if self.store is not None:
+            self.store.mark(ion, self.start + self.steps, force=True)
+
+    def segment(self, ion, alive=None, compact=False, mark=True):
+        """
+        Run the time steps of this corral in place
+        for a set of ions of a 'History' object.
+
+        Parameters
+        ----------
+
+        ion: History
+            The object which is being written to.
+        alive: Numpy ndarray
+            {Optional} Indices of the ions to be
+            run, all of them if omitted.
+        compact: bool
+            Check the ions against the inscribed
+            radius after every step, and drop the
+            lost ones from the working arrays.
+        mark: bool
+            Notify the store of every time index
+            written.
+
+        Return
+        ----------
+
+        None
+        """
+
+        work = ion.workspace(self.start, alive)
+        self.reserve(work)
+
+        # Plain slices are used for as long as no ion is missing
+        index = None if work.number == ion.number else alive
+
+        for i in range(self.start, self.start + self.steps):
+            i += 1
+
+            # Advance the ions in place, then the phase and time
+            self.solver.index = i - 1
+            if work.number:
+                self.solver.advance(self.law, self.h, self.qmf, work)
+            self.tick(work, i)
+
+            # Write these to the pre-allocated coordinate slots
+            ion.record(i, work, index)
+            if mark and self.store is not None:
+                self.store.mark(ion, i)
+            self.report(work.number)
+
+            if not compact:
+                continue
+
+            # Drop the lost ions from the working arrays
+            lost = self.sweep(work)
+            if lost is not None:
+                ion.bury(i, alive[lost], work.pos[:, lost])
+
+                keep = ~lost
+                alive = alive[keep]
+                index = alive
+                work.shrink(keep)
+                self.reserve(work)
+
+    def tiles(self, ion, alive=None):
+        """
+        Split the ions into the blocks of the tiled
+        mode, so that the working arrays of a block
+        stay in the cache through many steps. The
+        ions are independent, hence the results do
+        not depend on the tiling. Not used in the
+        endpoint mode, whose beam statistics need
+        every ion at each step, nor by the adaptive
+        solvers, whose step control is shared by
+        all the ions.
+
+        Parameters
+        ----------
+
+        ion: History
+            The object which is being written to.
+        alive: Numpy ndarray
+            {Optional} Indices of the ions to be
+            run, all of them if omitted.
+
+        Return
+        ----------
+
+        list
+            The index arrays of the blocks, or
+            [alive] if the ions are not tiled.
+        """
+
+        size = self.fit(ion) if self.tile == "auto" else self.tile
+        n = ion.number if alive is None else len(alive)
+
+        if size is None or ion.endpoint or isinstance(self.solver, Generic_Adaptive) or n <= size:
+            return [alive]
+
+        if alive is None:
+            alive = np.arange(ion.number)
+        return [alive[a : a + size] for a in range(0, n, size)]
+
+    def fit(self, ion, cache=1 << 20):
+        """
+        Number of ions per tile whose working set
+        (coordinates, solver stage buffers and law
+        probe) fits in CACHE bytes.
+
+        Parameters
+        ----------
+
+        ion: History
+            The object which is being written to.
+        cache: int
+            The cache size, in bytes.
+
+        Return
+        ----------
+
+        int
+            The tile size.
+        """
+
+        # Measured on the buffers of a single ion
+        solver = type(self.solver)()
+        work = ion.hollow(np.arange(1))
+        solver.reserve(work)
+
+        size = work.pos.nbytes + work.vel.nbytes
+        for value in vars(solver).values():
+            if isinstance(value, np.ndarray):
+                size += value.nbytes
+            elif isinstance(value, History):
+                size += value.pos.nbytes + value.vel.nbytes
+
+        return max(1, cache // size)
+
+    def probes(self, ion):
+        """
+        The methods counted and timed by a 'Profile'
+        (see 'instrument') while this corral runs:
+        the law evaluations, the solver steps, the
+        time slicing and recording of the 'History'
+        objects, the loss checks and the compiled
+        kernels.
+
+        Parameters
+        ----------
+
+        ion: History or Cluster
+            The object which is being written to.
+
+        Return
+        ----------
+
+        list
+            (object, method name, label) tuples.
+        """
+
+        if isinstance(ion, History):
+            species = [ion]
+        elif ion.fused is not None:
+            species = [ion.fused]
+        else:
+            species = [ion[g] for g in range(len(ion))]
+
+        y = [
+            (self.law, "compute", "law.compute"),
+            (self.solver, "advance", "solver.advance"),
+            (self.solver, "predict", "solver.predict"),
+            (self, "sweep", "sweep"),
+            (kernel, "drive", "kernel.drive")
+        ]
+        for s in species:
+            y += [(s, "fastEject", "fastEject"), (s, "record", "record"), (s, "bury", "bury")]
+
+        return y
+
+    def begin(self, ion, total):
+        """
+        Start a telemetry stage for this region and
+        species, if there is a 'Telemetry' object.
+        """
+
+        if self.telemetry is not None:
+            self.telemetry.start(f"{type(self.law).__name__} [{ion.tag}]", total)
+
+    def report(self, survivors, steps=1):
+        """
+        Report time steps to the 'Telemetry' object,
+        if there is one (see 'Telemetry.update').
+        """
+
+        if self.telemetry is not None:
+            self.telemetry.update(survivors, steps)
+
+    def tick(self, work, i):
+        """
+        Set the time and phase of the workspace to
+        those of time index I, read from the time
+        base if there is one (no cumulative drift).
+
+        Parameters
+        ----------
+
+        work: History
+            The trimmed workspace object.
+        i: int
+            The time index just reached.
+
+        Return
+        ----------
+
+        None
+        """
+
+        if self.solver.timebase is None:
+            work.tick(self.h, self.qmf.angFrequency)
+        else:
+            work.phaseTime[:] = self.timebase.phaseTime[:, i]
+
+    def reserve(self, work):
+        """
+        Pre-allocate the solver stage buffers and
+        the buffers of the radial check for the
+        current size of the workspace.
+
+        Parameters
+        ----------
+
+        work: History
+            The trimmed workspace object.
+
+        Return
+        ----------
+
+        None
+        """
+
+        self.solver.reserve(work)
+        self.gauge = np.empty([2, work.number])
+        self.card = np.empty([2, work.number], dtype=bool)
+
+    def sweep(self, work):
+        """
+        Check the ions in the workspace against the
+        inscribed radius, that is |x| >= r_o or
+        |y| >= r_o.
+
+        Parameters
+        ----------
+
+        work: History
+            The trimmed workspace object.
+
+        Return
+        ----------
+
+        Numpy ndarray or None
+            Boolean vector, true for the lost ions,
+            or None if every ion is still inside.
+        """
+
+        np.abs(work.pos[0:2], out=self.gauge)
+        np.greater_equal(self.gauge, self.qmf.inscRadius, out=self.card)
+
+        if not self.card.any():
+            return None
+        return self.card.any(axis=0)
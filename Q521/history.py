@@ -1,7 +1,10 @@
 import numpy as np
 import csv
+import tempfile
+import os
 from copy import deepcopy
-import random as rng
+import seeding
+from beam import Beam
 
 class History:
     """
@@ -42,6 +45,11 @@ class History:
         # Input Parameters
         self.name = name
         self.tag = tag
+
+        # Recording mode (see 'setup')
+        self.endpoint = False
+        self.beam = None
+        self.seed = None # Seed sequence of the initial conditions (see 'setup')
         
         # Manual Definition
         if name == None:
@@ -54,7 +62,7 @@ class History:
             self.spVX = param[6]
             self.spVY = param[7]
 
-    def setup(self, nodes, filter):
+    def setup(self, nodes, filter, scratch=None, endpoint=False, seed=None):
         """
         Pre-allocate the time and coordinate 
         arrays and creates the initial conditions
@@ -69,6 +77,19 @@ class History:
         filter: QMF
             The filter which will be used
             for the simulation.
+        scratch: string
+            {Optional} Directory in which the
+            coordinate arrays are memory-mapped,
+            for runs larger than the memory.
+        endpoint: bool
+            {Optional} If true, only the current
+            coordinates are kept (a single time slot)
+            together with online statistics: the
+            maximum radial excursion of each ion
+            ('peak') and the 'Beam' accumulators.
+        seed: int or SeedSequence
+            {Optional} Seed of the initial
+            conditions, see 'seeding.sequence'.
 
         Return
         ----------
@@ -76,27 +97,53 @@ class History:
         None
         """
         
+        self.scratch = scratch
+        self.endpoint = endpoint
         self.phaseTime = np.zeros([2, nodes])
         self.status = np.ones([self.number,])
-        self.pos = np.zeros([3, nodes, self.number])
-        self.vel = np.zeros([3, nodes, self.number])
+        self.lossIndex = np.full([self.number,], -1)
+        self.lossPos = np.zeros([3, self.number])
+        self.peak = np.zeros([self.number,])
+        self.beam = Beam([0, self.number], [self.tag]) if endpoint else None
+
+        T = 1 if endpoint else nodes
+        self.pos = allocate([3, T, self.number], scratch)
+        self.vel = allocate([3, T, self.number], scratch)
 
         self.phaseTime[1, 0] = filter.iniPhase
-        for i in range(self.number):
-            del_x = self.spX * (2 * rng.random() - 1)
-            del_y = self.spY * (2 * rng.random() - 1)
+        self.seed = seeding.sequence(seed)
+        self.scatter(filter)
+    
+    def scatter(self, filter):
+        """
+        Draw the initial conditions of every ion
+        from the seed sequence of the object, with
+        a uniform spread around the axis and the
+        injection speed along z.
+
+        Parameters
+        ----------
 
-            del_vx = self.spVX * (2 * rng.random() - 1)
-            del_vy = self.spVY * (2 * rng.random() - 1)
+        filter: QMF
+            The filter which will be used
+            for the simulation.
 
-            self.pos[0, 0, i] = del_x
-            self.pos[1, 0, i] = del_y
-            self.pos[2, 0, i] = 0
+        Return
+        ----------
+
+        None
+        """
+
+        d = seeding.spread(self.seed, self.number, [self.spX, self.spY, self.spVX, self.spVY])
+
+        self.pos[0, 0] = d[0]
+        self.pos[1, 0] = d[1]
+        self.pos[2, 0] = 0
+
+        self.vel[0, 0] = d[2]
+        self.vel[1, 0] = d[3]
+        self.vel[2, 0] = filter.injSpeed
 
-            self.vel[0, 0, i] = del_vx
-            self.vel[1, 0, i] = del_vy
-            self.vel[2, 0, i] = filter.injSpeed
-    
     def burn(self):
         """
         Pre-allocates a trimmed array intended
@@ -200,6 +247,343 @@ class History:
 
         return y
     
+    def hollow(self, alive=None):
+        """
+        Duplicates the ion parameters into a trimmed
+        'History' object intended for a single time
+        step. Unlike 'fastEject', it is meant to be
+        created once and then overwritten in place
+        on every step.
+
+        Parameters
+        ----------
+
+        alive: Numpy ndarray
+            {Optional} Indices of the ions to be kept,
+            all of them if omitted.
+
+        Return
+        ----------
+
+        History
+            A trimmed 'History' object with
+            zeroed coordinate arrays.
+        """
+
+        def pick(value):
+            # Per-ion parameters (fused species) are subset too
+            if alive is not None and np.ndim(value) > 0:
+                return value[alive]
+            return value
+
+        # Duplicates a new instance of the History object
+        y =  History(None, None, param=[
+            self.tag,
+            self.number if alive is None else len(alive),
+            pick(self.mass),
+            pick(self.charge),
+            pick(self.spX),
+            pick(self.spY),
+            pick(self.spVX),
+            pick(self.spVY)
+        ])
+
+        y.phaseTime = np.zeros([2,])
+        y.pos = np.zeros([3, y.number])
+        y.vel = np.zeros([3, y.number])
+
+        return y
+
+    def workspace(self, j, alive=None):
+        """
+        Creates the trimmed workspace used by the
+        in-place solvers, loaded with the coordinates
+        at time index J.
+
+        Parameters
+        ----------
+
+        j: int
+            Time index.
+        alive: Numpy ndarray
+            {Optional} Indices of the ions to be
+            loaded, all of them if omitted.
+
+        Return
+        ----------
+
+        History
+            A trimmed 'History' object with
+            a copy of the coordinates at time J.
+        """
+
+        y = self.hollow(alive)
+        y.phaseTime[:] = self.phaseTime[:, j]
+
+        # Only the current time slot exists in endpoint mode
+        if self.endpoint:
+            j = 0
+
+        if alive is None:
+            y.pos[:] = self.pos[:, j, :]
+            y.vel[:] = self.vel[:, j, :]
+        else:
+            y.pos[:] = self.pos[:, j, alive]
+            y.vel[:] = self.vel[:, j, alive]
+
+        return y
+
+    def record(self, j, work, alive=None):
+        """
+        Writes the coordinates held in a trimmed
+        workspace onto the pre-allocated slots at
+        time index J.
+
+        Parameters
+        ----------
+
+        j: int
+            Time index.
+        work: History
+            The trimmed workspace object.
+        alive: Numpy ndarray
+            {Optional} Indices of the ions held
+            in the workspace, all of them if omitted.
+
+        Return
+        ----------
+
+        None
+        """
+
+        self.phaseTime[:, j] = work.phaseTime
+
+        # Update the online statistics, then overwrite the current time slot
+        if self.endpoint:
+            r = np.hypot(work.pos[0], work.pos[1])
+            if alive is None:
+                np.maximum(self.peak, r, out=self.peak)
+            else:
+                self.peak[alive] = np.maximum(self.peak[alive], r)
+
+            self.beam.update(work, alive)
+            j = 0
+
+        if alive is None:
+            self.pos[:, j, :] = work.pos
+            self.vel[:, j, :] = work.vel
+        else:
+            self.pos[:, j, alive] = work.pos
+            self.vel[:, j, alive] = work.vel
+
+    def shrink(self, keep):
+        """
+        Compacts a trimmed workspace down to the
+        ions selected by the boolean KEEP vector.
+        The arrays are re-allocated, so any solver
+        buffers must be reserved again.
+
+        Parameters
+        ----------
+
+        keep: Numpy ndarray
+            Boolean vector, true for the ions
+            to be kept.
+
+        Return
+        ----------
+
+        None
+        """
+
+        y = self.hollow(np.flatnonzero(keep))
+
+        self.number = y.number
+        self.mass = y.mass
+        self.charge = y.charge
+        self.spX = y.spX
+        self.spY = y.spY
+        self.spVX = y.spVX
+        self.spVY = y.spVY
+
+        self.pos = self.pos[:, keep]
+        self.vel = self.vel[:, keep]
+
+    def bury(self, j, lost, pos):
+        """
+        Mark ions as lost at time index J and keep
+        a record of where they were lost.
+
+        Parameters
+        ----------
+
+        j: int
+            Time index.
+        lost: Numpy ndarray
+            Indices of the lost ions.
+        pos: Numpy ndarray
+            Their positions at the time of
+            loss, shape (3, len(lost)).
+
+        Return
+        ----------
+
+        None
+        """
+
+        self.status[lost] = 0
+        self.lossIndex[lost] = j
+        self.lossPos[:, lost] = pos
+
+    def tick(self, dt, w):
+        """
+        Trimmed-object version of 'step', advances
+        the phase and time values in place.
+
+        Parameters
+        ----------
+
+        dt: float
+            Time step
+        w: float
+            Angular frequency.
+
+        Return
+        ----------
+
+        None
+        """
+
+        self.phaseTime[0] += dt
+        self.phaseTime[1] += w * dt
+
+    def scout(self, radius, block=4096):
+        """
+        Determine the first time index at which each
+        ion reaches the rods, that is |x| >= r_o or
+        |y| >= r_o, and mark the lost ions as false
+        in the 'status' array. The search is a single
+        Numpy reduction per block of time points, so
+        the memory used does not grow with the run.
+
+        Parameters
+        ----------
+
+        radius: float
+            The inscribed radius of the filter.
+        block: int
+            Number of time points checked at once.
+
+        Return
+        ----------
+
+        Numpy ndarray
+            The first loss index of every ion,
+            -1 for the transmitted ones. Also
+            stored in the 'lossIndex' attribute.
+            In endpoint mode, the indices recorded
+            during the run are returned instead.
+        """
+
+        # Losses were already recorded during the run
+        if self.endpoint:
+            return self.lossIndex
+
+        _, T, N = self.pos.shape
+        loss = np.full([N,], -1)
+        n = np.arange(N)
+
+        for a in range(0, T, block):
+            b = min(a + block, T)
+
+            # Boolean card of the ions outside r_o in this block
+            hit = np.abs(self.pos[0, a:b, :]) >= radius
+            hit |= np.abs(self.pos[1, a:b, :]) >= radius
+
+            first = np.argmax(hit, axis=0)
+            new = (loss < 0) & hit[first, n]
+            loss[new] = a + first[new]
+
+            # Stop early once every ion is accounted for
+            if np.all(loss >= 0):
+                break
+
+        self.lossIndex[:] = loss
+        self.status[loss >= 0] = 0
+
+        return loss
+
+    def skim(self, keep, block=4096):
+        """
+        Create a 'History' object holding only the
+        ions selected by the boolean KEEP vector.
+        The arrays are gathered once, or shared as
+        views when every ion is kept; the time and
+        phase values are always shared. Memory-mapped
+        arrays stay memory-mapped.
+
+        Parameters
+        ----------
+
+        keep: Numpy ndarray
+            Boolean vector, true for the ions
+            to be kept.
+        block: int
+            Number of time points gathered at once.
+
+        Return
+        ----------
+
+        History
+            The skimmed 'History' object.
+        """
+
+        # Duplicates a new instance of the History object
+        y =  History(None, None, param=[
+            self.tag,
+            int(np.count_nonzero(keep)),
+            self.mass,
+            self.charge,
+            self.spX,
+            self.spY,
+            self.spVX,
+            self.spVY
+        ])
+
+        # Stability parameters (only set for 'Cluster' members)
+        if hasattr(self, "a"):
+            y.a = self.a
+            y.q = self.q
+
+        y.phaseTime = self.phaseTime
+
+        if np.all(keep):
+            y.status = self.status
+            y.pos = self.pos
+            y.vel = self.vel
+        else:
+            # Gather along blocks of time points, so that memory-mapped
+            # arrays are read sequentially
+            scratch = getattr(self, "scratch", None)
+            _, T, _ = self.pos.shape
+            y.scratch = scratch
+            y.status = self.status[keep]
+            y.pos = allocate([3, T, y.number], scratch)
+            y.vel = allocate([3, T, y.number], scratch)
+            for a in range(0, T, block):
+                b = min(a + block, T)
+                y.pos[:, a:b, :] = self.pos[:, a:b, keep]
+                y.vel[:, a:b, :] = self.vel[:, a:b, keep]
+
+        if hasattr(self, "lossIndex"):
+            y.lossIndex = self.lossIndex[keep]
+            y.peak = self.peak[keep]
+
+        y.endpoint = self.endpoint
+        y.beam = self.beam
+
+        return y
+
     def replicate(self):
         """
         {Legacy} THIS IS VERY INEFFICIENT, FIND A BETTER SOLUTION
@@ -208,17 +592,26 @@ class History:
         clone = deepcopy(self)
         return clone
     
-    def save(self, dir, date, hour):
+    def save(self, dir, date, hour, filter=None):
         """
-        Save the coordinate arrays in a txt/csv file.
-        The structure of the file is, N * [x,y,z] for
-        columns and the number of rows is the total
-        number of time points.
+        Save the coordinate arrays in a binary store
+        (see the 'Store' object), that is a directory
+        with a JSON header and '.npy' files laid out
+        as (time, xyz, ion). Use the 'Archive' object
+        to read it back.
 
         Parameters
         ----------
 
-        None
+        dir: string
+            The results directory.
+        date: string
+            Date stamp of the run.
+        hour: string
+            Hour stamp of the run.
+        filter: QMF
+            {Optional} The filter, its parameters
+            are written to the header.
 
         Return
         ----------
@@ -226,16 +619,13 @@ class History:
         None
         """
 
-        with open(dir + "/set "+ date + " " + hour + ".csv", "w") as file:
-            _, I, J = self.pos.shape
-            
-            for i in range(I):
-                line = ""
-                for j in range(J):
-                    line = line + str(self.pos[0, i, j]) + ","
-                    line = line + str(self.pos[1, i, j]) + ","
-                    line = line + str(self.pos[2, i, j]) + ","
-                file.write(line+ "\n")
+        # Imported here since 'store' depends on this module
+        from store import Store
+
+        store = Store(dir + "/set " + date + " " + hour, self, filter)
+        _, T, _ = self.pos.shape
+        store.mark(self, T - 1, force=True)
+        store.close()
 
     
     def step(self, j, dt, w):
@@ -307,6 +697,9 @@ class Cluster:
         # Input Parameters
         self.name = name
         self._values = [] # Private attribute
+        self.fused = None # Single 'History' spanning every species (see 'fuse')
+        self.seed = None # Parent seed sequence of the species streams (see 'setup')
+        self.bounds = None
     
     def load_csv(self):
         
@@ -333,44 +726,151 @@ class Cluster:
                 self.append(ion)
                 print(row)
     
-    def setup(self, nodes, filter):
+    def setup(self, nodes, filter, scratch=None, endpoint=False, seed=None):
         """
-        Setup for the Cluster Type
+        Setup for the Cluster Type, see 'History.setup'.
+        Every species draws its initial conditions from
+        its own stream, spawned from the SEED.
         """
         G = len(self)
+        self.seed = seeding.sequence(seed)
+        streams = self.seed.spawn(G)
+        self.fused = None
+        self.bounds = None
+        self.scratch = scratch
+        T = 1 if endpoint else nodes
 
         for g in range(G):
         
             den = self._values[g].mass * (filter.angFrequency * filter.inscRadius) ** 2
-            self._values[g].a = (4 * self._values[g].mass * filter.directPotential) / den
-            self._values[g].q = 2 * self._values[g].mass * filter.radioPotential / den
+            self._values[g].a = (4 * self._values[g].charge * filter.directPotential) / den
+            self._values[g].q = 2 * self._values[g].charge * filter.radioPotential / den
             
             self._values[g].phaseTime = np.zeros([2, nodes])
             self._values[g].status = np.ones([self._values[g].number,])
-            self._values[g].pos = np.zeros([3, nodes, self._values[g].number])
-            self._values[g].vel = np.zeros([3, nodes, self._values[g].number])
+            self._values[g].lossIndex = np.full([self._values[g].number,], -1)
+            self._values[g].lossPos = np.zeros([3, self._values[g].number])
+            self._values[g].peak = np.zeros([self._values[g].number,])
+            self._values[g].endpoint = endpoint
+            self._values[g].beam = Beam([0, self._values[g].number], [self._values[g].tag]) if endpoint else None
+
+            self._values[g].scratch = scratch
+            self._values[g].pos = allocate([3, T, self._values[g].number], scratch)
+            self._values[g].vel = allocate([3, T, self._values[g].number], scratch)
 
             self._values[g].phaseTime[1, 0] = filter.iniPhase
-            for i in range(self._values[g].number):
-                del_x = self._values[g].spX * (2 * rng.random() - 1)
-                del_y = self._values[g].spY * (2 * rng.random() - 1)
+            self._values[g].seed = streams[g]
+            self._values[g].scatter(filter)
+    
+    def fuse(self):
+        """
+        Concatenate every ion species along the ion
+        axis into a single 'History' object with
+        per-ion charge and mass vectors and a shared
+        'phaseTime', so that one solver call per step
+        advances all the species together. The arrays
+        of each species are then re-pointed to views
+        of the fused arrays, so they can still be
+        accessed individually. IT IS ASSUMED THAT THE
+        'setup' METHOD HAS ALREADY BEEN CALLED.
 
-                del_vx = self._values[g].spVX * (2 * rng.random() - 1)
-                del_vy = self._values[g].spVY * (2 * rng.random() - 1)
+        Parameters
+        ----------
 
-                self._values[g].pos[0, 0, i] = del_x
-                self._values[g].pos[1, 0, i] = del_y
-                self._values[g].pos[2, 0, i] = 0
+        None
+
+        Return
+        ----------
+
+        History
+            The fused 'History' object.
+        """
+
+        G = len(self)
+        counts = [self._values[g].number for g in range(G)]
+
+        # Offsets of each species along the ion axis
+        self.bounds = np.zeros([G + 1,], dtype=int)
+        self.bounds[1:] = np.cumsum(counts)
+
+        # Per-ion parameter vectors
+        mass = np.repeat([self._values[g].mass for g in range(G)], counts)
+        charge = np.repeat([self._values[g].charge for g in range(G)], counts)
+
+        y = History(None, None, param=[
+            "+".join([self._values[g].tag for g in range(G)]),
+            int(self.bounds[-1]),
+            mass,
+            charge,
+            np.repeat([self._values[g].spX for g in range(G)], counts),
+            np.repeat([self._values[g].spY for g in range(G)], counts),
+            np.repeat([self._values[g].spVX for g in range(G)], counts),
+            np.repeat([self._values[g].spVY for g in range(G)], counts)
+        ])
+
+        # Every species shares the same time base
+        y.phaseTime = self._values[0].phaseTime
+        y.status = np.concatenate([self._values[g].status for g in range(G)])
+        y.lossIndex = np.concatenate([self._values[g].lossIndex for g in range(G)])
+        y.lossPos = np.concatenate([self._values[g].lossPos for g in range(G)], axis=1)
+        y.peak = np.concatenate([self._values[g].peak for g in range(G)])
+
+        # One set of accumulators covering every species
+        y.endpoint = self._values[0].endpoint
+        if y.endpoint:
+            y.beam = Beam(self.bounds, [self._values[g].tag for g in range(G)])
+        _, T, _ = self._values[0].pos.shape
+        y.scratch = self.scratch
+        y.pos = allocate([3, T, y.number], self.scratch)
+        y.vel = allocate([3, T, y.number], self.scratch)
+        for g in range(G):
+            a, b = self.bounds[g], self.bounds[g + 1]
+            y.pos[:, :, a:b] = self._values[g].pos
+            y.vel[:, :, a:b] = self._values[g].vel
+
+        # Re-point each species to its own slice of the fused arrays
+        for g in range(G):
+            a, b = self.bounds[g], self.bounds[g + 1]
+
+            self._values[g].phaseTime = y.phaseTime
+            self._values[g].status = y.status[a:b]
+            self._values[g].lossIndex = y.lossIndex[a:b]
+            self._values[g].lossPos = y.lossPos[:, a:b]
+            self._values[g].peak = y.peak[a:b]
+            self._values[g].pos = y.pos[:, :, a:b]
+            self._values[g].vel = y.vel[:, :, a:b]
+
+        self.fused = y
+        return y
+
+    def beams(self):
+        """
+        The 'Beam' accumulators of the endpoint mode,
+        a single one if the 'Cluster' was fused, else
+        one per species.
+        """
+
+        if self.fused is not None:
+            return [self.fused.beam]
+        return [self._values[g].beam for g in range(len(self))]
 
-                self._values[g].vel[0, 0, i] = del_vx
-                self._values[g].vel[1, 0, i] = del_vy
-                self._values[g].vel[2, 0, i] = filter.injSpeed
-    
     def append(self, val):
         self._values.append(val)
 
-    def save(self, dir, date, hour):
-        pass
+    def save(self, dir, date, hour, filter=None):
+        """
+        Save every ion species in a single binary
+        store, see 'History.save'.
+        """
+
+        # Imported here since 'store' depends on this module
+        from store import Store
+
+        store = Store(dir + "/set " + date + " " + hour, self, filter)
+        for g in range(len(self)):
+            _, T, _ = self._values[g].pos.shape
+            store.mark(self._values[g], T - 1, force=True)
+        store.close()
   
     def step(self, j, dt, w):
         pass
@@ -383,3 +883,42 @@ class Cluster:
     
     def __len__(self):
         return len(self._values)
+
+"""
+Storage Functions
+"""
+
+def allocate(shape, scratch=None):
+    """
+    Pre-allocate a zeroed coordinate array, either
+    in memory or backed by a temporary file in the
+    SCRATCH directory (removed once the array is
+    released), so that runs larger than the memory
+    can be handled.
+
+    Parameters
+    ----------
+
+    shape: list
+        Shape of the array.
+    scratch: string
+        {Optional} Directory of the temporary file.
+
+    Return
+    ----------
+
+    Numpy ndarray or Numpy memmap
+        The zeroed array.
+    """
+
+    if scratch is None:
+        return np.zeros(shape)
+
+    os.makedirs(scratch, exist_ok=True)
+    file = tempfile.NamedTemporaryFile(dir=scratch)
+
+    # The file is named so that other processes can map it (see 'parallel'),
+    # it lives (and is removed) with the array
+    y = np.memmap(file, dtype=float, mode="w+", shape=tuple(shape))
+    y.file = file
+    return y
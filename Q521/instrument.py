@@ -0,0 +1,244 @@
+import json
+import time
+import contextlib
+import tracemalloc
+
+"""
+Profile Object
+"""
+
+class Profile:
+    """
+    Opt-in instrumentation of a simulation. Each region
+    (a 'Corral' of the queue, or the whole run) records
+    its wall time, its ion-steps per second, the bytes
+    allocated while it ran (tracemalloc) and, for the
+    watched methods (law evaluations, solver steps, loss
+    checks, ...), the number of calls and the time spent
+    in them. The methods are only wrapped for the
+    duration of the region, on the instances themselves,
+    so nothing is paid when no profile is attached. The
+    results are kept as a list of dictionaries and can be
+    exported as Chrome trace events (chrome://tracing or
+    Perfetto).
+    """
+
+    def __init__(self, memory=True):
+        """
+        Initialises the 'Profile' object
+
+        Parameters
+        ----------
+
+        memory: bool
+            Trace the allocations of every region
+            with tracemalloc (slows the run down).
+
+        Return
+        ----------
+
+        None
+        """
+
+        self.memory = memory
+        self.regions = [] # One dictionary per region, in the order they ended
+        self.origin = time.perf_counter()
+        self.depth = 0
+        self.peaks = [] # Highest traced memory of the open regions, outermost first
+
+    @contextlib.contextmanager
+    def region(self, name, category="region", ionSteps=0, watch=()):
+        """
+        Record a region of the run.
+
+        Parameters
+        ----------
+
+        name: string
+            Name of the region.
+        category: string
+            Category of the region (e.g. "corral").
+        ionSteps: int
+            Ion-steps done in the region.
+        watch: list
+            (object, method name, label) tuples of
+            the methods to be counted and timed.
+
+        Return
+        ----------
+
+        dict
+            Extra values to be stored in the record
+            of the region.
+        """
+
+        # Trace the allocations for the outermost region only
+        started = self.memory and not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        if self.memory:
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            self.peaks.append(before)
+
+        # Methods sharing a label share their counters
+        calls = {}
+        saved = []
+        for obj, method, label in watch:
+            count = calls.setdefault(label, {"count": 0, "time": 0.0})
+            saved.append((obj, method, self.hook(obj, method, count)))
+
+        # Values added by the caller to the record
+        extra = {}
+
+        self.depth += 1
+        start = time.perf_counter()
+        try:
+            yield extra
+        finally:
+            wall = time.perf_counter() - start
+            self.depth -= 1
+
+            # Put the original methods back, innermost first
+            for obj, method, previous in reversed(saved):
+                if previous is None:
+                    delattr(obj, method)
+                else:
+                    setattr(obj, method, previous)
+
+            record = {
+                "name": name,
+                "category": category,
+                "depth": self.depth,
+                "start": start - self.origin,
+                "wall": wall,
+                "ionSteps": ionSteps,
+                "rate": ionSteps / wall if wall > 0 else 0,
+                "calls": {label: dict(count) for label, count in calls.items()}
+            }
+            record.update(extra)
+
+            # The inner regions reset the peak, theirs are carried up
+            if self.memory:
+                after, peak = tracemalloc.get_traced_memory()
+                peak = max(peak, self.peaks.pop())
+                if self.peaks:
+                    self.peaks[-1] = max(self.peaks[-1], peak)
+                record["allocated"] = after - before
+                record["peak"] = peak - before
+            if started:
+                tracemalloc.stop()
+
+            self.regions.append(record)
+
+    def hook(self, obj, method, count):
+        """
+        Wrap a method of an instance (or a function of
+        a module) so that its calls are counted and
+        timed.
+
+        Parameters
+        ----------
+
+        obj: object
+            The instance or module.
+        method: string
+            Name of the method.
+        count: dict
+            The counters, "count" and "time",
+            updated on every call.
+
+        Return
+        ----------
+
+        object or None
+            What the instance held under that name
+            before, to be put back afterwards.
+        """
+
+        previous = vars(obj).get(method)
+        bound = getattr(obj, method)
+
+        def wrapped(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return bound(*args, **kwargs)
+            finally:
+                count["time"] += time.perf_counter() - start
+                count["count"] += 1
+
+        setattr(obj, method, wrapped)
+        return previous
+
+    def summary(self):
+        """
+        Print a table of the recorded regions.
+
+        Parameters
+        ----------
+
+        None
+
+        Return
+        ----------
+
+        list
+            The region dictionaries.
+        """
+
+        print(f"{'Region':<40} {'Wall (s)':>10} {'Ion-steps/s':>12} {'Allocated':>12} {'Peak':>12}")
+        for r in sorted(self.regions, key=lambda r: r["start"]):
+            name = "  " * r["depth"] + r["name"]
+            memory = f"{r['allocated']:>12} {r['peak']:>12}" if "peak" in r else ""
+            print(f"{name:<40} {r['wall']:>10.4f} {r['rate']:>12.4g} {memory}")
+            for label, count in r["calls"].items():
+                if count["count"]:
+                    print(f"{'  ' * (r['depth'] + 1) + label:<40} {count['time']:>10.4f} {count['count']:>12} calls")
+
+        return self.regions
+
+    def trace(self):
+        """
+        The recorded regions as Chrome trace events.
+        The watched methods have a track each, where
+        their total time in a region (not the single
+        calls) starts with the region.
+
+        Parameters
+        ----------
+
+        None
+
+        Return
+        ----------
+
+        dict
+            The trace, in the JSON object format.
+        """
+
+        tracks = {"regions": 0}
+        events = []
+
+        for r in self.regions:
+            ts = 1e6 * r["start"]
+            args = {key: value for key, value in r.items() if key in ["ionSteps", "rate", "allocated", "peak"]}
+            events.append({"name": r["name"], "cat": r["category"], "ph": "X", "ts": ts, "dur": 1e6 * r["wall"], "pid": 0, "tid": 0, "args": args})
+
+            for label, count in r["calls"].items():
+                tid = tracks.setdefault(label, len(tracks))
+                events.append({"name": label, "cat": "call", "ph": "X", "ts": ts, "dur": 1e6 * count["time"], "pid": 0, "tid": tid, "args": {"count": count["count"], "region": r["name"]}})
+
+        # Names of the tracks
+        for label, tid in tracks.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": 0, "tid": tid, "args": {"name": label}})
+
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export(self, file):
+        """
+        Write the Chrome trace of the recorded regions
+        to a JSON file, see 'trace'.
+        """
+
+        with open(file, "w") as f:
+            json.dump(self.trace(), f)
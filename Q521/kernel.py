@@ -0,0 +1,254 @@
+import math
+import numpy as np
+from law import Mathieu, Dawson_Entry, Dawson_Exit, HM_Entry, HM_Exit
+from solver import Euler, RK2, RK4
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+"""
+Compiled Step Kernels
+"""
+
+# The kernels are only compiled when numba can be imported
+AVAILABLE = numba is not None
+
+LAWS = {Mathieu: 0, Dawson_Entry: 1, Dawson_Exit: 2, HM_Entry: 3, HM_Exit: 3}
+SOLVERS = {Euler: 0, RK2: 1, RK4: 2}
+
+def jit(f):
+    # Compile with numba if possible, the function is left as is otherwise
+    if numba is None:
+        return f
+    return numba.njit(cache=True, error_model="numpy")(f)
+
+@jit
+def field(law, z, gap, start, a1, b1):
+    # Field factors of the x and y components of a law
+    if law == 0:
+        return 1.0, 1.0
+    if law == 1:
+        f = z / gap
+        return f, f
+    if law == 2:
+        f = 1 - (z - start) / gap
+        return f, 0.0
+
+    u = z / gap
+    f = 1 - math.exp((0 - u * a1) - (u * u) * b1)
+    return f, f
+
+@jit
+def pulse(law, c4, x0, x1, x2, gap, start, a1, b1):
+    # Transverse acceleration, same arithmetic order as the laws
+    fx, fy = field(law, x2, gap, start, a1, b1)
+    return (fx * x0) * (-c4), (fy * x1) * c4
+
+@jit
+def segment(method, law, pos, vel, c1, drive, first, steps, h, radius, compact, gap, start, a1, b1, status, lossIndex, lossPos):
+    """
+    Run STEPS time steps from time index FIRST for every ion,
+    each ion being integrated in registers over the whole
+    segment. The arithmetic of every step is the one of the
+    'advance' methods of the solvers.
+    """
+
+    N = pos.shape[2]
+
+    for n in range(N):
+        if compact and status[n] == 0:
+            continue
+
+        x0 = pos[0, first, n]
+        x1 = pos[1, first, n]
+        x2 = pos[2, first, n]
+        v0 = vel[0, first, n]
+        v1 = vel[1, first, n]
+        v2 = vel[2, first, n]
+
+        for k in range(steps):
+            i = first + k + 1
+
+            if method == 0:
+                # Euler
+                g0, g1 = pulse(law, c1[n] * drive[0, k], x0, x1, x2, gap, start, a1, b1)
+                v0 = v0 + g0 * h
+                v1 = v1 + g1 * h
+                v2 = v2 + 0.0 * h
+                x0 = x0 + v0 * h
+                x1 = x1 + v1 * h
+                x2 = x2 + v2 * h
+
+            elif method == 1:
+                # RK2
+                g0, g1 = pulse(law, c1[n] * drive[0, k], x0, x1, x2, gap, start, a1, b1)
+                k0 = (g0 * h) / 2 + v0
+                k1 = (g1 * h) / 2 + v1
+                k2 = (0.0 * h) / 2 + v2
+
+                p0, p1 = pulse(law, c1[n] * drive[1, k], (v0 * h) / 2 + x0, (v1 * h) / 2 + x1, (v2 * h) / 2 + x2, gap, start, a1, b1)
+                x0 = x0 + k0 * h
+                x1 = x1 + k1 * h
+                x2 = x2 + k2 * h
+                v0 = v0 + p0 * h
+                v1 = v1 + p1 * h
+                v2 = v2 + 0.0 * h
+
+            else:
+                # RK4
+                g0, g1 = pulse(law, c1[n] * drive[0, k], x0, x1, x2, gap, start, a1, b1)
+                u0 = (g0 * h) / 2 + v0
+                u1 = (g1 * h) / 2 + v1
+                u2 = (0.0 * h) / 2 + v2
+
+                q0, q1 = pulse(law, c1[n] * drive[1, k], (v0 * h) / 2 + x0, (v1 * h) / 2 + x1, (v2 * h) / 2 + x2, gap, start, a1, b1)
+                w0 = (q0 * h) / 2 + v0
+                w1 = (q1 * h) / 2 + v1
+                w2 = (0.0 * h) / 2 + v2
+
+                r0, r1 = pulse(law, c1[n] * drive[1, k], (u0 * h) / 2 + x0, (u1 * h) / 2 + x1, (u2 * h) / 2 + x2, gap, start, a1, b1)
+                d0 = r0 * h + v0
+                d1 = r1 * h + v1
+                d2 = 0.0 * h + v2
+
+                s0, s1 = pulse(law, c1[n] * drive[2, k], w0 * h + x0, w1 * h + x1, w2 * h + x2, gap, start, a1, b1)
+
+                x0 = x0 + (((v0 + d0) + (u0 + w0) * 2) * h) / 6
+                x1 = x1 + (((v1 + d1) + (u1 + w1) * 2) * h) / 6
+                x2 = x2 + (((v2 + d2) + (u2 + w2) * 2) * h) / 6
+                v0 = v0 + (((g0 + s0) + (q0 + r0) * 2) * h) / 6
+                v1 = v1 + (((g1 + s1) + (q1 + r1) * 2) * h) / 6
+                v2 = v2 + (((0.0 + 0.0) + (0.0 + 0.0) * 2) * h) / 6
+
+            pos[0, i, n] = x0
+            pos[1, i, n] = x1
+            pos[2, i, n] = x2
+            vel[0, i, n] = v0
+            vel[1, i, n] = v1
+            vel[2, i, n] = v2
+
+            # Same check as 'Corral.sweep'
+            if compact and (abs(x0) >= radius or abs(x1) >= radius):
+                status[n] = 0
+                lossIndex[n] = i
+                lossPos[0, n] = x0
+                lossPos[1, n] = x1
+                lossPos[2, n] = x2
+                break
+
+@jit
+def clock(phaseTime, drive, offsets, first, steps, h, w, U, V):
+    # Phase/time of every node (as 'History.tick') and drive factors of every sub-stage
+    t = phaseTime[0, first]
+    p = phaseTime[1, first]
+    dZ = w * h
+
+    for k in range(steps):
+        for s in range(len(offsets)):
+            c = offsets[s]
+            if c == 0:
+                drive[s, k] = U + V * math.sin(p)
+            elif c == 1:
+                drive[s, k] = U + V * math.sin(p + dZ)
+            else:
+                drive[s, k] = U + V * math.sin(p + dZ / 2)
+
+        t += h
+        p += w * h
+        phaseTime[0, first + k + 1] = t
+        phaseTime[1, first + k + 1] = p
+
+def supports(corral, ion):
+    """
+    Whether a 'Corral' region can be run by the
+    compiled kernels for this 'History' object.
+
+    Parameters
+    ----------
+
+    corral: Corral
+        The region being run.
+    ion: History
+        The object which is being written to.
+
+    Return
+    ----------
+
+    bool
+        True if numba is available, the law and
+        solver have a kernel and the object keeps
+        full trajectories.
+    """
+
+    return AVAILABLE and type(corral.law) in LAWS and type(corral.solver) in SOLVERS and not ion.endpoint
+
+def drive(corral, ion):
+    """
+    Run the time steps of a 'Corral' region for a
+    'History' object with a single compiled loop,
+    giving the same results as the workspace mode
+    (up to the rounding of the exponential in the
+    Hunter-McIntosh laws). The lost ions are
+    recorded as in the compact mode when it is on.
+
+    Parameters
+    ----------
+
+    corral: Corral
+        The region being run.
+    ion: History
+        The object which is being written to.
+
+    Return
+    ----------
+
+    None
+    """
+
+    qmf = corral.qmf
+    solver = corral.solver
+    first = corral.start
+    steps = corral.steps
+    N = ion.number
+
+    offsets = np.array(type(solver).OFFSETS, dtype=float)
+    phaseTime = np.asarray(ion.phaseTime)
+
+    # Drive factors of every step, from the shared time base if it
+    # holds every sub-stage of the solver
+    timebase = solver.timebase
+    if timebase is not None and all(c in timebase.offsets for c in type(solver).OFFSETS):
+        rows = [timebase.offsets[c] for c in type(solver).OFFSETS]
+        table = np.ascontiguousarray(timebase.drive[rows, first : first + steps])
+        phaseTime[:, first + 1 : first + steps + 1] = timebase.phaseTime[:, first + 1 : first + steps + 1]
+    else:
+        table = np.empty([len(offsets), steps])
+        clock(phaseTime, table, offsets, first, steps, corral.h, qmf.angFrequency, qmf.directPotential, qmf.radioPotential)
+
+    # Charge-to-mass factor of every ion (fused species have vectors)
+    c1 = np.ascontiguousarray(np.broadcast_to(ion.charge / (ion.mass * (qmf.inscRadius ** 2)), [N,]), dtype=float)
+
+    gap = qmf.exitGap if isinstance(corral.law, Dawson_Exit) else qmf.entryGap
+
+    segment(
+        SOLVERS[type(solver)],
+        LAWS[type(corral.law)],
+        np.asarray(ion.pos),
+        np.asarray(ion.vel),
+        c1,
+        table,
+        first,
+        steps,
+        corral.h,
+        qmf.inscRadius,
+        bool(corral.compact),
+        gap,
+        qmf.entryGap + qmf.span,
+        qmf.a1,
+        qmf.b1,
+        ion.status,
+        ion.lossIndex,
+        ion.lossPos
+    )
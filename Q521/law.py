@@ -15,6 +15,60 @@ class Generic_Law:
         y = 0
         return y
 
+    def reserve(self, ion, out):
+        """
+        Return the acceleration buffer, allocating
+        a fresh one when the caller did not provide
+        a workspace.
+
+        Parameters
+        ----------
+
+        ion: History
+            The (sliced) array whose ion count
+            sets the buffer size.
+        out: Numpy ndarray or None
+            Caller-provided buffer of shape (3, N).
+
+        Return
+        ----------
+
+        Numpy ndarray
+            The buffer the acceleration is written to.
+        """
+
+        if out is None:
+            out = np.empty([3, ion.number])
+        return out
+
+    def wave(self, qmf, phase, drive=None):
+        """
+        The drive factor U + V sin(phase) of the
+        potential, unless it was precomputed.
+
+        Parameters
+        ----------
+
+        qmf: QMF
+            The filter whose parameters are
+            being used in the simulation.
+        phase: float
+            The exact phase value being used in
+            the wave form.
+        drive: float
+            {Optional} The precomputed value.
+
+        Return
+        ----------
+
+        float
+            The drive factor.
+        """
+
+        if drive is not None:
+            return drive
+        return qmf.directPotential + qmf.radioPotential * math.sin(phase)
+
 class Mathieu(Generic_Law):
     """
     The Mathieu equations in the context of QMS physics.
@@ -22,7 +76,7 @@ class Mathieu(Generic_Law):
     def __init__(self, specialClass=None):
         super().__init__(specialClass)
     
-    def compute(self, qmf, ion, phase):
+    def compute(self, qmf, ion, phase, out=None, drive=None):
         """
         Determine the acceleration caused by the electic field
 
@@ -40,6 +94,14 @@ class Mathieu(Generic_Law):
         phase: float
             The exact phase value being used in
             the wave form.
+        out: Numpy ndarray
+            {Optional} Pre-allocated (3, N) buffer
+            the acceleration is written into, so
+            that no new arrays are created.
+        drive: float
+            {Optional} The precomputed drive factor
+            U + V sin(phase) (see 'Timebase'), used
+            instead of the phase.
 
         Return
         ----------
@@ -50,19 +112,16 @@ class Mathieu(Generic_Law):
         """
         
         x = ion.pos
-        v = ion.vel
-
-        c0 = np.zeros([3,])
-        c0[0] = -1
-        c0[1] = 1
+        y = self.reserve(ion, out)
 
         c1 = ion.charge / (ion.mass * (qmf.inscRadius ** 2))
-        c2 = qmf.directPotential + qmf.radioPotential * math.sin(phase)
+        c2 = self.wave(qmf, phase, drive)
+        c4 = c1 * c2
 
-
-        x = np.transpose(x)
-        y = c0 * c1 * c2 * x
-        y = np.transpose(y)
+        # Signs of the x and y components -> (-1, 1, 0)
+        np.multiply(x[0], -c4, out=y[0])
+        np.multiply(x[1], c4, out=y[1])
+        y[2] = 0
         
         return y
 
@@ -74,7 +133,7 @@ class Dawson_Entry(Generic_Law):
     def __init__(self, specialClass=None):
         super().__init__(specialClass)
     
-    def compute(self, qmf, ion, phase):
+    def compute(self, qmf, ion, phase, out=None, drive=None):
         """
         Determine the acceleration caused by a
         linear fringing field at the entry
@@ -94,6 +153,14 @@ class Dawson_Entry(Generic_Law):
         phase: float
             The exact phase value being used in
             the wave form.
+        out: Numpy ndarray
+            {Optional} Pre-allocated (3, N) buffer
+            the acceleration is written into, so
+            that no new arrays are created.
+        drive: float
+            {Optional} The precomputed drive factor
+            U + V sin(phase) (see 'Timebase'), used
+            instead of the phase.
 
         Return
         ----------
@@ -104,22 +171,22 @@ class Dawson_Entry(Generic_Law):
         """
         
         x = ion.pos
-        v = ion.vel
+        y = self.reserve(ion, out)
         gap = qmf.entryGap
 
-        c0 = np.zeros([3,])
-        c0[0] = -1
-        c0[1] = 1
-
         c1 = ion.charge / (ion.mass * (qmf.inscRadius ** 2))
-        c2 = qmf.directPotential + qmf.radioPotential * math.sin(phase)
-        c3 = np.zeros([3, ion.number])
-        c3[0:2, :] = (x[2, :]) / gap
-
-        x = np.transpose(x)
-        c3 = np.transpose(c3)
-        y = c0 * c1 * c2 * (c3 * x)
-        y = np.transpose(y)
+        c2 = self.wave(qmf, phase, drive)
+        c4 = c1 * c2
+
+        # The z-row doubles as scratch space for the field factor
+        c3 = y[2]
+        np.divide(x[2], gap, out=c3)
+
+        np.multiply(c3, x[0], out=y[0])
+        np.multiply(c3, x[1], out=y[1])
+        y[0] *= -c4
+        y[1] *= c4
+        y[2] = 0
         
         return y 
 
@@ -132,7 +199,7 @@ class Dawson_Exit(Generic_Law):
     def __init__(self, specialClass=None):
         super().__init__(specialClass)
     
-    def compute(self, qmf, ion, phase):
+    def compute(self, qmf, ion, phase, out=None, drive=None):
         """
         Determine the acceleration caused by a
         linear fringing field at the exit
@@ -152,6 +219,14 @@ class Dawson_Exit(Generic_Law):
         phase: float
             The exact phase value being used in
             the wave form.
+        out: Numpy ndarray
+            {Optional} Pre-allocated (3, N) buffer
+            the acceleration is written into, so
+            that no new arrays are created.
+        drive: float
+            {Optional} The precomputed drive factor
+            U + V sin(phase) (see 'Timebase'), used
+            instead of the phase.
 
         Return
         ----------
@@ -162,24 +237,25 @@ class Dawson_Exit(Generic_Law):
         """
         
         x = ion.pos
-        v = ion.vel
+        y = self.reserve(ion, out)
         gap = qmf.exitGap
         start = qmf.entryGap + qmf.span
 
-        c0 = np.zeros([3,])
-        c0[0] = -1
-        c0[1] = 1
-
         c1 = ion.charge / (ion.mass * (qmf.inscRadius ** 2))
-        c2 = qmf.directPotential + qmf.radioPotential * math.sin(phase)
-        c3 = np.zeros([3, ion.number])
-        c3[0:1, :] = 1 - ((x[2, :] - start) / gap)
-
-
-        x = np.transpose(x)
-        c3 = np.transpose(c3)
-        y = c0 * c1 * c2 * (c3 * x)
-        y = np.transpose(y)
+        c2 = self.wave(qmf, phase, drive)
+        c4 = c1 * c2
+
+        # The z-row doubles as scratch space for the field factor
+        c3 = y[2]
+        np.subtract(x[2], start, out=c3)
+        c3 /= gap
+        np.subtract(1, c3, out=c3)
+
+        # Only the x-row of the field factor is set in this model
+        np.multiply(c3, x[0], out=y[0])
+        y[0] *= -c4
+        y[1] = 0
+        y[2] = 0
         
         return y
 
@@ -192,7 +268,7 @@ class HM_Entry(Generic_Law):
     def __init__(self, specialClass=None):
         super().__init__(specialClass)
     
-    def compute(self, qmf, ion, phase):
+    def compute(self, qmf, ion, phase, out=None, drive=None):
         """
         Determine the acceleration caused by a
         Hunter-McIntosh fringing field 
@@ -212,6 +288,14 @@ class HM_Entry(Generic_Law):
         phase: float
             The exact phase value being used in
             the wave form.
+        out: Numpy ndarray
+            {Optional} Pre-allocated (3, N) buffer
+            the acceleration is written into, so
+            that no new arrays are created.
+        drive: float
+            {Optional} The precomputed drive factor
+            U + V sin(phase) (see 'Timebase'), used
+            instead of the phase.
 
         Return
         ----------
@@ -222,27 +306,34 @@ class HM_Entry(Generic_Law):
         """
         
         x = ion.pos
-        v = ion.vel
+        y = self.reserve(ion, out)
         gap = qmf.entryGap
 
-        c0 = np.zeros([3,])
-        c0[0] = -1
-        c0[1] = 1
-
         c1 = ion.charge / (ion.mass * (qmf.inscRadius ** 2))
-        c2 = qmf.directPotential + qmf.radioPotential * math.sin(phase)
-        c3 = np.zeros([3, ion.number])
-        z = (x[2, :]) / gap
-        c3[0:2, :] = 1 - np.exp( (0- qmf.a1 * z - qmf.b1 * (z ** 2)))
+        c2 = self.wave(qmf, phase, drive)
+        c4 = c1 * c2
+
+        # The output rows double as scratch space for the field factor
+        z = y[2]
+        c3 = y[1]
+        np.divide(x[2], gap, out=z)
+        np.multiply(z, z, out=y[0])
+        y[0] *= qmf.b1
+        np.multiply(z, qmf.a1, out=c3)
+        np.subtract(0, c3, out=c3)
+        c3 -= y[0]
+        np.exp(c3, out=c3)
+        np.subtract(1, c3, out=c3)
 
         # Beta-only
-        #save(c3[1, 0])
+        #save(c3[0])
         # Close
 
-        x = np.transpose(x)
-        c3 = np.transpose(c3)
-        y = c0 * c1 * c2 * (c3 * x)
-        y = np.transpose(y)
+        np.multiply(c3, x[0], out=y[0])
+        c3 *= x[1]
+        y[0] *= -c4
+        y[1] *= c4
+        y[2] = 0
         
         return y
 
@@ -255,7 +346,7 @@ class HM_Exit(Generic_Law):
     def __init__(self, specialClass=None):
         super().__init__(specialClass)
     
-    def compute(self, qmf, ion, phase):
+    def compute(self, qmf, ion, phase, out=None, drive=None):
         """
         Determine the acceleration caused by a
         Hunter-McIntosh fringing field 
@@ -275,6 +366,14 @@ class HM_Exit(Generic_Law):
         phase: float
             The exact phase value being used in
             the wave form.
+        out: Numpy ndarray
+            {Optional} Pre-allocated (3, N) buffer
+            the acceleration is written into, so
+            that no new arrays are created.
+        drive: float
+            {Optional} The precomputed drive factor
+            U + V sin(phase) (see 'Timebase'), used
+            instead of the phase.
 
         Return
         ----------
@@ -285,27 +384,34 @@ class HM_Exit(Generic_Law):
         """
         
         x = ion.pos
-        v = ion.vel
+        y = self.reserve(ion, out)
         gap = qmf.entryGap
 
-        c0 = np.zeros([3,])
-        c0[0] = -1
-        c0[1] = 1
-
         c1 = ion.charge / (ion.mass * (qmf.inscRadius ** 2))
-        c2 = qmf.directPotential + qmf.radioPotential * math.sin(phase)
-        c3 = np.zeros([3, ion.number])
-        z = (x[2, :]) / gap
-        c3[0:2, :] = 1 - np.exp( (0- qmf.a1 * z - qmf.b1 * (z ** 2)))
+        c2 = self.wave(qmf, phase, drive)
+        c4 = c1 * c2
+
+        # The output rows double as scratch space for the field factor
+        z = y[2]
+        c3 = y[1]
+        np.divide(x[2], gap, out=z)
+        np.multiply(z, z, out=y[0])
+        y[0] *= qmf.b1
+        np.multiply(z, qmf.a1, out=c3)
+        np.subtract(0, c3, out=c3)
+        c3 -= y[0]
+        np.exp(c3, out=c3)
+        np.subtract(1, c3, out=c3)
 
         # Beta-only
-        #save(c3[1, 0])
+        #save(c3[0])
         # Close
 
-        x = np.transpose(x)
-        c3 = np.transpose(c3)
-        y = c0 * c1 * c2 * (c3 * x)
-        y = np.transpose(y)
+        np.multiply(c3, x[0], out=y[0])
+        c3 *= x[1]
+        y[0] *= -c4
+        y[1] *= c4
+        y[2] = 0
         
         return y
 
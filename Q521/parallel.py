@@ -0,0 +1,217 @@
+import copy
+import mmap
+import numpy as np
+from multiprocessing.shared_memory import SharedMemory
+from concurrent.futures import ProcessPoolExecutor
+from history import History, Cluster
+
+"""
+Process Pool Functions
+"""
+
+# 'History' arrays which are moved into shared memory
+FIELDS = ["phaseTime", "status", "lossIndex", "lossPos", "peak", "pos", "vel"]
+
+def mapping(a):
+    """
+    Descriptor of an array (or a view of an array)
+    backed by a named file, as in the scratch mode of
+    'allocate', so that another process can map the
+    same file.
+
+    Parameters
+    ----------
+
+    a: Numpy ndarray
+        The array.
+
+    Return
+    ----------
+
+    tuple or None
+        ("file", path, shape, dtype, offset, strides),
+        the offset being in bytes from the start of
+        the file, or None if the array is not backed
+        by a named file.
+    """
+
+    # The memmap holding the file mapping, at the root of the views
+    root = a
+    while isinstance(root, np.ndarray) and not isinstance(root.base, mmap.mmap):
+        root = root.base
+
+    if not isinstance(root, np.memmap) or not isinstance(root.filename, str):
+        return None
+
+    offset = a.__array_interface__["data"][0] - root.__array_interface__["data"][0] + root.offset
+    return ("file", root.filename, a.shape, a.dtype.str, offset, a.strides)
+
+def share(ion):
+    """
+    Move the arrays of a 'History' object into shared
+    memory blocks, the object is re-pointed to them so
+    that the results written by another process are
+    visible without any copy. The file-backed arrays
+    (scratch mode) are left where they are, the
+    workers map their file instead, so they are
+    never loaded into memory.
+
+    Parameters
+    ----------
+
+    ion: History
+        The object whose arrays are moved.
+
+    Return
+    ----------
+
+    tuple
+        The 'SharedMemory' blocks (which must be
+        kept alive for as long as the arrays are
+        used) and their descriptors, a dictionary
+        of name -> ("shm", block name, shape, dtype)
+        or the file descriptor of 'mapping'.
+    """
+
+    blocks = []
+    descr = {}
+
+    for name in FIELDS:
+        a = getattr(ion, name)
+
+        source = mapping(a)
+        if source is not None:
+            descr[name] = source
+            continue
+
+        shm = SharedMemory(create=True, size=max(a.nbytes, 1))
+
+        b = np.ndarray(a.shape, dtype=a.dtype, buffer=shm.buf)
+        b[...] = a
+        setattr(ion, name, b)
+
+        blocks.append(shm)
+        descr[name] = ("shm", shm.name, a.shape, a.dtype.str)
+
+    return blocks, descr
+
+def drive(ion, queue, descr):
+    """
+    Worker side, attach to the shared memory blocks
+    and run the 'Corral' queue on a single species.
+
+    Parameters
+    ----------
+
+    ion: History
+        The species, shipped without its arrays.
+    queue: list
+        The 'Corral' objects to be run in order.
+    descr: dict
+        The descriptors returned by 'share'.
+
+    Return
+    ----------
+
+    Beam or None
+        The beam statistics of the endpoint mode,
+        the coordinates are returned through the
+        shared memory.
+    """
+
+    blocks = []
+    files = []
+    for name, source in descr.items():
+        if source[0] == "file":
+            _, path, shape, dtype, offset, strides = source
+            f = np.memmap(path, dtype=np.uint8, mode="r+")
+            files.append(f)
+            setattr(ion, name, np.ndarray(shape, dtype=dtype, buffer=f, offset=offset, strides=strides))
+            continue
+
+        _, shmName, shape, dtype = source
+        shm = SharedMemory(name=shmName)
+        blocks.append(shm)
+        setattr(ion, name, np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+
+    # The blocks are closed even if a region fails
+    try:
+        for corral in queue:
+            corral.lockOn(ion)
+    finally:
+        # Release the views before closing the blocks
+        for name in descr:
+            setattr(ion, name, None)
+        for shm in blocks:
+            shm.close()
+        for f in files:
+            f.flush()
+
+    return ion.beam
+
+def scatter(ion, queue, workers):
+    """
+    Run every ion species on a pool of processes, each
+    species being integrated exactly as in a serial run
+    (so the results are bitwise identical). A fused
+    'Cluster' is split back into its species.
+
+    Parameters
+    ----------
+
+    ion: History or Cluster
+        The object which is being written to.
+    queue: list
+        The 'Corral' objects to be run in order.
+    workers: int
+        Number of processes.
+
+    Return
+    ----------
+
+    list
+        The 'SharedMemory' blocks now holding the
+        arrays of every species, they must be kept
+        alive for as long as the arrays are used.
+    """
+
+    if isinstance(ion, History):
+        species = [ion]
+    elif isinstance(ion, Cluster):
+        species = [ion[g] for g in range(len(ion))]
+        ion.fused = None
+        ion.bounds = None
+
+    # The corrals are shipped without their (thread-backed) store
+    shipped = []
+    for corral in queue:
+        twin = copy.copy(corral)
+        twin.store = None
+        shipped.append(twin)
+
+    blocks = []
+    jobs = []
+
+    # The names are removed even if a worker fails, so that no
+    # block is left behind in /dev/shm
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for s in species:
+                b, descr = share(s)
+                blocks += b
+
+                # Ship the parameters only, the arrays are shared
+                twin = copy.copy(s)
+                for name in FIELDS:
+                    setattr(twin, name, None)
+
+                jobs.append(pool.submit(drive, twin, shipped, descr))
+
+            for s, job in zip(species, jobs):
+                s.beam = job.result()
+    finally:
+        # Remove the names, the memory lives on with the arrays
+        for shm in blocks:
+            shm.unlink()
+
+    return blocks
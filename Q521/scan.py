@@ -0,0 +1,274 @@
+import copy
+import numpy as np
+from history import History
+from corral import Corral
+from beam import Beam
+
+"""
+Scan Object
+"""
+
+class Scan:
+    """
+    Batched mass-scan engine. Every point of the scan is
+    an extra block of ions along the ion axis, with its
+    own charge-to-mass ratio, so a single integration of
+    the 'Corral' queue covers the whole scan. The same
+    initial conditions are used for every point, which
+    keeps the statistical noise from changing along the
+    spectrum. The ions are recorded in endpoint mode, so
+    the memory used is O(points * ions).
+    """
+
+    def __init__(self, queue, filter, ion):
+        """
+        Initialises the 'Scan' object
+
+        Parameters
+        ----------
+
+        queue: list
+            The 'Corral' objects describing the
+            quadrupole regions, in order.
+
+        filter: QMF
+            The filter which is being used.
+
+        ion: History
+            The ion species used as template
+            (number of ions per point, charge
+            and initial spreads).
+
+        Return
+        ----------
+
+        None
+        """
+
+        self.qmf = filter
+        self.queue = queue
+        self.ion = ion
+        self.nodes = 1 + max([corral.start + corral.steps for corral in queue if corral.steps])
+
+    def sweep(self, mz):
+        """
+        Sweep the mass-to-charge ratio at the fixed
+        potentials of the filter.
+
+        Parameters
+        ----------
+
+        mz: Numpy ndarray
+            The scan axis, in atomic mass units
+            per elementary charge.
+
+        Return
+        ----------
+
+        Spectrum
+            Transmission versus m/z.
+        """
+
+        mz = np.asarray(mz, dtype=float)
+        mass = mz * 1.66e-27 * abs(self.ion.charge / 1.6e-19)
+
+        return self.run(self.qmf, mass, mz, mz)
+
+    def line(self, V, slope):
+        """
+        Sweep the potentials along the scan line
+        U = slope * V. Since the acceleration only
+        depends on (q/m) * V, every point is run at
+        the reference radio potential of the filter
+        with a rescaled charge-to-mass ratio.
+
+        Parameters
+        ----------
+
+        V: Numpy ndarray
+            The radio potentials of the scan.
+        slope: float
+            The U/V ratio of the scan line.
+
+        Return
+        ----------
+
+        Spectrum
+            Transmission versus V, the m/z axis holds
+            the equivalent m/z at the reference
+            potentials.
+        """
+
+        V = np.asarray(V, dtype=float)
+        ref = self.qmf.radioPotential
+
+        # Filter at the reference point of the scan line
+        filter = copy.copy(self.qmf)
+        filter.radioPotential = ref
+        filter.directPotential = slope * ref
+
+        mass = self.ion.mass * ref / V
+        mz = (mass / 1.66e-27) / abs(self.ion.charge / 1.6e-19)
+
+        return self.run(filter, mass, mz, V)
+
+    def run(self, filter, mass, mz, axis):
+        """
+        Integrate every point of the scan in a
+        single batch.
+
+        Parameters
+        ----------
+
+        filter: QMF
+            The filter used for the integration.
+        mass: Numpy ndarray
+            The ion mass of every point.
+        mz: Numpy ndarray
+            The m/z value of every point.
+        axis: Numpy ndarray
+            The scan axis (m/z or V).
+
+        Return
+        ----------
+
+        Spectrum
+            The scan results.
+        """
+
+        K = len(mass)
+        N = self.ion.number
+        s = self.ion
+
+        # Every point is a block of N ions
+        y = History(None, None, param=[
+            s.tag,
+            K * N,
+            np.repeat(mass, N),
+            np.full([K * N,], s.charge),
+            s.spX,
+            s.spY,
+            s.spVX,
+            s.spVY
+        ])
+
+        y.setup(self.nodes, filter, endpoint=True, seed=s.seed)
+
+        # Same initial conditions for every point
+        y.pos[:, 0, :] = np.tile(y.pos[:, 0, 0:N], K)
+        y.vel[:, 0, :] = np.tile(y.vel[:, 0, 0:N], K)
+        y.beam = Beam(np.arange(K + 1) * N, [f"{value:.4g}" for value in axis])
+
+        for corral in self.queue:
+            twin = Corral(type(corral.solver), type(corral.law), corral.h, corral.start, corral.steps, filter, True, True)
+            twin.timebase = corral.timebase
+            twin.backend = corral.backend
+            twin.tile = corral.tile
+            twin.lockOn(y)
+
+        counts = np.count_nonzero(y.status.reshape([K, N]), axis=1)
+
+        return Spectrum(axis, mz, counts, N, y)
+
+class Spectrum:
+    """
+    Results of a 'Scan': ion counts and transmission for
+    every point of the scan axis, with the tools needed
+    for a resolution and peak-shape analysis.
+    """
+
+    def __init__(self, axis, mz, counts, number, ion):
+        """
+        Initialises the 'Spectrum' object
+
+        Parameters
+        ----------
+
+        axis: Numpy ndarray
+            The scan axis (m/z or V).
+        mz: Numpy ndarray
+            The m/z value of every point.
+        counts: Numpy ndarray
+            Transmitted ions per point.
+        number: int
+            Injected ions per point.
+        ion: History
+            The batched endpoint-mode 'History'
+            (final coordinates, losses and beam
+            statistics of every ion).
+
+        Return
+        ----------
+
+        None
+        """
+
+        self.axis = axis
+        self.mz = mz
+        self.counts = counts
+        self.number = number
+        self.ion = ion
+
+        self.transmission = counts / number
+
+    def resolution(self, level=0.5):
+        """
+        Determine the peak position, its width at the
+        given fraction of the maximum (linear
+        interpolation between points) and the
+        resolution m / dm.
+
+        Parameters
+        ----------
+
+        level: float
+            Fraction of the peak height at which the
+            width is measured (0.5 -> FWHM), strictly
+            between 0 and 1.
+
+        Return
+        ----------
+
+        tuple
+            (m, dm, m / dm), in units of the m/z axis,
+            NaN values if the peak is not resolved
+            within the scan. The position is the
+            centroid of the highest peak alone, the
+            other peaks of a multi-species scan are
+            left out.
+        """
+
+        if not 0 < level < 1:
+            raise ValueError("The level must be strictly between 0 and 1")
+
+        y = self.transmission
+        x = self.mz
+        k = int(np.argmax(y))
+        top = y[k]
+
+        if top <= 0:
+            return np.nan, np.nan, np.nan
+
+        h = level * top
+
+        # Walk down both flanks of the peak
+        a = k
+        while a > 0 and y[a] > h:
+            a -= 1
+        b = k
+        while b < len(y) - 1 and y[b] > h:
+            b += 1
+
+        if y[a] > h or y[b] > h:
+            return x[k], np.nan, np.nan
+
+        # The flanks cross the level, so y[a + 1] > h >= y[a] (and on the right)
+        left = x[a] + (h - y[a]) * (x[a + 1] - x[a]) / (y[a + 1] - y[a])
+        right = x[b] + (h - y[b]) * (x[b - 1] - x[b]) / (y[b - 1] - y[b])
+
+        # Centroid of the points of this peak above the level
+        window = slice(a + 1, b)
+        m = np.sum(x[window] * y[window]) / np.sum(y[window])
+        dm = abs(right - left)
+
+        return m, dm, m / dm
@@ -0,0 +1,116 @@
+import numpy as np
+
+"""
+Initial Condition Functions
+
+Same functions as 'Vento/sim/seeding.py', which must
+be kept in step with this module: the two packages
+are run from their own directories and cannot import
+each other.
+"""
+
+def sequence(seed=None):
+    """
+    Root of the random streams of a run. Independent
+    streams (one per ion species or worker) are drawn
+    from it with 'spawn', so that they never overlap
+    and do not depend on how many ions the other
+    streams hold.
+
+    Parameters
+    ----------
+
+    seed: int, SeedSequence or None
+        The seed, None for fresh entropy (its value
+        is kept in the 'entropy' attribute, so the
+        run can be reproduced).
+
+    Return
+    ----------
+
+    SeedSequence
+        The Numpy seed sequence.
+    """
+
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    return np.random.SeedSequence(seed)
+
+def spawn(seed, n):
+    """
+    Independent child sequences of a seed, see
+    'sequence'.
+
+    Parameters
+    ----------
+
+    seed: int, SeedSequence or None
+        The parent seed.
+    n: int
+        Number of children.
+
+    Return
+    ----------
+
+    list
+        The child SeedSequence objects.
+    """
+
+    return sequence(seed).spawn(n)
+
+def stream(seed=None):
+    """
+    Random generator of a seed, see 'sequence'.
+    Existing generators are passed through, so
+    that several draws can share one stream.
+
+    Parameters
+    ----------
+
+    seed: int, SeedSequence, Generator or None
+        The seed.
+
+    Return
+    ----------
+
+    Generator
+        The Numpy random generator.
+    """
+
+    if isinstance(seed, np.random.Generator):
+        return seed
+    return np.random.default_rng(sequence(seed))
+
+def spread(seed, number, widths):
+    """
+    Uniform spread of the initial conditions, each
+    value being drawn in [-width, width] as in
+    'width * (2 * u - 1)', for every ion with a
+    single call of the generator.
+
+    Parameters
+    ----------
+
+    seed: int, SeedSequence, Generator or None
+        The seed of the stream, see 'stream'.
+    number: int
+        Number of ions.
+    widths: list
+        Half-widths of the spread of each
+        coordinate (e.g. spX, spY, spVX, spVY).
+
+    Return
+    ----------
+
+    Numpy ndarray
+        Array of shape (len(widths), number).
+    """
+
+    rng = stream(seed)
+
+    y = rng.random([len(widths), number])
+    y *= 2
+    y -= 1
+    y *= np.asarray(widths, dtype=float).reshape(-1, 1)
+
+    return y
@@ -1,13 +1,21 @@
 import os
 import math
 import time
+import contextlib
 from datetime import datetime
-from copy import deepcopy
 import numpy as np
 from matplotlib import pyplot as plt
 from qmf import QMF
 from history import History, Cluster, History
 from corral import Corral
+from basis import Basis
+from store import Store
+from parallel import scatter
+from scan import Scan
+from stability import Diagram
+from timebase import Timebase
+from telemetry import Telemetry, printer
+import kernel
 from law import Mathieu, Dawson_Entry, Dawson_Exit, HM_Entry
 from solver import Euler, RK4
 
@@ -43,6 +51,22 @@ class Simulator:
         # Standard Objects
         self.h = None
         self.div = 100 # Default -> 1/ 100th of a RF Period as the duration of the phase-time step
+        self.workspace = True # Advance the ions in place inside pre-allocated buffers
+        self.fuse = True # Integrate every ion species of a 'Cluster' together (needs workspace)
+        self.superpose = False # Build the trajectories from fundamental solutions (linear laws only)
+        self.compact = True # Drop lost ions from the working arrays during the run (needs workspace)
+        self.stream = False # Write the trajectories to a binary store while the simulation runs
+        self.shared = None # Shared memory blocks holding the results of 'run' with workers
+        self.scratch = None # Directory for memory-mapped coordinate arrays (runs larger than memory)
+        self.endpoint = False # Keep only the current coordinates and online beam statistics
+        self.tabulate = True # Share a precomputed RF time base (phase and drive factor) between the regions
+        self.timebase = None
+        self.backend = "numpy" # Time stepping backend, "numba" runs every region in one compiled loop (if installed)
+        self.telemetry = Telemetry(subscribers=[printer]) # Throttled progress events, None to run silently (see 'telemetry')
+        self.profile = None # Optional 'Profile' recording the time, calls and memory of each region (see 'instrument')
+        self.seed = None # Seed of the initial conditions, None for fresh entropy (see 'seeding.sequence')
+        self.tile = None # Ions per cache block run through a whole region at a time, "auto" to fit the L2 cache
+        self.store = None
 
         self.qmfString = ""
         self.ionString = ""
@@ -121,7 +145,11 @@ class Simulator:
 
         # Ion Setup -> Note that the number of elements is the sum of 
         # the num of steps + 1 for the initial
-        self.ion.setup(1 + self.lap1 + self.lap2 + self.lap3, self.qmf)
+        self.ion.setup(1 + self.lap1 + self.lap2 + self.lap3, self.qmf, self.scratch, self.endpoint, self.seed)
+
+        # Merge the ion species into a single batch
+        if isinstance(self.ion, Cluster) and self.fuse and (self.workspace or self.endpoint):
+            self.ion.fuse()
 
         if isinstance(self.ion, History):
             pass
@@ -136,14 +164,33 @@ class Simulator:
 
             print( isinstance(self.ion, Cluster) )
 
+        # The endpoint mode relies on the workspace and on-the-fly loss checks
+        workspace = self.workspace or self.endpoint
+        compact = self.compact or self.endpoint
+
         # Queue Creation
         self.queue = [
-            Corral(Euler, HM_Entry, self.h, 0, self.lap1, self.qmf),
-            Corral(Euler, Mathieu, self.h, self.lap1, self.lap2, self.qmf),
-            Corral(Euler, Dawson_Exit, self.h, self.lap2, self.lap3, self.qmf),
+            Corral(Euler, HM_Entry, self.h, 0, self.lap1, self.qmf, workspace, compact),
+            Corral(Euler, Mathieu, self.h, self.lap1, self.lap2, self.qmf, workspace, compact),
+            Corral(Euler, Dawson_Exit, self.h, self.lap1 + self.lap2, self.lap3, self.qmf, workspace, compact),
             ]
 
-    def run(self):
+        # One time base for every species, law and region
+        if self.tabulate:
+            offsets = sorted(set([c for corral in self.queue for c in corral.solver.OFFSETS]))
+            self.timebase = Timebase(self.qmf, self.h, 1 + self.lap1 + self.lap2 + self.lap3, offsets)
+            for corral in self.queue:
+                corral.timebase = self.timebase
+
+        # The Numpy path is kept if the compiled kernels are not available
+        if self.backend == "numba" and not kernel.AVAILABLE:
+            print("numba could not be imported, the Numpy backend is used instead")
+        for corral in self.queue:
+            corral.backend = self.backend
+            corral.tile = self.tile
+            corral.telemetry = self.telemetry
+
+    def run(self, workers=1):
         """
         Performs the simulation across all the elements
         in the 'Corral' queue.
@@ -151,7 +198,13 @@ class Simulator:
         Parameters
         ----------
 
-        None
+        workers: int
+            {Optional} Number of processes, if more
+            than one, each ion species is run on its
+            own process and the results come back
+            through shared memory (the species are
+            no longer fused, so this only pays off
+            for large species on idle cores).
 
         Return
         ----------
@@ -159,25 +212,97 @@ class Simulator:
         None
         """
 
-        # Loop through each operation
-        for corral in self.queue:
-            corral.lockOn(self.ion)
-        
         # Keep track of current time
         pureDate = datetime.now()
         s = pureDate.strftime("%Y-%m-%d %H_%M_%S")
         self.date = s[0:10]
         self.hour = s[11:19]
 
+        # Stream the coordinates to disk as the corrals write them
+        # (there is nothing to stream in endpoint mode)
+        if self.stream and not self.endpoint:
+            os.makedirs("results/" + self.date, exist_ok=True)
+            self.store = Store("results/" + self.date + "/set " + self.date + " " + self.hour, self.ion, self.qmf)
+            for corral in self.queue:
+                corral.store = self.store
+
+        with self.region("run", "run", sum([corral.steps for corral in self.queue])):
+
+            # Only the fundamental solutions are integrated, the ions
+            # are then built from them
+            if self.superpose:
+                basis = Basis(self.queue, self.qmf)
+                basis.lockOn(self.ion)
+                basis.trace(self.ion)
+
+            # Run each species on its own process
+            elif workers > 1:
+                self.shared = scatter(self.ion, self.queue, workers)
+
+            # Loop through each operation
+            else:
+                for corral in self.queue:
+                    with self.region(type(corral.law).__name__, "corral", corral.steps, corral.probes(self.ion)):
+                        corral.lockOn(self.ion)
+
+        # These modes write the whole arrays at once
+        if self.store is not None and (self.superpose or workers > 1):
+            for species in self.store.species:
+                _, T, _ = species.pos.shape
+                self.store.mark(species, T - 1, force=True)
+
+        # Wait for the remaining chunks to be written
+        if self.store is not None:
+            self.store.close()
+
         print("Simulation is Complete!")
     
+    def region(self, name, category, steps, watch=()):
+        """
+        Profiled region of the run if a 'Profile' is
+        attached, a no-op otherwise.
+
+        Parameters
+        ----------
+
+        name: string
+            Name of the region.
+        category: string
+            Category of the region.
+        steps: int
+            Number of time steps of the region.
+        watch: list
+            The methods to be timed, see
+            'Corral.probes'.
+
+        Return
+        ----------
+
+        context manager
+        """
+
+        if self.profile is None:
+            return contextlib.nullcontext()
+
+        if isinstance(self.ion, History):
+            N = self.ion.number
+        else:
+            N = sum([self.ion[g].number for g in range(len(self.ion))])
+
+        return self.profile.region(name, category, N * steps, watch)
+    
     def clean(self):
         """
         Searches the 'ion' attribute (a 'History' object)
-        for any lost ions and eliminates them from a duplicate
-        of the attribute called 'skimIon'. The 'skimIon' 
-        attribute is later used for creating plots without any
-        divergent curves.
+        for any lost ions and leaves them out of the 
+        'skimIon' attribute, which holds only the 
+        transmitted ions. The 'skimIon' attribute is 
+        later used for creating plots without any
+        divergent curves. The first loss index of each
+        ion is kept in the 'lossIndex' attribute. In
+        endpoint mode, the losses recorded during the
+        run are used and the beam statistics of every
+        region are printed as well.
 
         Parameters
         ----------
@@ -190,109 +315,130 @@ class Simulator:
         None
         """
 
+        r = self.qmf.inscRadius
+
         if isinstance(self.ion, History):
             
-            # Loop through each ion for each time step ---> {Not very efficient, but should be fine}
-            # If ion is lost, mark its index as false
-            # in the 'status' array
-            _, T, N = self.ion.pos.shape
-            for t in range(T):
-                for n in range(N):
-                    C = self.ion.status[n]
-                    if not C:
-                        pass
-                    else:
-                        # Assign this iteration's state arrays
-                        x, y = self.ion.pos[0:2, t, n]
-                        r = self.qmf.inscRadius
-                        
-                        # Determine the difference between u and r_o
-                        d1 = abs(x) - r
-                        d2 = abs(y) - r
-                        
-                        # Tick as false or pass if lost
-                        if (d1 >=0) or (d2 >= 0):
-                            self.ion.status[n] = 0
-                        else:
-                            pass
+            # Find the first loss index of every ion in one pass
+            N = self.ion.number
+            self.ion.scout(r)
+            keep = self.ion.status != 0
             
             # Create a list with all the indices of the lost ions
-            lst = np.where(self.ion.status == 0)[0]
-            lst = np.flip(lst) # flip it, so that we can remove the laters indices first
+            lst = np.flip(np.where(~keep)[0])
             
             # Determine the transmission rate
             p = 100 * (N - lst.shape[0]) / N
             print([lst, lst.shape, f"Transmission Rate: {p}%"])
 
-            # Create the 'skimIon' attribute from a replicate of 'ion'
-            self.skimIon = self.ion.replicate()
+            # Create the 'skimIon' attribute from the transmitted ions only
+            self.skimIon = self.ion.skim(keep)
 
-            # Delete the "card" array because its lost
-            for i in lst:
-                self.skimIon.pos = np.delete(self.skimIon.pos, i, 2)
-                self.skimIon.vel = np.delete(self.skimIon.vel, i, 2)
+            if self.endpoint:
+                self.ion.beam.display()
         
         elif isinstance(self.ion, Cluster):
             
-            self.skimIon  = deepcopy(self.ion)
-            G = len(self.skimIon)
+            self.skimIon = Cluster(self.ion.name)
+            G = len(self.ion)
 
-            for g in range(G):
-                
-                _, T, N = self.skimIon._values[g].pos.shape
-                
-                for t in range(T):
-                    
-                    for n in range(N):
-                        
-                        C = self.skimIon._values[g].status[n]
-                        
-                        if not C:
-                            pass
-                        
-                        else:
-                            # Assign this iteration's state arrays
-                            x, y = self.skimIon._values[g].pos[0:2, t, n]
-                            r = self.qmf.inscRadius
-                            
-                            # Determine the difference between u and r_o
-                            d1 = abs(x) - r
-                            d2 = abs(y) - r
-                            
-                            # Tick as false or pass if lost
-                            if (d1 >= 0) or (d2 >= 0):
-                                self.skimIon._values[g].status[n] = 0
-                            else:
-                                pass
-            
             # loop through all history objects in the container
-            # remove the lost ions
+            # and leave out the lost ions
             for g in range(G):
                 
-                A = self.skimIon._values[g].status == 0
-                B = np.where(A)
-                tag = self.skimIon._values[g].tag
-                nP = self.skimIon._values[g].number
+                self.ion[g].scout(r)
+                keep = self.ion[g].status != 0
+                tag = self.ion[g].tag
+                nP = self.ion[g].number
 
-                lst = B[0] # possible bug point
-                lst = np.flip(lst) # flip it
+                lst = np.flip(np.where(~keep)[0])
                 
                 # Determine the transmission rate
                 p = 100 * (nP - lst.shape[0]) / nP
-                a = self.skimIon._values[g].a
-                q = self.skimIon._values[g].q
                 print([lst, lst.shape, f"Transmission Rate for this Ion Species {tag}: {p}%"])
 
-
-                # Delete the "card" array because its lost
-                for i in lst:
-                    self.skimIon._values[g].pos = np.delete(self.skimIon._values[g].pos, i, 2)
-                    self.skimIon._values[g].vel = np.delete(self.skimIon._values[g].vel, i, 2)
-                _, _, c = self.skimIon._values[g].pos.shape
+                self.skimIon.append(self.ion[g].skim(keep))
+                c = self.skimIon[g].number
                 print(f"Number of ions still left: {c} for species {g}")
+
+            if self.endpoint:
+                for beam in self.ion.beams():
+                    beam.display()
     
-    def mass_scan(self):
-        if isinstance(self.ion, History):
+    def stability(self, resolution=(481, 401)):
+        """
+        Locates the ion species on the Mathieu stability
+        diagram (see the 'Diagram' object, whose grid is
+        cached on disk) and plots them with the scan line
+        of the filter. IT IS ASSUMED THAT THE 'setup'
+        METHOD HAS ALREADY BEEN CALLED.
+
+        Parameters
+        ----------
+
+        resolution: tuple
+            Number of grid points along a and q.
+
+        Return
+        ----------
+
+        list
+            A (tag, a, q, stable, betaX, betaY)
+            tuple per species.
+        """
+
+        diagram = Diagram(resolution)
+        y = diagram.species(self.ion, self.qmf)
+
+        diagram.display(self.ion, self.qmf)
+        plt.show()
+
+        return y
+
+    def mass_scan(self, mz=None):
+        """
+        Creates the mass spectrum. Without a scan axis,
+        the number of transmitted ions of each species
+        in the last run is plotted. Given an m/z axis, a
+        batched scan (see the 'Scan' object) is run for
+        every species over the whole axis and the
+        transmission versus m/z is plotted; the results
+        are kept in the 'spectra' attribute.
+
+        Parameters
+        ----------
+
+        mz: Numpy ndarray
+            {Optional} The scan axis, in atomic mass
+            units per elementary charge.
+
+        Return
+        ----------
+
+        None
+        """
+
+        if mz is not None:
+            if isinstance(self.ion, History):
+                species = [self.ion]
+            elif isinstance(self.ion, Cluster):
+                species = [self.ion[g] for g in range(len(self.ion))]
+
+            self.spectra = []
+            for s in species:
+                spectrum = Scan(self.queue, self.qmf, s).sweep(mz)
+                self.spectra.append(spectrum)
+
+                m, dm, R = spectrum.resolution()
+                print(f"Scan of {s.tag}: peak at {m} Th, FWHM {dm} Th, resolution {R}")
+                plt.plot(spectrum.mz, spectrum.transmission, label=s.tag)
+
+            plt.xlabel("m/z")
+            plt.ylabel("Transmission")
+            plt.legend()
+            plt.show()
+
+        elif isinstance(self.ion, History):
             pass
         elif isinstance(self.ion, Cluster):
             I = 1
@@ -306,11 +452,10 @@ class Simulator:
                 v[g] = (self.skimIon._values[g].mass * 1.66e+27) / abs(self.skimIon._values[g].charge * 1.6e+19)
             
             # This nested loop iterates over mass scans and adds the number
-            # of transmitted ions to the total count
+            # of transmitted ions to the total count (from the loss records)
             for i in range(I):
                 for g in range(G):
-                    _, _, n = self.skimIon._values[g].pos.shape
-                    u[g] += n
+                    u[g] += np.count_nonzero(self.ion[g].status)
 
             plt.bar(v, u, width=0.025)
             plt.show()
@@ -332,6 +477,11 @@ class Simulator:
 
         None
         """
+        # No trajectories are stored in endpoint mode
+        if self.endpoint:
+            print("Endpoint mode: there are no trajectories to display")
+            return
+
         try:
             if isinstance(self.ion, History):
                 self.hstTime = self.skimIon.phaseTime[0, :]
@@ -389,8 +539,9 @@ class Simulator:
                 os.makedirs("results", exist_ok=True)
                 os.makedirs("results/" + self.date, exist_ok=True)
 
-                # Store the figures 
-                self.ion.save("results/" + self.date, self.date, self.hour)
+                # Store the coordinates (unless streamed already) and figures 
+                if self.store is None:
+                    self.ion.save("results/" + self.date, self.date, self.hour, self.qmf)
 
                 self.fig1.savefig("results/"+ self.date + "/SpaceCurve " + self.date + " " + self.hour + ".svg", transparent=True)
                 self.fig2.savefig("results/"+ self.date + "/PhaseCurve " + self.date + " " + self.hour + ".svg", transparent=True)
@@ -475,8 +626,9 @@ class Simulator:
                 os.makedirs("results", exist_ok=True)
                 os.makedirs("results/" + self.date, exist_ok=True)
 
-                # Store the figures 
-                self.ion.save("results/" + self.date, self.date, self.hour)
+                # Store the coordinates (unless streamed already) and figures 
+                if self.store is None:
+                    self.ion.save("results/" + self.date, self.date, self.hour, self.qmf)
 
                 self.fig1.savefig("results/"+ self.date + "/SpaceCurve " + self.date + " " + self.hour + ".svg", transparent=True)
                 self.fig2.savefig("results/"+ self.date + "/PhaseCurve " + self.date + " " + self.hour + ".svg", transparent=True)
@@ -487,24 +639,25 @@ class Simulator:
         except:
             pass
 
-sim = Simulator()
-sim.qmfString = "filter1.csv"
-sim.qmfTag = "McIntosh Filter"
-sim.ionString = "ionspec2.csv"
-sim.ionTag = "Sodium"
+if __name__ == "__main__":
+    sim = Simulator()
+    sim.qmfString = "filter1.csv"
+    sim.qmfTag = "McIntosh Filter"
+    sim.ionString = "ionspec2.csv"
+    sim.ionTag = "Sodium"
 
 
-startTime = time.time()
+    startTime = time.time()
 
-sim.load()
-sim.setup()
-sim.run()
+    sim.load()
+    sim.setup()
+    sim.run()
 
-endTime = time.time()
+    endTime = time.time()
 
-print(f"The simulation took: {endTime - startTime} seconds")
+    print(f"The simulation took: {endTime - startTime} seconds")
 
-sim.clean()
-sim.temp_display()
-sim.mass_scan()
-print("End of the Line")
+    sim.clean()
+    sim.temp_display()
+    sim.mass_scan()
+    print("End of the Line")
@@ -1,5 +1,6 @@
 import numpy as np
 import math
+import tableau
 
 class Generic_Solver:
     """
@@ -7,9 +8,39 @@ class Generic_Solver:
     methods I will use, that is: RK4, Euler and RK2
     """
 
+    OFFSETS = [] # Sub-stage times, in time steps (see 'Timebase')
+
     def __init__(self, specialClass=None):
         self.special = specialClass
 
+        # Optional shared time base, and the time index of the step
+        self.timebase = None
+        self.index = 0
+
+    def factor(self, c):
+        """
+        The precomputed drive factor of the law at
+        the sub-stage C of the current step, or None
+        without a time base (the law then uses the
+        phase).
+
+        Parameters
+        ----------
+
+        c: float
+            Sub-stage offset, in time steps.
+
+        Return
+        ----------
+
+        float or None
+            The drive factor.
+        """
+
+        if self.timebase is None:
+            return None
+        return self.timebase.factor(self.index, c)
+
     def predict(self):
         """
         Placeholder for the solver methods.
@@ -42,12 +73,69 @@ class Generic_Solver:
         x = 1
         v = 2
         return x, v
+
+    def reserve(self, ion):
+        """
+        Placeholder for the workspace set-up.
+        Pre-allocates every stage buffer the
+        'advance' method needs, so that a time
+        step does not create any new arrays.
+
+        Parameters
+        ----------
+
+        ion: History
+            The trimmed workspace object which is
+            going to be advanced; only its number
+            of ions and species parameters are used.
+
+        Return
+        ----------
+
+        None
+        """
+
+        self.probe = ion.hollow()
+        self.probe.vel = ion.vel
+
+    def advance(self, law, h, qmf, ion):
+        """
+        Placeholder for the in-place solver methods.
+        Same inputs as 'predict', but the 'ion'
+        workspace is overwritten with the next time
+        iteration's coordinates instead of returning
+        new arrays. 'reserve' must be called first.
+
+        Parameters
+        ----------
+
+        law: Generic_Law (& sub-classes)
+            Law being solved
+        h: float
+            The time step.
+        qmf: QMF
+            The filter whose parameters are
+            being used in the simulation.
+        ion: History
+            The trimmed workspace object holding
+            the current coordinates. It is
+            altered in place.
+
+        Return
+        ----------
+
+        None
+        """
+
+        pass
     
 class RK4(Generic_Solver):
     """
     This is the Runge-Kutta 4 Method
     """
 
+    OFFSETS = [0, 1/2, 1]
+
     def __init__(self, specialClass=None):
         super().__init__(specialClass)
     
@@ -88,22 +176,22 @@ class RK4(Generic_Solver):
         # First Stage
 
         K1 = ion.vel
-        G1 = law.compute(qmf, ion, ion.phaseTime[1])
+        G1 = law.compute(qmf, ion, ion.phaseTime[1], drive=self.factor(0))
 
         # Second Stage
 
         K2 = ion.vel + G1 * h / 2
-        G2 = law.compute(qmf, ion + (K1 * h / 2, "X"), ion.phaseTime[1] + dZ / 2)
+        G2 = law.compute(qmf, ion + (K1 * h / 2, "X"), ion.phaseTime[1] + dZ / 2, drive=self.factor(1/2))
 
         # Third Stage
 
         K3 = ion.vel + G2 * h / 2
-        G3 = law.compute(qmf, ion + (K2 * h / 2, "X"), ion.phaseTime[1] + dZ / 2)
+        G3 = law.compute(qmf, ion + (K2 * h / 2, "X"), ion.phaseTime[1] + dZ / 2, drive=self.factor(1/2))
 
         # Fourth Stage
 
         K4 = ion.vel + G3 * h
-        G4 = law.compute(qmf, ion + (K3 * h, "X"), ion.phaseTime[1] + dZ)
+        G4 = law.compute(qmf, ion + (K3 * h, "X"), ion.phaseTime[1] + dZ, drive=self.factor(1))
 
 
         """
@@ -114,9 +202,125 @@ class RK4(Generic_Solver):
         v = ion.vel + h * (G1 + G4 + (G2 + G3) * 2) / 6  
 
         return x, v
+
+    def reserve(self, ion):
+        """
+        Pre-allocate the stage buffers of the
+        Runge-Kutta 4 method.
+
+        Parameters
+        ----------
+
+        ion: History
+            The trimmed workspace object which is
+            going to be advanced.
+
+        Return
+        ----------
+
+        None
+        """
+
+        super().reserve(ion)
+
+        N = ion.number
+        self.K = np.empty([3, 3, N]) # K2, K3, K4
+        self.G = np.empty([4, 3, N]) # G1, G2, G3, G4
+        self.S = np.empty([2, 3, N]) # Weighted sums
+
+    def advance(self, law, h, qmf, ion):
+        """
+        In-place version of 'predict', the arithmetic
+        is performed in the exact same order so both
+        methods give identical results.
+
+        Parameters
+        ----------
+
+        law: Generic_Law (& sub-classes)
+            Law being solved
+        h: float
+            The time step.
+        qmf: QMF
+            The filter whose parameters are
+            being used in the simulation.
+        ion: History
+            The trimmed workspace object holding
+            the current coordinates. It is
+            altered in place.
+
+        Return
+        ----------
+
+        None
+        """
+
+        dZ = qmf.angFrequency * h
+        phase = ion.phaseTime[1]
+
+        K1 = ion.vel
+        K2, K3, K4 = self.K
+        G1, G2, G3, G4 = self.G
+        S1, S2 = self.S
+        X = self.probe.pos
+
+        # First Stage
+
+        law.compute(qmf, ion, phase, out=G1, drive=self.factor(0))
+
+        # Second Stage
+
+        np.multiply(G1, h, out=K2)
+        K2 /= 2
+        K2 += ion.vel
+
+        np.multiply(K1, h, out=X)
+        X /= 2
+        X += ion.pos
+        law.compute(qmf, self.probe, phase + dZ / 2, out=G2, drive=self.factor(1/2))
+
+        # Third Stage
+
+        np.multiply(G2, h, out=K3)
+        K3 /= 2
+        K3 += ion.vel
+
+        np.multiply(K2, h, out=X)
+        X /= 2
+        X += ion.pos
+        law.compute(qmf, self.probe, phase + dZ / 2, out=G3, drive=self.factor(1/2))
+
+        # Fourth Stage
+
+        np.multiply(G3, h, out=K4)
+        K4 += ion.vel
+
+        np.multiply(K3, h, out=X)
+        X += ion.pos
+        law.compute(qmf, self.probe, phase + dZ, out=G4, drive=self.factor(1))
+
+        # Weighted sums (position first, it still needs K1 = old velocity)
+
+        np.add(K1, K4, out=S1)
+        np.add(K2, K3, out=S2)
+        S2 *= 2
+        S1 += S2
+        S1 *= h
+        S1 /= 6
+        ion.pos += S1
+
+        np.add(G1, G4, out=S1)
+        np.add(G2, G3, out=S2)
+        S2 *= 2
+        S1 += S2
+        S1 *= h
+        S1 /= 6
+        ion.vel += S1
     
 class RK2(Generic_Solver):
 
+    OFFSETS = [0, 1/2]
+
     def __init__(self, specialClass=None):
         super().__init__(specialClass)
     
@@ -157,17 +361,96 @@ class RK2(Generic_Solver):
         # First Stage
 
         K1 = ion.vel
-        G1 = law.compute(qmf, ion, ion.phaseTime[1])
+        G1 = law.compute(qmf, ion, ion.phaseTime[1], drive=self.factor(0))
 
         # Second Stage
 
         K2 = ion.vel + G1 * h / 2
-        G2 = law.compute(qmf, ion + (K1 * h / 2, "X"), ion.phaseTime[1] + dZ / 2)
+        G2 = law.compute(qmf, ion + (K1 * h / 2, "X"), ion.phaseTime[1] + dZ / 2, drive=self.factor(1/2))
         
         x = ion.pos + h * K2
         v = ion.vel + h * G2
 
         return x, v
+
+    def reserve(self, ion):
+        """
+        Pre-allocate the stage buffers of the
+        Runge-Kutta 2 method.
+
+        Parameters
+        ----------
+
+        ion: History
+            The trimmed workspace object which is
+            going to be advanced.
+
+        Return
+        ----------
+
+        None
+        """
+
+        super().reserve(ion)
+
+        N = ion.number
+        self.K = np.empty([3, N]) # K2
+        self.G = np.empty([2, 3, N]) # G1, G2
+
+    def advance(self, law, h, qmf, ion):
+        """
+        In-place version of 'predict', the arithmetic
+        is performed in the exact same order so both
+        methods give identical results.
+
+        Parameters
+        ----------
+
+        law: Generic_Law (& sub-classes)
+            Law being solved
+        h: float
+            The time step.
+        qmf: QMF
+            The filter whose parameters are
+            being used in the simulation.
+        ion: History
+            The trimmed workspace object holding
+            the current coordinates. It is
+            altered in place.
+
+        Return
+        ----------
+
+        None
+        """
+
+        dZ = qmf.angFrequency * h
+        phase = ion.phaseTime[1]
+
+        K1 = ion.vel
+        K2 = self.K
+        G1, G2 = self.G
+        X = self.probe.pos
+
+        # First Stage
+
+        law.compute(qmf, ion, phase, out=G1, drive=self.factor(0))
+
+        # Second Stage
+
+        np.multiply(G1, h, out=K2)
+        K2 /= 2
+        K2 += ion.vel
+
+        np.multiply(K1, h, out=X)
+        X /= 2
+        X += ion.pos
+        law.compute(qmf, self.probe, phase + dZ / 2, out=G2, drive=self.factor(1/2))
+
+        K2 *= h
+        ion.pos += K2
+        G2 *= h
+        ion.vel += G2
     
 class Euler(Generic_Solver):
     """
@@ -176,6 +459,8 @@ class Euler(Generic_Solver):
     of the Q521 program
     """
 
+    OFFSETS = [0]
+
     def __init__(self, specialClass=None):
         super().__init__(specialClass)
     
@@ -207,7 +492,554 @@ class Euler(Generic_Solver):
         None
         """
         
-        v = ion.vel + h * law.compute(qmf, ion, ion.phaseTime[1])
+        v = ion.vel + h * law.compute(qmf, ion, ion.phaseTime[1], drive=self.factor(0))
         x = ion.pos + h * v
 
-        return x, v
\ No newline at end of file
+        return x, v
+
+    def reserve(self, ion):
+        """
+        Pre-allocate the acceleration buffer
+        of the Euler method.
+
+        Parameters
+        ----------
+
+        ion: History
+            The trimmed workspace object which is
+            going to be advanced.
+
+        Return
+        ----------
+
+        None
+        """
+
+        super().reserve(ion)
+
+        self.G = np.empty([3, ion.number])
+
+    def advance(self, law, h, qmf, ion):
+        """
+        In-place version of 'predict', the arithmetic
+        is performed in the exact same order so both
+        methods give identical results.
+
+        Parameters
+        ----------
+
+        law: Generic_Law (& sub-classes)
+            Law being solved
+        h: float
+            The time step.
+        qmf: QMF
+            The filter whose parameters are
+            being used in the simulation.
+        ion: History
+            The trimmed workspace object holding
+            the current coordinates. It is
+            altered in place.
+
+        Return
+        ----------
+
+        None
+        """
+
+        G = self.G
+
+        law.compute(qmf, ion, ion.phaseTime[1], out=G, drive=self.factor(0))
+        G *= h
+        ion.vel += G
+
+        np.multiply(ion.vel, h, out=G)
+        ion.pos += G
+
+class Generic_Symplectic(Generic_Solver):
+    """
+    Template class for the symplectic splitting methods. Since
+    every law only depends on the positions (and the time), the
+    equations of motion split into a drift (positions advanced
+    with the velocities) and a kick (velocities advanced with
+    the acceleration), each of them being exact. A method is a
+    sequence of drifts and kicks with the weights DRIFT and
+    KICK (len(DRIFT) = len(KICK) + 1), the time following the
+    drifts. The phase-space volume is preserved, so the stable
+    ions keep bounded orbits instead of the slow drift of the
+    Euler method, which allows much coarser time steps.
+    """
+
+    DRIFT = [1]
+    KICK = []
+
+    def reserve(self, ion):
+        """
+        Pre-allocate the acceleration buffer
+        of the splitting method.
+
+        Parameters
+        ----------
+
+        ion: History
+            The trimmed workspace object which is
+            going to be advanced.
+
+        Return
+        ----------
+
+        None
+        """
+
+        super().reserve(ion)
+
+        self.G = np.empty([3, ion.number])
+
+    def advance(self, law, h, qmf, ion):
+        """
+        In-place drift-kick sequence of the method.
+
+        Parameters
+        ----------
+
+        law: Generic_Law (& sub-classes)
+            Law being solved
+        h: float
+            The time step.
+        qmf: QMF
+            The filter whose parameters are
+            being used in the simulation.
+        ion: History
+            The trimmed workspace object holding
+            the current coordinates. It is
+            altered in place.
+
+        Return
+        ----------
+
+        None
+        """
+
+        dZ = qmf.angFrequency * h
+        phase = ion.phaseTime[1]
+        G = self.G
+        c = 0
+
+        for d, k in zip(self.DRIFT, self.KICK + [None]):
+
+            # Drift
+            np.multiply(ion.vel, d * h, out=G)
+            ion.pos += G
+            c += d
+
+            # Kick (at the time reached by the drifts)
+            if k is not None:
+                law.compute(qmf, ion, phase + c * dZ, out=G, drive=self.factor(c))
+                G *= k * h
+                ion.vel += G
+
+    def predict(self, law, h, qmf, ion):
+        """
+        Slice-and-copy version of 'advance' for the
+        legacy path of the 'Corral' objects, both
+        give identical results.
+
+        Parameters
+        ----------
+
+        See 'Generic_Solver.predict'.
+
+        Return
+        ----------
+
+        tuple
+            The positions and velocities at the
+            next time iteration.
+        """
+
+        if getattr(self, "G", None) is None or self.G.shape[1] != ion.number:
+            self.reserve(ion)
+
+        work = ion.hollow()
+        work.phaseTime = np.array(ion.phaseTime)
+        work.pos[...] = ion.pos
+        work.vel[...] = ion.vel
+        self.advance(law, h, qmf, work)
+
+        return work.pos, work.vel
+
+class Verlet(Generic_Symplectic):
+    """
+    This is the Stormer-Verlet (leapfrog) Method, 2nd order
+    with a single law evaluation per step
+    """
+
+    DRIFT = [1/2, 1/2]
+    KICK = [1]
+    OFFSETS = [1/2]
+
+    def __init__(self, specialClass=None):
+        super().__init__(specialClass)
+
+class Yoshida(Generic_Symplectic):
+    """
+    This is the 4th order Forest-Ruth/Yoshida Method, the
+    symmetric composition of three leapfrog steps of sizes
+    w1 * h, w0 * h and w1 * h (3 law evaluations per step)
+    """
+
+    W1 = 1 / (2 - 2 ** (1 / 3))
+    W0 = 1 - 2 * W1
+
+    DRIFT = [W1 / 2, (W0 + W1) / 2, (W0 + W1) / 2, W1 / 2]
+    KICK = [W1, W0, W1]
+    OFFSETS = [W1 / 2, W1 / 2 + (W0 + W1) / 2, W1 / 2 + (W0 + W1) / 2 + (W0 + W1) / 2]
+
+    def __init__(self, specialClass=None):
+        super().__init__(specialClass)
+
+class Generic_Adaptive(Generic_Solver):
+    """
+    Template class for the embedded Runge-Kutta methods with an
+    adaptive step size. The solver keeps its own state and takes
+    steps of its own size, the whole batch of ions sharing the
+    step (the worst ion controls the error). Every call to
+    'advance' integrates up to the next node of the uniform
+    time grid of the 'Corral' (overshooting it when the steps
+    are longer) and the coordinates at the node are given by the
+    dense output of the method, so the 'History' arrays are
+    still filled on the uniform grid.
+    """
+
+    ORDER = None # Order of the error estimator (step size control)
+
+    def __init__(self, specialClass=None, tolerance=1e-8, hMax=None):
+        """
+        Initialises the adaptive solver
+
+        Parameters
+        ----------
+
+        specialClass: object
+            See 'Generic_Solver'.
+        tolerance: float
+            Relative tolerance of the local error,
+            the positions are scaled by the inscribed
+            radius and the velocities by the
+            reference velocity of the filter.
+        hMax: float
+            {Optional} Maximum step size.
+
+        Return
+        ----------
+
+        None
+        """
+
+        super().__init__(specialClass)
+
+        self.tolerance = tolerance
+        self.hMax = hMax
+        self.safety = 0.9
+
+        self.size = None # Step size of the next attempt
+        self.state = None # Current (pos, vel) of the solver, (2, 3, N)
+
+        # Records of the variable time grid
+        self.grid = [] # End time of every accepted step
+        self.rejected = 0
+        self.evaluations = 0
+
+    def reserve(self, ion):
+        """
+        Pre-allocate the stage buffers. The solver
+        restarts from the coordinates of the next
+        'advance' call (e.g. after the 'Corral' has
+        dropped the lost ions), keeping its step size.
+
+        Parameters
+        ----------
+
+        ion: History
+            The trimmed workspace object which is
+            going to be advanced.
+
+        Return
+        ----------
+
+        None
+        """
+
+        super().reserve(ion)
+
+        self.K = np.empty([self.STAGES, 2, 3, ion.number])
+        self.state = None
+
+    def rate(self, law, qmf, Y, t, out):
+        """
+        Right-hand side of the equations of motion
+        for the state Y = (pos, vel) at time T,
+        written into OUT.
+        """
+
+        self.probe.pos = Y[0]
+        out[0] = Y[1]
+        law.compute(qmf, self.probe, self.phase + qmf.angFrequency * (t - self.t0), out=out[1])
+        self.evaluations += 1
+
+    def start(self, law, qmf, ion):
+        """
+        (Re)start the integration from the
+        coordinates held by ION.
+        """
+
+        self.t0 = ion.phaseTime[0]
+        self.phase = ion.phaseTime[1]
+        self.t = self.t0
+        self.state = np.stack([ion.pos, ion.vel])
+        self.slope = np.empty(self.state.shape)
+        self.rate(law, qmf, self.state, self.t, self.slope)
+        self.old = None
+
+        # Reference scales of the error norm
+        self.ref = np.array([qmf.inscRadius, qmf.refVelocity])[:, np.newaxis, np.newaxis]
+
+    def norm(self, K, h, Y, Z):
+        """
+        Placeholder for the error norm of a step from
+        Y to Z with the stages K, the batch norm being
+        the largest norm of the single ions.
+        """
+
+        return 0
+
+    def advance(self, law, h, qmf, ion):
+        """
+        Integrate with adaptive steps up to the next
+        node of the uniform grid and write the dense
+        output at the node into ION.
+
+        Parameters
+        ----------
+
+        law: Generic_Law (& sub-classes)
+            Law being solved
+        h: float
+            The spacing of the uniform time grid.
+        qmf: QMF
+            The filter whose parameters are
+            being used in the simulation.
+        ion: History
+            The trimmed workspace object holding
+            the current coordinates. It is
+            altered in place.
+
+        Return
+        ----------
+
+        None
+        """
+
+        # Restart whenever the coordinates were changed from outside,
+        # a shared time base writes j * h at the nodes so the clocks
+        # are only compared up to rounding
+        if self.state is None or abs(ion.phaseTime[0] - self.target) > 1e-9 * h:
+            self.start(law, qmf, ion)
+        if self.size is None:
+            self.size = h
+
+        self.target = ion.phaseTime[0] + h
+
+        while self.t < self.target:
+            self.step(law, qmf)
+
+        Y = self.dense(law, qmf, self.target)
+        ion.pos[...] = Y[0]
+        ion.vel[...] = Y[1]
+
+    def step(self, law, qmf):
+        """
+        Attempt a single step from the current state,
+        the step size is updated either way.
+        """
+
+        h = self.size if self.hMax is None else min(self.size, self.hMax)
+        K = self.K
+        Y = self.state
+
+        K[0] = self.slope
+        for s in range(1, self.STAGES - 1):
+            Z = Y + h * np.tensordot(self.A[s, :s], K[:s], axes=1)
+            self.rate(law, qmf, Z, self.t + self.C[s] * h, K[s])
+
+        Z = Y + h * np.tensordot(self.B, K[:self.STAGES - 1], axes=1)
+        self.rate(law, qmf, Z, self.t + h, K[-1])
+
+        error = self.norm(K, h, Y, Z)
+
+        if error <= 1:
+            self.old = (self.t, h, Y, np.array(K))
+            self.t += h
+            self.state = Z
+            self.slope = np.array(K[-1])
+            self.grid.append(self.t)
+
+            factor = 10 if error == 0 else min(10, self.safety * error ** (-1 / (self.ORDER + 1)))
+        else:
+            self.rejected += 1
+            factor = max(0.2, self.safety * error ** (-1 / (self.ORDER + 1)))
+
+        self.size = h * factor
+
+    def dense(self, law, qmf, t):
+        """
+        Placeholder for the dense output of the last
+        accepted step at time T (inside the step).
+        """
+
+        return self.state
+
+    def predict(self, law, h, qmf, ion):
+        """
+        Slice-and-copy version of 'advance' for the
+        legacy path of the 'Corral' objects.
+
+        Parameters
+        ----------
+
+        See 'Generic_Solver.predict'.
+
+        Return
+        ----------
+
+        tuple
+            The positions and velocities at the
+            next node of the uniform grid.
+        """
+
+        if getattr(self, "probe", None) is None or self.probe.number != ion.number:
+            self.reserve(ion)
+
+        work = ion.hollow()
+        work.phaseTime = np.array(ion.phaseTime)
+        work.pos[...] = ion.pos
+        work.vel[...] = ion.vel
+        self.advance(law, h, qmf, work)
+
+        return work.pos, work.vel
+
+class RK45(Generic_Adaptive):
+    """
+    This is the Dormand-Prince 5(4) Method, with the
+    4th order dense output of Shampine
+    """
+
+    STAGES = 7
+    ORDER = 4
+    A = tableau.DP5_A
+    B = tableau.DP5_B
+    C = tableau.DP5_C
+    E = tableau.DP5_E
+    P = tableau.DP5_P
+
+    def __init__(self, specialClass=None, tolerance=1e-8, hMax=None):
+        super().__init__(specialClass, tolerance, hMax)
+
+    def norm(self, K, h, Y, Z):
+        """
+        Batch error norm, RMS over the components
+        of every ion and maximum over the ions.
+        """
+
+        scale = self.tolerance * (self.ref + np.maximum(np.abs(Y), np.abs(Z)))
+        e = h * np.tensordot(self.E, K, axes=1) / scale
+
+        return np.sqrt(np.mean(e ** 2, axis=(0, 1))).max(initial=0)
+
+    def dense(self, law, qmf, t):
+        """
+        Continuous extension of the last accepted
+        step, evaluated at time T.
+        """
+
+        t0, h, Y, K = self.old
+        x = (t - t0) / h
+
+        Q = np.tensordot(self.P.T, K, axes=1) # (4, 2, 3, N)
+        w = x ** np.arange(1, 5)
+
+        return Y + h * np.tensordot(w, Q, axes=1)
+
+class RK8(Generic_Adaptive):
+    """
+    This is the DOP853 Method of Hairer, Norsett & Wanner,
+    8th order with a 5th and 3rd order error estimator and
+    a 7th order dense output
+    """
+
+    STAGES = tableau.DOP853_STAGES + 1
+    ORDER = 7
+    A = tableau.DOP853_A
+    B = tableau.DOP853_B
+    C = tableau.DOP853_C
+    E3 = tableau.DOP853_E3
+    E5 = tableau.DOP853_E5
+    D = tableau.DOP853_D
+
+    def __init__(self, specialClass=None, tolerance=1e-8, hMax=None):
+        super().__init__(specialClass, tolerance, hMax)
+
+    def norm(self, K, h, Y, Z):
+        """
+        Batch error norm, the combination of the
+        5th and 3rd order estimates of DOP853 per
+        ion and maximum over the ions.
+        """
+
+        scale = self.tolerance * (self.ref + np.maximum(np.abs(Y), np.abs(Z)))
+        e5 = np.sum((np.tensordot(self.E5, K, axes=1) / scale) ** 2, axis=(0, 1))
+        e3 = np.sum((np.tensordot(self.E3, K, axes=1) / scale) ** 2, axis=(0, 1))
+
+        denom = e5 + 0.01 * e3
+        denom[denom == 0] = 1
+        e = h * e5 / np.sqrt(denom * 6)
+
+        return e.max(initial=0)
+
+    def dense(self, law, qmf, t):
+        """
+        7th order interpolant of the last accepted
+        step, evaluated at time T. The 3 extra stages
+        are computed once per step.
+        """
+
+        t0, h, Y, K = self.old[:4]
+
+        if len(self.old) == 4:
+            S = tableau.DOP853_EXTENDED
+            X = np.empty((S,) + K.shape[1:])
+            X[:self.STAGES] = K
+            for s in range(self.STAGES, S):
+                Z = Y + h * np.tensordot(self.A[s, :s], X[:s], axes=1)
+                self.rate(law, qmf, Z, t0 + self.C[s] * h, X[s])
+
+            dY = self.state - Y
+            F = np.empty((tableau.DOP853_POWER,) + Y.shape)
+            F[0] = dY
+            F[1] = h * X[0] - dY
+            F[2] = 2 * dY - h * (X[self.STAGES - 1] + X[0])
+            F[3:] = h * np.tensordot(self.D, X, axes=1)
+
+            self.old = (t0, h, Y, K, F)
+
+        F = self.old[4]
+        x = (t - t0) / h
+
+        y = np.zeros(Y.shape)
+        for i, f in enumerate(reversed(F)):
+            y += f
+            if i % 2 == 0:
+                y *= x
+            else:
+                y *= 1 - x
+
+        return Y + y
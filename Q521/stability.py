@@ -0,0 +1,413 @@
+import os
+import numpy as np
+from matplotlib import pyplot as plt
+from history import History, Cluster
+
+"""
+Diagram Object
+"""
+
+class Diagram:
+    """
+    Mathieu stability diagram built from Floquet theory.
+    In the dimensionless time xi = w * t / 2, both transverse
+    axes of the quadrupole follow the Mathieu equation
+
+        u'' + (a_u - 2 * q_u * cos(2 * xi)) * u = 0
+
+    with (a_x, q_x) = (a, q) and (a_y, q_y) = (-a, -q). The
+    monodromy matrix (the fundamental solutions after one
+    period pi) has a unit determinant, so its trace alone
+    decides the stability, |trace| < 2, and gives the
+    characteristic exponent through cos(pi * beta) = trace / 2.
+    The traces are integrated on a whole (a, q) grid at once
+    and cached on disk, keyed by the resolution, so that the
+    species can be classified without integrating any ion.
+    """
+
+    def __init__(self, resolution=(481, 401), aMax=1.2, qMax=1.0, steps=256, cache="results/stability"):
+        """
+        Initialises the 'Diagram' object
+
+        Parameters
+        ----------
+
+        resolution: tuple
+            Number of grid points along a and q.
+        aMax: float
+            The grid covers -aMax <= a <= aMax, it
+            must contain the a_0 and b_1 curves
+            over the whole q range (b_1 = 1 at
+            q = 0, a_0 = -0.455 at q = 1).
+        qMax: float
+            The grid covers 0 <= q <= qMax.
+        steps: int
+            RK4 steps per period of the equation.
+        cache: string
+            Directory of the cached grids, next
+            to the simulation results by default,
+            None to disable the cache.
+
+        Return
+        ----------
+
+        None
+        """
+
+        self.resolution = tuple(resolution)
+        self.aMax = aMax
+        self.qMax = qMax
+        self.steps = steps
+        self.cache = cache
+
+        self.a = None
+        self.q = None
+        self.trace = None
+        self.beta = None
+        self.edges = None
+
+    def path(self):
+        """
+        File name of the cached grid.
+        """
+
+        na, nq = self.resolution
+        return os.path.join(self.cache, f"mathieu_{na}x{nq}_a{self.aMax:g}_q{self.qMax:g}_n{self.steps}.npz")
+
+    def build(self):
+        """
+        Load the traces of the grid from the cache,
+        or integrate and cache them, then derive the
+        characteristic exponents and the edges of
+        the first stability region.
+
+        Parameters
+        ----------
+
+        None
+
+        Return
+        ----------
+
+        None
+        """
+
+        na, nq = self.resolution
+        self.a = np.linspace(-self.aMax, self.aMax, na)
+        self.q = np.linspace(0, self.qMax, nq)
+
+        file = None if self.cache is None else self.path()
+
+        if file is not None and os.path.exists(file):
+            self.trace = np.load(file)["trace"]
+        else:
+            A, Q = np.meshgrid(self.a, self.q, indexing="ij")
+            self.trace = monodromy(A, Q, self.steps)
+
+            if file is not None:
+                os.makedirs(self.cache, exist_ok=True)
+                np.savez(file, trace=self.trace, a=self.a, q=self.q)
+
+        self.beta = unwrap(self.trace)
+        self.edges = boundary(self.a, self.trace)
+
+    def classify(self, a, q):
+        """
+        Locate (a, q) points with respect to the first
+        stability region of the quadrupole, where the
+        x and y regions overlap. The edges are read
+        from the grid, the exponents are integrated
+        directly for the requested points.
+
+        Parameters
+        ----------
+
+        a: float or Numpy ndarray
+            The a parameters (x axis).
+        q: float or Numpy ndarray
+            The q parameters (x axis).
+
+        Return
+        ----------
+
+        tuple
+            (stable, betaX, betaY), where stable is
+            True inside the region and the exponents
+            are NaN outside of it.
+        """
+
+        if self.trace is None:
+            self.build()
+
+        a = np.asarray(a, dtype=float)
+        q = np.abs(np.asarray(q, dtype=float))
+
+        # First region of one axis: a_0(q) < a < b_1(q)
+        lower = np.interp(q, self.q, self.edges[0], right=np.nan)
+        upper = np.interp(q, self.q, self.edges[1], right=np.nan)
+        inX = (a > lower) & (a < upper)
+        inY = (-a > lower) & (-a < upper)
+
+        betaX = np.arccos(np.clip(monodromy(a, q, self.steps) / 2, -1, 1)) / np.pi
+        betaY = np.arccos(np.clip(monodromy(-a, q, self.steps) / 2, -1, 1)) / np.pi
+
+        stable = inX & inY
+        betaX = np.where(stable, betaX, np.nan)
+        betaY = np.where(stable, betaY, np.nan)
+
+        return stable, betaX, betaY
+
+    def apex(self):
+        """
+        The upper apex of the first stability region,
+        where a_0 of the y axis meets b_1 of the x axis.
+
+        Parameters
+        ----------
+
+        None
+
+        Return
+        ----------
+
+        tuple
+            The (a, q) values of the apex.
+        """
+
+        if self.trace is None:
+            self.build()
+
+        gap = self.edges[1] + self.edges[0] # b_1(q) - (-a_0(q))
+        k = np.flatnonzero(np.diff(np.sign(gap)) < 0)[0]
+
+        q = self.q[k] - gap[k] * (self.q[k + 1] - self.q[k]) / (gap[k + 1] - gap[k])
+        a = np.interp(q, self.q, self.edges[1])
+
+        return a, q
+
+    def point(self, ion, filter=None):
+        """
+        The a and q parameters of an ion species, from
+        its charge and mass in the given filter, or the
+        ones stored by 'Cluster.setup' if there is no
+        filter.
+
+        Parameters
+        ----------
+
+        ion: History
+            The ion species.
+        filter: QMF
+            {Optional} The filter.
+
+        Return
+        ----------
+
+        tuple
+            (a, q)
+        """
+
+        if filter is None:
+            if not hasattr(ion, "a"):
+                raise ValueError(f"No a and q for {ion.tag}, a filter is needed (they are only set by 'Cluster.setup')")
+            return ion.a, ion.q
+
+        # Same definitions as 'Cluster.setup'
+        den = ion.mass * (filter.angFrequency * filter.inscRadius) ** 2
+        a = (4 * ion.charge * filter.directPotential) / den
+        q = 2 * ion.charge * filter.radioPotential / den
+
+        return a, q
+
+    def species(self, ion, filter=None):
+        """
+        Classify every ion species of a 'History' or
+        'Cluster' object from its a and q parameters
+        (see 'point') and print the results.
+
+        Parameters
+        ----------
+
+        ion: History or Cluster
+            The ion species.
+        filter: QMF
+            {Optional} The filter giving a and q,
+            required for a 'History' which did not
+            go through 'Cluster.setup'.
+
+        Return
+        ----------
+
+        list
+            A (tag, a, q, stable, betaX, betaY)
+            tuple per species.
+        """
+
+        if isinstance(ion, History):
+            species = [ion]
+        elif isinstance(ion, Cluster):
+            species = [ion[g] for g in range(len(ion))]
+
+        y = []
+        for s in species:
+            a, q = self.point(s, filter)
+            stable, bx, by = self.classify(a, q)
+            y.append((s.tag, a, q, bool(stable), float(bx), float(by)))
+            print(f"{s.tag}: a = {a:.5f}, q = {q:.5f} -> {'stable' if stable else 'unstable'} (beta_x = {bx:.4f}, beta_y = {by:.4f})")
+
+        return y
+
+    def display(self, ion=None, filter=None):
+        """
+        Plot the first stability region, optionally with
+        the ion species and the scan line of a filter
+        (a / q = 2 * U / V).
+
+        Parameters
+        ----------
+
+        ion: History or Cluster
+            {Optional} Species to be marked.
+        filter: QMF
+            {Optional} Filter whose scan line is
+            drawn.
+
+        Return
+        ----------
+
+        Figure
+            The matplotlib figure.
+        """
+
+        if self.trace is None:
+            self.build()
+
+        a0, b1 = self.edges
+        stable = np.minimum(b1, -a0) > np.maximum(a0, -b1)
+
+        fig = plt.figure()
+        plt.fill_between(self.q, np.maximum(a0, -b1), np.minimum(b1, -a0), where=stable, alpha=0.3, label="Stable (x and y)")
+        plt.plot(self.q, a0, "b-", lw=0.8, label="x: a_0, b_1")
+        plt.plot(self.q, b1, "b-", lw=0.8)
+        plt.plot(self.q, -a0, "r-", lw=0.8, label="y: a_0, b_1")
+        plt.plot(self.q, -b1, "r-", lw=0.8)
+
+        if filter is not None:
+            slope = 2 * filter.directPotential / filter.radioPotential
+            plt.plot(self.q, slope * self.q, "k--", lw=0.8, label=f"Scan line (U/V = {filter.directPotential / filter.radioPotential:.4f})")
+
+        if ion is not None:
+            species = [ion] if isinstance(ion, History) else [ion[g] for g in range(len(ion))]
+            for s in species:
+                a, q = self.point(s, filter)
+                plt.plot(q, a, "o", label=s.tag)
+
+        plt.xlim(0, self.qMax)
+        plt.ylim(0, 1.25 * self.apex()[0])
+        plt.xlabel("q")
+        plt.ylabel("a")
+        plt.title("Mathieu Stability Diagram")
+        plt.legend()
+
+        return fig
+
+"""
+Floquet Functions
+"""
+
+def monodromy(a, q, steps=256):
+    """
+    Trace of the monodromy matrix of the Mathieu
+    equation over one period, for every (a, q) pair
+    at once (classical RK4 on the 2x2 fundamental
+    matrix, whose columns start as C = (1, 0) and
+    S = (0, 1)).
+
+    Parameters
+    ----------
+
+    a: Numpy ndarray
+        The a parameters.
+    q: Numpy ndarray
+        The q parameters, same shape as a.
+    steps: int
+        Number of RK4 steps over the period pi.
+
+    Return
+    ----------
+
+    Numpy ndarray
+        The trace C(pi) + S'(pi), same shape as a.
+    """
+
+    a, q = np.broadcast_arrays(np.asarray(a, dtype=float), np.asarray(q, dtype=float))
+    h = np.pi / steps
+
+    # Rows (u, u') of the two fundamental solutions
+    u = np.stack([np.ones(a.shape), np.zeros(a.shape)])
+    v = np.stack([np.zeros(a.shape), np.ones(a.shape)])
+
+    def force(xi, u):
+        return -(a - 2 * q * np.cos(2 * xi)) * u
+
+    for n in range(steps):
+        xi = n * h
+        k1u, k1v = v, force(xi, u)
+        k2u, k2v = v + 0.5 * h * k1v, force(xi + 0.5 * h, u + 0.5 * h * k1u)
+        k3u, k3v = v + 0.5 * h * k2v, force(xi + 0.5 * h, u + 0.5 * h * k2u)
+        k4u, k4v = v + h * k3v, force(xi + h, u + h * k3u)
+
+        u = u + (h / 6) * (k1u + 2 * k2u + 2 * k3u + k4u)
+        v = v + (h / 6) * (k1v + 2 * k2v + 2 * k3v + k4v)
+
+    return u[0] + v[1]
+
+def unwrap(trace):
+    """
+    Characteristic exponents of an (a, q) grid whose
+    first axis is a (increasing). Along a, the stable
+    bands n = 1, 2, ... have n - 1 < beta < n, so the
+    bands are counted from the bottom of the grid to
+    pick the branch of the arc cosine. NaN marks the
+    unstable points.
+    """
+
+    stable = np.abs(trace) < 2
+    enter = stable & ~np.vstack([np.zeros_like(stable[:1]), stable[:-1]])
+    band = np.cumsum(enter, axis=0)
+
+    phase = np.arccos(np.clip(trace / 2, -1, 1)) / np.pi
+    beta = np.where(band % 2 == 1, band - 1 + phase, band - phase)
+
+    return np.where(stable, beta, np.nan)
+
+def boundary(a, trace):
+    """
+    Edges a_0(q) and b_1(q) of the first stable band
+    of one axis, for every column of the grid, from
+    a linear interpolation of the trace where it
+    crosses 2 and -2. NaN if the band is missing,
+    infinite if it runs past the top of the grid.
+    """
+
+    nq = trace.shape[1]
+    lower = np.full([nq,], np.nan)
+    upper = np.full([nq,], np.nan)
+
+    for k in range(nq):
+        t = trace[:, k]
+        stable = np.abs(t) < 2
+        if not np.any(stable) or stable[0]:
+            continue
+
+        # First stable band of the column
+        i = np.argmax(stable)
+        j = i + np.argmax(~stable[i:]) if not np.all(stable[i:]) else len(t)
+
+        lower[k] = a[i - 1] + (2 - t[i - 1]) * (a[i] - a[i - 1]) / (t[i] - t[i - 1])
+        if j < len(t):
+            upper[k] = a[j - 1] + (-2 - t[j - 1]) * (a[j] - a[j - 1]) / (t[j] - t[j - 1])
+        else:
+            upper[k] = np.inf
+
+    return lower, upper
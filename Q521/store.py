@@ -0,0 +1,344 @@
+import os
+import json
+import queue
+import threading
+import numpy as np
+from history import Cluster
+
+"""
+Store Object
+"""
+
+class Store:
+    """
+    Streams the coordinates of a 'History' or 'Cluster'
+    object into a binary store while the simulation runs.
+    The store is a directory with a small JSON header
+    (filter and ion parameters) and one '.npy' file per
+    species for the positions and velocities, laid out as
+    (time, 3, ions) so that chunks of time points are
+    written sequentially. The copies happen in a
+    background thread, fed by the 'Corral' objects.
+    """
+
+    HEADER = "header.json"
+
+    def __init__(self, dir, ion, filter=None, chunk=1024):
+        """
+        Creates the store files and starts the
+        writer thread.
+
+        Parameters
+        ----------
+
+        dir: string
+            The directory of the store, created
+            if missing.
+        ion: History or Cluster
+            The object being stored, its arrays
+            must already be set up.
+        filter: QMF
+            {Optional} The filter whose parameters
+            are written to the header.
+        chunk: int
+            Number of time points per write.
+
+        Return
+        ----------
+
+        None
+        """
+
+        self.dir = dir
+        self.chunk = chunk
+
+        if isinstance(ion, Cluster):
+            self.species = [ion[g] for g in range(len(ion))]
+            self.fused = ion.fused
+        else:
+            self.species = [ion]
+            self.fused = None
+
+        _, T, _ = self.species[0].pos.shape
+        self.nodes = T
+
+        os.makedirs(dir, exist_ok=True)
+
+        # Header with the metadata of the run
+        self.header = {
+            "nodes": T,
+            "layout": "(time, xyz, ion)",
+            "complete": False,
+            "filter": describe(filter, [
+                "tag", "radioPotential", "directPotential", "pureFrequency",
+                "iniPhase", "inscRadius", "span", "entryGap", "exitGap", "injSpeed"
+            ]),
+            "species": [describe(s, [
+                "tag", "number", "mass", "charge",
+                "spX", "spY", "spVX", "spVY", "a", "q"
+            ]) for s in self.species]
+        }
+        self.write_header()
+
+        # Memory-mapped '.npy' files
+        self.phaseTime = np.lib.format.open_memmap(
+            os.path.join(dir, "phaseTime.npy"), mode="w+", dtype=float, shape=(T, 2))
+        self.pos = []
+        self.vel = []
+        for g, s in enumerate(self.species):
+            N = s.pos.shape[2]
+            self.pos.append(np.lib.format.open_memmap(
+                os.path.join(dir, f"species{g}.pos.npy"), mode="w+", dtype=float, shape=(T, 3, N)))
+            self.vel.append(np.lib.format.open_memmap(
+                os.path.join(dir, f"species{g}.vel.npy"), mode="w+", dtype=float, shape=(T, 3, N)))
+
+        # Rows [0, flushed) already handed to the writer, per History
+        self.flushed = {}
+
+        self.error = None
+        self.jobs = queue.Queue()
+        self.thread = threading.Thread(target=self.drain, daemon=True)
+        self.thread.start()
+
+    def write_header(self):
+        """
+        (Re)write the JSON header of the store.
+
+        Parameters
+        ----------
+
+        None
+
+        Return
+        ----------
+
+        None
+        """
+
+        with open(os.path.join(self.dir, self.HEADER), "w") as file:
+            json.dump(self.header, file, indent=4)
+
+    def owners(self, ion):
+        """
+        Determine which species are held by the
+        'History' object being integrated.
+
+        Parameters
+        ----------
+
+        ion: History
+            Either a species or the fused
+            'History' of a 'Cluster'.
+
+        Return
+        ----------
+
+        list
+            The species indices.
+        """
+
+        if ion is self.fused:
+            return list(range(len(self.species)))
+
+        return [g for g, s in enumerate(self.species) if s is ion]
+
+    def mark(self, ion, j, force=False):
+        """
+        Notify the store that the time index J of
+        ION has been written; a chunk is handed to
+        the writer thread once enough rows are ready.
+
+        Parameters
+        ----------
+
+        ion: History
+            The object being integrated.
+        j: int
+            The last time index written.
+        force: bool
+            Hand over the pending rows regardless
+            of the chunk size.
+
+        Return
+        ----------
+
+        None
+        """
+
+        key = id(ion)
+        a = self.flushed.get(key, 0)
+        b = j + 1
+
+        if b - a >= self.chunk or (force and b > a):
+            for g in self.owners(ion):
+                self.jobs.put((g, a, b))
+            self.flushed[key] = b
+
+    def drain(self):
+        """
+        Writer thread loop, copies the chunks of
+        time points into the memory-mapped files.
+
+        Parameters
+        ----------
+
+        None
+
+        Return
+        ----------
+
+        None
+        """
+
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+
+            g, a, b = job
+            try:
+                s = self.species[g]
+                self.phaseTime[a:b] = s.phaseTime[:, a:b].T
+                self.pos[g][a:b] = np.moveaxis(s.pos[:, a:b, :], 1, 0)
+                self.vel[g][a:b] = np.moveaxis(s.vel[:, a:b, :], 1, 0)
+            except Exception as e:
+                self.error = e
+
+    def close(self):
+        """
+        Wait for the writer thread, flush the files
+        and mark the store as complete.
+
+        Parameters
+        ----------
+
+        None
+
+        Return
+        ----------
+
+        None
+        """
+
+        self.jobs.put(None)
+        self.thread.join()
+
+        if self.error is not None:
+            raise self.error
+
+        self.phaseTime.flush()
+        for g in range(len(self.species)):
+            self.pos[g].flush()
+            self.vel[g].flush()
+
+        self.header["complete"] = True
+        self.write_header()
+
+class Archive:
+    """
+    Reads a binary store written by 'Store' without
+    loading it into memory; only the requested slices
+    are read from disk.
+    """
+
+    def __init__(self, dir):
+        """
+        Open the store in read-only mode.
+
+        Parameters
+        ----------
+
+        dir: string
+            The directory of the store.
+
+        Return
+        ----------
+
+        None
+        """
+
+        self.dir = dir
+
+        with open(os.path.join(dir, Store.HEADER)) as file:
+            self.header = json.load(file)
+
+        self.species = self.header["species"]
+        self.tags = [s["tag"] for s in self.species]
+
+    def index(self, g):
+        """
+        Species index from its position or tag.
+        """
+
+        if isinstance(g, str):
+            return self.tags.index(g)
+        return g
+
+    def phaseTime(self, times=slice(None)):
+        """
+        Read the time and phase values.
+
+        Parameters
+        ----------
+
+        times: slice or Numpy ndarray
+            Time indices to be read.
+
+        Return
+        ----------
+
+        Numpy ndarray
+            Array of shape (2, T).
+        """
+
+        y = np.load(os.path.join(self.dir, "phaseTime.npy"), mmap_mode="r")
+        return np.array(y[times].T)
+
+    def read(self, g, field="pos", ions=slice(None), times=slice(None)):
+        """
+        Read a slice of the coordinates of one species.
+
+        Parameters
+        ----------
+
+        g: int or string
+            Species index or tag.
+        field: string
+            Either "pos" or "vel".
+        ions: slice or Numpy ndarray
+            Ion indices to be read.
+        times: slice or Numpy ndarray
+            Time indices to be read.
+
+        Return
+        ----------
+
+        Numpy ndarray
+            Array of shape (3, T, N), the same
+            layout as the 'History' arrays.
+        """
+
+        g = self.index(g)
+        y = np.load(os.path.join(self.dir, f"species{g}.{field}.npy"), mmap_mode="r")
+        y = y[times]
+        y = y[:, :, ions]
+        return np.moveaxis(np.array(y), 0, 1)
+
+"""
+Header Functions
+"""
+
+def describe(obj, keys):
+    # Collect the JSON-friendly attributes of an object
+    y = {}
+    if obj is None:
+        return y
+    for key in keys:
+        if hasattr(obj, key):
+            value = getattr(obj, key)
+            if isinstance(value, np.ndarray):
+                value = value.tolist()
+            elif isinstance(value, np.generic):
+                value = value.item()
+            y[key] = value
+    return y
@@ -0,0 +1,144 @@
+import time
+
+"""
+Telemetry Object
+"""
+
+class Telemetry:
+    """
+    Rate-limited progress events of a simulation. The
+    'Corral' objects report every time step, but the
+    subscribers (callables taking one event dictionary)
+    are only called once per interval and at the end of
+    each stage, so that nothing is printed or logged from
+    the hot loops. An event holds the stage name, the
+    step index and total, the fraction done, the elapsed
+    time and ETA of the stage, the ion-steps per second
+    and the current number of surviving ions.
+    """
+
+    def __init__(self, interval=1.0, subscribers=()):
+        """
+        Initialises the 'Telemetry' object
+
+        Parameters
+        ----------
+
+        interval: float
+            Minimum time between two events, in
+            seconds (the last step of a stage is
+            always reported).
+        subscribers: list
+            {Optional} The callables receiving
+            the events, see 'subscribe'.
+
+        Return
+        ----------
+
+        None
+        """
+
+        self.interval = interval
+        self.subscribers = list(subscribers)
+
+        self.stage = None
+        self.total = 0
+        self.step = 0
+        self.work = 0
+        self.origin = None
+        self.last = None
+
+    def subscribe(self, callback):
+        """
+        Add a subscriber, called with every event.
+        """
+
+        self.subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        """
+        Remove a subscriber.
+        """
+
+        self.subscribers.remove(callback)
+
+    def start(self, stage, total):
+        """
+        Begin a stage of the run (a region, for a
+        given species).
+
+        Parameters
+        ----------
+
+        stage: string
+            Name of the stage.
+        total: int
+            Number of time steps of the stage.
+
+        Return
+        ----------
+
+        None
+        """
+
+        self.stage = stage
+        self.total = total
+        self.step = 0
+        self.work = 0
+        self.origin = time.perf_counter()
+        self.last = self.origin
+
+    def update(self, survivors, steps=1):
+        """
+        Report time steps of the current stage; an
+        event is only emitted if the interval has
+        elapsed since the last one, or if the stage
+        is complete.
+
+        Parameters
+        ----------
+
+        survivors: int
+            Number of ions which are still inside.
+        steps: int
+            Number of time steps done.
+
+        Return
+        ----------
+
+        None
+        """
+
+        self.step += steps
+        self.work += survivors * steps
+
+        now = time.perf_counter()
+        if now - self.last < self.interval and self.step < self.total:
+            return
+
+        self.last = now
+        elapsed = now - self.origin
+        fraction = self.step / self.total if self.total else 1
+
+        event = {
+            "stage": self.stage,
+            "step": self.step,
+            "total": self.total,
+            "fraction": fraction,
+            "elapsed": elapsed,
+            "eta": elapsed * (1 - fraction) / fraction if fraction > 0 else float("inf"),
+            "rate": self.work / elapsed if elapsed > 0 else 0,
+            "survivors": survivors
+        }
+
+        for callback in self.subscribers:
+            callback(event)
+
+def printer(event):
+    """
+    Subscriber printing the events on one line each.
+    """
+
+    print(f"{event['stage']}: {100 * event['fraction']:5.1f}% (step {event['step']}/{event['total']}), "
+          f"{event['rate']:.3g} ion-steps/s, {event['survivors']} ions, ETA {event['eta']:.1f} s")
@@ -0,0 +1,90 @@
+import numpy as np
+
+"""
+Timebase Object
+"""
+
+class Timebase:
+    """
+    Precomputed RF time base of a whole run, shared by every
+    ion species, law and quadrupole region. The time and
+    phase of every node are built from the node index
+    (t_j = j * h) rather than by cumulative addition, and the
+    drive factor U + V sin(phase) of the potential is
+    tabulated for every node and every solver sub-stage in a
+    single vectorized call, so the laws do no trigonometry
+    during the run.
+    """
+
+    def __init__(self, filter, h, nodes, offsets=(0, 0.5, 1)):
+        """
+        Initialises the 'Timebase' object
+
+        Parameters
+        ----------
+
+        filter: QMF
+            The filter which is being used.
+        h: float
+            The time step.
+        nodes: int
+            Number of time points of the run.
+        offsets: list
+            The sub-stage times of the solvers,
+            in units of the time step (e.g. 0,
+            1/2 and 1 for RK4).
+
+        Return
+        ----------
+
+        None
+        """
+
+        self.qmf = filter
+        self.h = h
+        self.nodes = nodes
+
+        # Row of the drive table for every sub-stage
+        self.offsets = {c: k for k, c in enumerate(offsets)}
+
+        self.phaseTime = np.empty([2, nodes])
+        self.phaseTime[0] = h * np.arange(nodes)
+        self.phaseTime[1] = filter.iniPhase + filter.angFrequency * self.phaseTime[0]
+
+        c = np.array(list(offsets), dtype=float)[:, np.newaxis]
+        phase = self.phaseTime[1] + c * (filter.angFrequency * h)
+        self.drive = filter.directPotential + filter.radioPotential * np.sin(phase)
+
+    def fits(self, filter, h):
+        """
+        Whether this time base can be used by a
+        region with the given filter and step.
+        """
+
+        return filter is self.qmf and h == self.h
+
+    def factor(self, j, c):
+        """
+        The drive factor at the time of node J plus
+        C time steps.
+
+        Parameters
+        ----------
+
+        j: int
+            Time index of the start of the step.
+        c: float
+            Sub-stage offset, in time steps.
+
+        Return
+        ----------
+
+        float or None
+            The tabulated drive factor, None if the
+            sub-stage is not in the table.
+        """
+
+        k = self.offsets.get(c)
+        if k is None:
+            return None
+        return self.drive[k, j]
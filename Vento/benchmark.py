@@ -0,0 +1,145 @@
+import io
+import sys
+import json
+import time
+import platform
+import argparse
+import contextlib
+import tracemalloc
+from datetime import datetime
+import numpy as np
+from sim.state import State
+from sim.gizmo import Gizmo, Ideal_Zone, Detector_Zone, Dawson_Entry_Zone, HM_Entry_Zone
+from sim.solver import Euler, RK4
+
+# Throughput benchmarks of 'State.turn', same file format as 'Q521/benchmark.py'
+SOLVERS = [Euler, RK4]
+ZONES = [Ideal_Zone, Dawson_Entry_Zone, HM_Entry_Zone]
+NUMBERS = [10, 100, 1000]
+
+def scenario(solver, zone, number, steps=200, span=20, seed=0):
+
+    # Fixed scenario: the Reis filter with its three zones of one kind, first species of Set A
+    ion = State()
+    ion.tag = "Titanium-47-A"
+    ion.load("sim/ion/Set A.csv")
+    ion.number = number
+    ion.solver = solver(ion)
+
+    machine = Gizmo()
+    machine.tag = "Reis Filter"
+    machine.load("sim/filter/Standard Series.csv")
+    machine._val = [zone(machine, span), zone(machine, span), zone(machine, span), Detector_Zone(machine)]
+    machine._dst = [span * 1e-3, 2 * span * 1e-3, 3 * span * 1e-3]
+
+    ion.h = machine.period() * 1e-2
+
+    def run():
+
+        # Same initial conditions on every call, only the time loop is timed
+        ion.seed = seed
+        ion.build(steps + 1)
+
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            ion.turn(machine)
+        wall = time.perf_counter() - start
+
+        # Ion-steps actually integrated: the finished ions were compacted out at their terminal step
+        work = int(np.where(ion.terminal < 0, steps, ion.terminal).sum())
+        return wall, work
+
+    return run
+
+def measure(run, repeat=3):
+
+    # Best of REPEAT timed runs, then one run under tracemalloc for the peak memory
+    wall, work = min([run() for k in range(repeat)])
+
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"ionSteps": work, "wall": wall, "rate": work / wall, "peak": peak}
+
+def suite(numbers=NUMBERS, steps=200, repeat=3):
+
+    results = {}
+    for solver in SOLVERS:
+        for zone in ZONES:
+            for number in numbers:
+                key = f"Vento/{solver.__name__}/{zone.__name__}/N={number}"
+                run = scenario(solver, zone, number, steps)
+
+                with np.errstate(all="ignore"):
+                    results[key] = measure(run, repeat)
+
+                print(f"{key:<40} {results[key]['rate']:>12.4g} ion-steps/s {results[key]['wall']:>9.4f} s {results[key]['peak'] / 2 ** 20:>9.2f} MiB")
+
+    meta = {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "steps": steps,
+        "repeat": repeat
+    }
+
+    return {"meta": meta, "results": results}
+
+def compare(current, baseline, tolerance=0.1):
+
+    # Flag the scenarios whose throughput dropped or peak memory grew beyond the tolerance
+    regressed = []
+    print(f"{'Scenario':<40} {'Rate':>10} {'Memory':>10}")
+
+    for key, new in current["results"].items():
+        old = baseline["results"].get(key)
+        if old is None:
+            continue
+
+        rate = new["rate"] / old["rate"]
+        memory = new["peak"] / old["peak"] if old["peak"] else 1
+
+        flag = rate < 1 - tolerance or memory > 1 + tolerance
+        if flag:
+            regressed.append(key)
+
+        print(f"{key:<40} {rate:>9.2f}x {memory:>9.2f}x {'REGRESSION' if flag else ''}")
+
+    return regressed
+
+def load(file):
+    with open(file) as f:
+        return json.load(f)
+
+def save(results, file):
+    with open(file, "w") as f:
+        json.dump(results, f, indent=4)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vento throughput benchmarks")
+    command = parser.add_subparsers(dest="command", required=True)
+
+    p = command.add_parser("run", help="Run the suite and write the results")
+    p.add_argument("--out", default="benchmark.json")
+    p.add_argument("--numbers", type=int, nargs="+", default=NUMBERS)
+    p.add_argument("--steps", type=int, default=200)
+    p.add_argument("--repeat", type=int, default=3)
+
+    p = command.add_parser("compare", help="Compare results against a baseline")
+    p.add_argument("current")
+    p.add_argument("baseline")
+    p.add_argument("--tolerance", type=float, default=0.1)
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        save(suite(args.numbers, args.steps, args.repeat), args.out)
+
+    elif args.command == "compare":
+        regressed = compare(load(args.current), load(args.baseline), args.tolerance)
+        print(f"{len(regressed)} regression(s)")
+        sys.exit(1 if regressed else 0)
\ No newline at end of file
@@ -36,7 +36,6 @@ S = time.time()
 ion.h = machine.period() * 1e-2
 T = int(1.05 * (machine._dst[-1] / ion.injSpeed) // ion.h)
 print(T)
-machine.build(ion, ion.number)
 ion.build(T)
 ion.clock()
 ion.turn(machine)
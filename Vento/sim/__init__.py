@@ -1,3 +1,6 @@
 from . import state
 from . import gizmo
-from . import solver
\ No newline at end of file
+from . import solver
+from . import seeding
+from . import instrument
+from . import telemetry
\ No newline at end of file
@@ -10,13 +10,8 @@ class Gizmo:
 
     def __init__(self):
 
-        # Keep this here for now, I might work on this later
-        self.NUMBER_OF_MODELS = 3 # this doesn't brick the program
-        self.BOOM_BOOST = 100000000000
-
         # ID purposes
         self.tag = None
-        self.family = None
 
         # Storing crucial stuff here
         self._dst = []
@@ -29,6 +24,15 @@ class Gizmo:
         self.angFrequency = None
         self.inscRadius = None
         self.maxPotential = None
+
+        # Nothing here changes during a run: the scratch of each run lives in
+        # its 'Context' (see build), so several states can share the machine
+
+    @property
+    def NUMBER_OF_MODELS(self):
+
+        # One zone per boundary, the detector comes after the last one
+        return len(self._dst)
     
     def hmc(self):
 
@@ -67,16 +71,9 @@ class Gizmo:
             self.b2 = 1
     
     def build(self, state, N):
-        
-        self.family = state
-        
-        # Useful, universal objects
-        self.m = np.arange(1, self.NUMBER_OF_MODELS + 2)
-        self.M = self.m[:, np.newaxis]
-        self.M = np.repeat(self.M, N, axis=1)
 
-        self.chargerTensor = np.empty((self.NUMBER_OF_MODELS + 1, 3, N))
-        self.ZERO_MATRIX = np.zeros([3, N])
+        # Scratch of a run of STATE (N ions) on this machine, see 'Context'
+        return Context(self, state, N)
     
     def load(self, name):
     
@@ -100,7 +97,7 @@ class Gizmo:
     def period(self):
         
         return 1 / self.pureFrequency
-    
+
     def radialCheck(self, x, y):
         
         rad = self.inscRadius
@@ -110,57 +107,146 @@ class Gizmo:
     
     def zoneCheck(self, z):
 
-        D = self._dst
+        # D is already in SI Units, zone k (from 1) ends at D[k - 1]
+        D = np.asarray(self._dst)
+
+        # Zone index, the detector being the last one (0 if before the entry)
+        l = np.searchsorted(D, z, side="right") + 1
+        l *= (z >= 0)
+
+        return l
+
+    def pulse(self, x, time, run, out=None):
+
+        state = run.family
         
-        # D is already in SI Units
-        a = D[0]
-        b = D[1]
-        c = D[2]
+        # Extract the l-vector (of shape 1xN)
+        l = state.state[0, : ]
 
-        #print(a, b, c)
+        # Lost and detected ions feel no force
+        B = np.empty(x.shape) if out is None else out
+        B.fill(0)
 
-        l_1 = (z >= 0) & (z < a)
+        # Each zone model only sees its own ions
+        for zone, idx in zip(self._val, run.partition(l)):
 
-        l_2 = (z >= a) & (z < b)
+            n = len(idx)
 
-        l_3 = (z >= b) & (z < c)
+            if n == len(l):
+                run.ions = slice(None)
+                zone.compute(x, time, run, B)
 
-        l_4 = (z >= c)
+            elif n:
+                run.ions = idx
 
-        l = l_1 + (l_2 * 2) + (l_3 * 3) + (l_4 * 4)
+                # Gather the ions of the zone, compute their forces and scatter them back
+                xs = run.scratch(0, n)
+                ys = run.scratch(1, n)
+                np.take(x, idx, axis=1, out=xs, mode="clip")
 
-        return l
-    
-    def pulse(self, x, time):
+                zone.compute(xs, time, run, ys)
+                B[:, idx] = ys
 
-        state = self.family
-        
-        # Extract the l-vector (of shape 1xN)
-        l = state.state[0, : ]
+        return B
 
 
-        # Determine the verification matrix (if zero, model stays)
-        D = self.M - l
-        V = 1 / (1 + self.BOOM_BOOST * D**2)
+class Context:
 
-        # Determine the  force cards for all three (four) models {1, 2, 3, 4}
-        F_1 = self._val[0].compute(x, time)
-        F_2 = self._val[1].compute(x, time)
-        F_3 = self._val[2].compute(x, time)
-        F_4 = F_1 * 0
-        
-        # Assemble this pulse instance charger tensor
-        self.chargerTensor[0, :, :] = F_1
-        self.chargerTensor[1, :, :] = F_2
-        self.chargerTensor[2, :, :] = F_3
-        self.chargerTensor[3, :, :] = F_4
+    # Everything a run of one state changes while it uses a 'Gizmo': the machine and its
+    # zones are only read, so several turns (e.g. in threads) can share them, one context each
 
-        # Determine the Transformation Matrix
-        B = np.einsum('mij,mj->ij', self.chargerTensor, V)
+    def __init__(self, gizmo, state, N):
 
+        self.gizmo = gizmo
+        self.family = state
 
-        return B
+        # Useful, universal objects
+        self.ZERO_MATRIX = np.zeros([3, N])
+
+        # Workspaces of the zones (see scratch): gathered positions, forces and temporaries
+        self._space = np.empty([3, 3 * N])
+        self._same = np.empty(N, dtype=bool)
+
+        # Ions of each zone (see partition), and the working columns being computed
+        self.label = None
+        self.bins = []
+        self.ions = slice(None)
+
+        # RF time base (see tabulate)
+        self.step = None
+        self._cos = None
+        self._sin = None
+        self._wave = {}
+        self.phase = None # Sine and cosine of the per-ion phases of a merged batch
 
+    def tabulate(self, h, T):
+
+        # Tabulate the RF phase on the half-step grid of a run of T
+        # points (every RK sub-stage), shared by all zones
+        if self.step == h and len(self._cos) >= 2 * T + 1:
+            return
+
+        wt = self.gizmo.angFrequency * (0.5 * h) * np.arange(2 * T + 1)
+
+        self.step = h
+        self._cos = np.cos(wt)
+        self._sin = np.sin(wt)
+        self._wave = {}
+
+    def wave(self, time, ceta):
+
+        # cos(w * time + ceta), read from the table on the half-step grid
+        # (ceta is an array of per-ion phases for a merged batch)
+        if self.step is not None:
+            m = round(2 * time / self.step)
+
+            if 0 <= m < len(self._cos) and abs(m * self.step - 2 * time) <= 1e-9 * self.step:
+
+                if np.ndim(ceta):
+                    if self.phase is None or self.phase[0] is not ceta:
+                        self.phase = (ceta, np.cos(ceta), np.sin(ceta))
+
+                    return self._cos[m] * self.phase[1] - self._sin[m] * self.phase[2]
+
+                # Phase-shifted table of the species (built once)
+                table = self._wave.get(ceta)
+                if table is None:
+                    table = self._cos * math.cos(ceta) - self._sin * math.sin(ceta)
+                    self._wave[ceta] = table
+
+                return table[m]
+
+        if np.ndim(ceta):
+            return np.cos(self.gizmo.angFrequency * time + ceta)
+        return math.cos(self.gizmo.angFrequency * time + ceta)
+    
+    def partition(self, l):
+
+        # Indices of the ions of every zone, sorted once per set of labels
+        # (the labels only change in calibrate, between two time steps)
+        n = len(l)
+        if self.label is not None and len(self.label) == n:
+            if np.equal(self.label, l, out=self._same[:n]).all():
+                return self.bins
+
+        order = np.argsort(l, kind="stable")
+        k = np.arange(1, self.gizmo.NUMBER_OF_MODELS + 1)
+        edges = np.searchsorted(l[order], k, side="left"), np.searchsorted(l[order], k, side="right")
+
+        self.label = l.copy()
+        self.bins = [order[i:j] for i, j in zip(*edges)]
+
+        return self.bins
+    
+    def scratch(self, k, n):
+
+        # The K-th workspace, as a contiguous (3, n) array for n ions
+        return self._space[k, : 3 * n].reshape(3, n)
+
+    def pulse(self, x, time, out=None):
+
+        # Forces of the machine on this run's ions (what the solvers call), written to OUT if given
+        return self.gizmo.pulse(x, time, self, out)
 
 class Generic_Zone:
 
@@ -170,8 +256,33 @@ class Generic_Zone:
         
         self.span = span * 1e-3
     
-    def compute(self, state):
-        return state * 0
+    def compute(self, x, time, run, out=None):
+        return np.multiply(x, 0, out=out)
+
+    def constants(self, time, run):
+
+        # Charge-to-mass ratio and RF drive of the ions being computed: scalars for one
+        # species, arrays for a merged batch (per-ion charge, mass and phase, see 'State.gather')
+        master = self.master
+        state = run.family
+
+        q = state.charge
+        m = state.mass
+
+        U = master.directPotential
+        R = master.radioPotential
+        r = master.inscRadius
+
+        W = run.wave(time, state.iniPhase)
+
+        if np.ndim(q):
+            ions = state.active[run.ions]
+            q, m, W = q[ions], m[ions], W[ions]
+
+        e = q / m
+        J = (U - R * W) / (r**2)
+
+        return e, J
 
 class Detector_Zone(Generic_Zone):
     
@@ -180,9 +291,13 @@ class Detector_Zone(Generic_Zone):
         
         self.span = 0
     
-    def compute(self, x, time):
-        
-        return self.master.ZERO_MATRIX
+    def compute(self, x, time, run, out=None):
+
+        if out is None:
+            return run.ZERO_MATRIX
+
+        out.fill(0)
+        return out
 
 class Ideal_Zone(Generic_Zone):
 
@@ -190,36 +305,23 @@ class Ideal_Zone(Generic_Zone):
         
         super().__init__(master, span)
 
-    def compute(self, x, time):
+    def compute(self, x, time, run, out=None):
 
-        # Reference to state object
-        state = self.master.family
+        # Forces written in place (a new array if OUT is None)
+        if out is None:
+            out = np.empty(x.shape)
 
         X = x[0, :]
         Y = x[1, :]
         Z = x[2, :]
 
-        #print(Z)
-
-        ceta = state.iniPhase
-        q = state.charge
-        m = state.mass
-
-        U = self.master.directPotential
-        R = self.master.radioPotential
-        w = self.master.angFrequency
-        r = self.master.inscRadius
-
-        e = q / m
-        J = (U - R * math.cos(w * time + ceta)) / (r**2)
-
-        A_X = (-1) * e * J * X
-        A_Y = (1) * e * J * Y
-        A_Z = (0) * e * J * Z
+        e, J = self.constants(time, run)
 
-        y = np.vstack([A_X, A_Y, A_Z])
+        np.multiply(X, (-1) * e * J, out=out[0])
+        np.multiply(Y, (1) * e * J, out=out[1])
+        np.multiply(Z, (0) * e * J, out=out[2])
         
-        return y
+        return out
 
 class Dawson_Entry_Zone(Generic_Zone):
 
@@ -227,43 +329,40 @@ class Dawson_Entry_Zone(Generic_Zone):
         
         super().__init__(master, span)
 
-    def compute(self, x, time):
+    def compute(self, x, time, run, out=None):
+
+        if out is None:
+            out = np.empty(x.shape)
 
         # Zone definitions
         d = self.span
 
-        # Reference to state object
-        state = self.master.family
-
         X = x[0, :]
         Y = x[1, :]
         Z = x[2, :]
 
-        ceta = state.iniPhase
-        q = state.charge
-        m = state.mass
+        e, J = self.constants(time, run)
 
-        U = self.master.directPotential
-        R = self.master.radioPotential
-        w = self.master.angFrequency
-        r = self.master.inscRadius
-
-        e = q / m
-        J = (U - R * math.cos(w * time + ceta)) / (r**2)
+        # Temporaries of the run (see 'Context.scratch')
+        a, B, _ = run.scratch(2, x.shape[1])
 
+        # Zone-specific mechanics, a = Z / d and B = (X^2 - Y^2) / d
+        np.divide(Z, d, out=a)
 
-        # Zone-specific mechanics
-        a = Z / d
-        B = ( (X**2) - (Y**2) ) / d
+        np.multiply(X, X, out=B)
+        np.multiply(Y, Y, out=out[2])
+        B -= out[2]
+        B /= d
 
+        np.multiply(X, a, out=out[0])
+        out[0] *= (-1) * e * J
 
-        A_X = (-1) * e * J * np.multiply(X, a) 
-        A_Y = (1) * e * J * np.multiply(Y, a)
-        A_Z = (-1/2) * e * J * (B)
+        np.multiply(Y, a, out=out[1])
+        out[1] *= (1) * e * J
 
-        y = np.vstack([A_X, A_Y, A_Z])
+        np.multiply(B, (-1/2) * e * J, out=out[2])
 
-        return y
+        return out
 
 
 
@@ -273,187 +372,114 @@ class Dawson_Exit_Zone(Generic_Zone):
         
         super().__init__(master, span)
 
-    def compute(self, x, time):
+    def compute(self, x, time, run, out=None):
+
+        if out is None:
+            out = np.empty(x.shape)
 
         # Zone definitions
         d = self.span
-
-        # Reference to state object
-        state = self.master.family
         l = self.master._dst[-2]
 
         X = x[0, :]
         Y = x[1, :]
-        Z = x[2, :] - l # ensures that x3 starts at 0
 
-        #print(Z, l)
-
-        ceta = state.iniPhase
-        q = state.charge
-        m = state.mass
+        e, J = self.constants(time, run)
 
-        U = self.master.directPotential
-        R = self.master.radioPotential
-        w = self.master.angFrequency
-        r = self.master.inscRadius
+        a, B, _ = run.scratch(2, x.shape[1])
 
-        e = q / m
-        J = (U - R * math.cos(w * time + ceta)) / (r**2)
+        # Zone-specific mechanics, a = 1 - (Z - l) / d (Z starts at 0) and B = (X^2 - Y^2) / d
+        np.subtract(x[2, :], l, out=a)
+        a /= d
+        np.subtract(1, a, out=a)
 
+        np.multiply(X, X, out=B)
+        np.multiply(Y, Y, out=out[2])
+        B -= out[2]
+        B /= d
 
-        # Zone-specific mechanics
-        a = 1 - (Z / d)
-        B = ( (X**2) - (Y**2) ) / d
+        np.multiply(X, a, out=out[0])
+        out[0] *= (-1) * e * J
 
+        np.multiply(Y, a, out=out[1])
+        out[1] *= (1) * e * J
 
-        A_X = (-1) * e * J * np.multiply(X, a) 
-        A_Y = (1) * e * J * np.multiply(Y, a)
-        A_Z = (1/2) * e * J * (B)
+        np.multiply(B, (1/2) * e * J, out=out[2])
 
-        y = np.vstack([A_X, A_Y, A_Z])
+        return out
 
-        return y
 
 
 
 
+class HM_Zone(Generic_Zone):
 
-class HM_Entry_Zone(Generic_Zone):
+    # Hunter-McIntosh fringe field, entry (SIGN = -1) or exit (SIGN = 1)
+    SIGN = -1
 
     def __init__(self, master, span):
         
         super().__init__(master, span)
 
-    def compute(self, x_vector, time):
+    def compute(self, x_vector, time, run, out=None):
 
-        def f(x):
-
-            z = x / self.span
-            a = self.master.a1
-            b = self.master.b1
-
-            power = 0 - (a * z + b * (z**2))
-            return 1 - np.exp(power)
-    
-        def f_prime(x):
-
-            g = self.span
-            z = x / g
-            a = self.master.a1
-            b = self.master.b1
-
-            t1 = (a / g) + 2 * (b / (g**2)) * x
-            t2 = np.exp(0 - (a * z + b * (z**2)))
-
-            return np.multiply(t1, t2)
+        if out is None:
+            out = np.empty(x_vector.shape)
 
         # Zone definitions
         d = self.span
-
-        # Reference to state object
-        state = self.master.family
+        g = self.span
+        a = self.master.a1
+        b = self.master.b1
 
         # State definitions
         X = x_vector[0, :]
         Y = x_vector[1, :]
         Z = x_vector[2, :]
 
-        ceta = state.iniPhase
-        q = state.charge
-        m = state.mass
-
-        # Gizmo definitions
-        U = self.master.directPotential
-        R = self.master.radioPotential
-        w = self.master.angFrequency
-        r = self.master.inscRadius
-
         # Universal definitions
-        e = q / m
-        J = (U - R * math.cos(w * time + ceta)) / (r**2)
-
+        e, J = self.constants(time, run)
 
-        # Zone-specific mechanics
-        Alpha = f(Z)
-        Beta = f_prime(Z)
-        Delta = ( (X**2) - (Y**2) ) / d
-
-        A_X = (-1) * e * J * np.multiply(X, Alpha)
-        A_Y = (1) * e * J * np.multiply(Y, Alpha)
-        A_Z = (-1/2) * e * J * np.multiply(Delta, Beta)
-
-
-        # Output Prep
-        y = np.vstack([A_X, A_Y, A_Z])
-        
-        return y
+        E, Alpha, Beta = run.scratch(2, x_vector.shape[1])
 
-class HM_Exit_Zone(Generic_Zone):
+        # E = exp(0 - (a * z + b * z^2)), z = Z / g
+        np.divide(Z, g, out=E)
+        np.multiply(E, E, out=Alpha)
+        Alpha *= b
+        E *= a
+        E += Alpha
+        np.subtract(0, E, out=E)
+        np.exp(E, out=E)
 
-    def __init__(self, master, span):
-        
-        super().__init__(master, span)
+        # Alpha = f(Z) = 1 - E and Beta = f'(Z) = (a / g + 2 * (b / g^2) * Z) * E
+        np.subtract(1, E, out=Alpha)
 
-    def compute(self, x_vector, time):
+        np.multiply(Z, 2 * (b / (g**2)), out=Beta)
+        Beta += a / g
+        Beta *= E
 
-        def f(x):
+        # Zone-specific mechanics, Delta = (X^2 - Y^2) / d
+        Delta = out[2]
+        np.multiply(X, X, out=Delta)
+        np.multiply(Y, Y, out=E)
+        Delta -= E
+        Delta /= d
 
-            z = x / self.span
-            a = self.master.a1
-            b = self.master.b1
+        np.multiply(X, Alpha, out=out[0])
+        out[0] *= (-1) * e * J
 
-            power = 0 - (a * z + b * (z**2))
-            return 1 - np.exp(power)
-    
-        def f_prime(x):
+        np.multiply(Y, Alpha, out=out[1])
+        out[1] *= (1) * e * J
 
-            g = self.span
-            z = x / g
-            a = self.master.a1
-            b = self.master.b1
+        Delta *= Beta
+        Delta *= (self.SIGN / 2) * e * J
 
-            t1 = (a / g) + 2 * (b / (g**2)) * x
-            t2 = np.exp(0 - (a * z + b * (z**2)))
+        return out
 
-            return np.multiply(t1, t2)
+class HM_Entry_Zone(HM_Zone):
 
-        # Zone definitions
-        d = self.span
+    SIGN = -1
 
-        # Reference to state object
-        state = self.master.family
+class HM_Exit_Zone(HM_Zone):
 
-        # State definitions
-        X = x_vector[0, :]
-        Y = x_vector[1, :]
-        Z = x_vector[2, :]
-
-        ceta = state.iniPhase
-        q = state.charge
-        m = state.mass
-
-        # Gizmo definitions
-        U = self.master.directPotential
-        R = self.master.radioPotential
-        w = self.master.angFrequency
-        r = self.master.inscRadius
-
-        # Universal definitions
-        e = q / m
-        J = (U - R * math.cos(w * time + ceta)) / (r**2)
-
-
-        # Zone-specific mechanics
-        Alpha = f(Z)
-        Beta = f_prime(Z)
-        Delta = ( (X**2) - (Y**2) ) / d
-
-        A_X = (-1) * e * J * np.multiply(X, Alpha)
-        A_Y = (1) * e * J * np.multiply(Y, Alpha)
-        A_Z = (1/2) * e * J * np.multiply(Delta, Beta)
-
-
-        # Output Prep
-        y = np.vstack([A_X, A_Y, A_Z])
-        
-        return y
\ No newline at end of file
+    SIGN = 1
\ No newline at end of file
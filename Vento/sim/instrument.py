@@ -0,0 +1,141 @@
+import json
+import time
+import contextlib
+import tracemalloc
+
+__all__ = ["Profile"]
+
+class Profile:
+
+    # Opt-in instrumentation of 'State.turn', same records and trace format as 'Q521/instrument.py':
+    # wall time, ion-steps per second and traced allocations of each region, plus the calls and
+    # time of the watched methods (zones, solver, calibration), which are only wrapped while the
+    # region runs
+
+    def __init__(self, memory=True):
+
+        self.memory = memory
+        self.regions = [] # One dictionary per region, in the order they ended
+        self.origin = time.perf_counter()
+        self.depth = 0
+        self.peaks = [] # Highest traced memory of the open regions, outermost first
+
+    @contextlib.contextmanager
+    def region(self, name, category="region", ionSteps=0, watch=()):
+
+        # Trace the allocations for the outermost region only
+        started = self.memory and not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        if self.memory:
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            self.peaks.append(before)
+
+        # Methods sharing a label share their counters
+        calls = {}
+        saved = []
+        for obj, method, label in watch:
+            count = calls.setdefault(label, {"count": 0, "time": 0.0})
+            saved.append((obj, method, self.hook(obj, method, count)))
+
+        # Values added by the caller to the record
+        extra = {}
+
+        self.depth += 1
+        start = time.perf_counter()
+        try:
+            yield extra
+        finally:
+            wall = time.perf_counter() - start
+            self.depth -= 1
+
+            # Put the original methods back, innermost first
+            for obj, method, previous in reversed(saved):
+                if previous is None:
+                    delattr(obj, method)
+                else:
+                    setattr(obj, method, previous)
+
+            record = {
+                "name": name,
+                "category": category,
+                "depth": self.depth,
+                "start": start - self.origin,
+                "wall": wall,
+                "ionSteps": ionSteps,
+                "calls": {label: dict(count) for label, count in calls.items()}
+            }
+
+            # The caller may correct the ion-steps (e.g. a turn stopped early)
+            record.update(extra)
+            record["rate"] = record["ionSteps"] / wall if wall > 0 else 0
+
+            # The inner regions reset the peak, theirs are carried up
+            if self.memory:
+                after, peak = tracemalloc.get_traced_memory()
+                peak = max(peak, self.peaks.pop())
+                if self.peaks:
+                    self.peaks[-1] = max(self.peaks[-1], peak)
+                record["allocated"] = after - before
+                record["peak"] = peak - before
+            if started:
+                tracemalloc.stop()
+
+            self.regions.append(record)
+
+    def hook(self, obj, method, count):
+
+        # Count and time the calls of an instance method, returns what to put back afterwards
+        previous = vars(obj).get(method)
+        bound = getattr(obj, method)
+
+        def wrapped(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return bound(*args, **kwargs)
+            finally:
+                count["time"] += time.perf_counter() - start
+                count["count"] += 1
+
+        setattr(obj, method, wrapped)
+        return previous
+
+    def summary(self):
+
+        print(f"{'Region':<40} {'Wall (s)':>10} {'Ion-steps/s':>12} {'Allocated':>12} {'Peak':>12}")
+        for r in sorted(self.regions, key=lambda r: r["start"]):
+            name = "  " * r["depth"] + r["name"]
+            memory = f"{r['allocated']:>12} {r['peak']:>12}" if "peak" in r else ""
+            print(f"{name:<40} {r['wall']:>10.4f} {r['rate']:>12.4g} {memory}")
+            for label, count in r["calls"].items():
+                if count["count"]:
+                    print(f"{'  ' * (r['depth'] + 1) + label:<40} {count['time']:>10.4f} {count['count']:>12} calls")
+
+        return self.regions
+
+    def trace(self):
+
+        # Chrome trace events, one track per watched method holding its total time in each region
+        tracks = {"regions": 0}
+        events = []
+
+        for r in self.regions:
+            ts = 1e6 * r["start"]
+            args = {key: value for key, value in r.items() if key in ["ionSteps", "rate", "allocated", "peak", "zones"]}
+            events.append({"name": r["name"], "cat": r["category"], "ph": "X", "ts": ts, "dur": 1e6 * r["wall"], "pid": 0, "tid": 0, "args": args})
+
+            for label, count in r["calls"].items():
+                tid = tracks.setdefault(label, len(tracks))
+                events.append({"name": label, "cat": "call", "ph": "X", "ts": ts, "dur": 1e6 * count["time"], "pid": 0, "tid": tid, "args": {"count": count["count"], "region": r["name"]}})
+
+        # Names of the tracks
+        for label, tid in tracks.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": 0, "tid": tid, "args": {"name": label}})
+
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export(self, file):
+
+        with open(file, "w") as f:
+            json.dump(self.trace(), f)
\ No newline at end of file
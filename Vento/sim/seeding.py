@@ -0,0 +1,37 @@
+import numpy as np
+
+__all__ = ["sequence", "spawn", "stream", "spread"]
+
+# Same functions as 'Q521/seeding.py', keep the two in step: the packages are run from their own
+# directories and cannot import each other, so the same seed gives the same draws in both
+
+def sequence(seed=None):
+
+    # Root of the random streams, None draws fresh entropy (kept in 'entropy')
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    return np.random.SeedSequence(seed)
+
+def spawn(seed, n):
+
+    # Independent child streams, one per species or worker
+    return sequence(seed).spawn(n)
+
+def stream(seed=None):
+
+    # Random generator of a seed, existing generators are passed through
+    if isinstance(seed, np.random.Generator):
+        return seed
+    return np.random.default_rng(sequence(seed))
+
+def spread(seed, number, widths):
+
+    # Uniform draws in [-width, width] for every ion, in a single call
+    rng = stream(seed)
+
+    y = rng.random([len(widths), number])
+    y *= 2
+    y -= 1
+    y *= np.asarray(widths, dtype=float).reshape(-1, 1)
+
+    return y
\ No newline at end of file
@@ -8,16 +8,28 @@ class Generic_Solver:
     def __init__(self, master):
 
         self.master = master
+        self.space = None
 
-    def predict(self, gizmo, t):
+    def predict(self, run, t):
         return 0
 
+    def workspace(self, k):
+
+        # K preallocated (3, n) buffers for the n ions in flight, bound to the size of the state
+        N = self.master.number
+        n = self.master.state.shape[1]
+
+        if self.space is None or self.space.shape != (k, 3 * N):
+            self.space = np.empty([k, 3 * N])
+
+        return [b[: 3 * n].reshape(3, n) for b in self.space]
+
 class Euler(Generic_Solver):
 
     def __init__(self, master):
         super().__init__(master)
 
-    def predict(self, gizmo, t):
+    def predict(self, run, t):
 
         master = self.master
         h = master.h
@@ -26,45 +38,116 @@ class Euler(Generic_Solver):
         X = master.state[1:4, :]
         V = master.state[4:7, :]
 
-        A = gizmo.pulse(X, t)
+        A, S = self.workspace(2)
+        run.pulse(X, t, A)
+
+        # Reassignment, X += h * V and V += h * A in place
+        np.multiply(V, h, out=S)
+        X += S
 
-        # Reassignment
-        master.state[1:4, : ] += h * V
-        master.state[4:7, : ] += h * A
+        A *= h
+        V += A
 
 class RK4(Generic_Solver):
 
     def __init__(self, master):
         super().__init__(master)
     
-    def predict(self, gizmo, t):
-
-        def acl(X, tim):
-
-            # Runs pulse and gets the prediction 
-            return gizmo.pulse(X, tim)
+    def predict(self, run, t):
 
         master = self.master
         h = master.h
+        c = 0.5 * h
 
         # Initial estimate values 
         X = master.state[1:4, :]
         V = master.state[4:7, :]
 
+        # Stage values, the stage positions (Y) and the sums (S) in the solver workspace
+        k1v, k2v, k3v, k4v, k2x, k3x, k4x, Y, S = self.workspace(9)
+
         # RK4 for position and velocity
-        k1v = acl(X, t)
+        run.pulse(X, t, k1v)
         k1x = V
 
-        k2v = acl(X + 0.5 * h * k1x, t + 0.5 * h)
-        k2x = V + 0.5 * h * k1v
+        np.multiply(k1x, c, out=Y)
+        Y += X
+        run.pulse(Y, t + c, k2v)
+        np.multiply(k1v, c, out=k2x)
+        k2x += V
+
+        np.multiply(k2x, c, out=Y)
+        Y += X
+        run.pulse(Y, t + c, k3v)
+        np.multiply(k2v, c, out=k3x)
+        k3x += V
+
+        np.multiply(k3x, h, out=Y)
+        Y += X
+        run.pulse(Y, t + h, k4v)
+        np.multiply(k3v, h, out=k4x)
+        k4x += V
+
+
+        # Reassignment, (h/6) * (k1 + 2 * k2 + 2 * k3 + k4) for each
+        np.multiply(k2x, 2, out=S)
+        S += k1x
+        np.multiply(k3x, 2, out=Y)
+        S += Y
+        S += k4x
+        S *= h / 6
+        X += S
+
+        np.multiply(k2v, 2, out=S)
+        S += k1v
+        np.multiply(k3v, 2, out=Y)
+        S += Y
+        S += k4v
+        S *= h / 6
+        V += S
+
+class Verlet(Generic_Solver):
+
+    # Stormer-Verlet (leapfrog), drift-kick-drift
+    DRIFT = [1/2, 1/2]
+    KICK = [1]
 
-        k3v = acl(X + 0.5 * h * k2x, t + 0.5 * h)
-        k3x = V + 0.5 * h * k2v
+    def __init__(self, master):
+        super().__init__(master)
 
-        k4v = acl(X + h * k3x, t + h)
-        k4x = V + h * k3v
+    def predict(self, run, t):
 
+        master = self.master
+        h = master.h
 
-        # Reassignment
-        master.state[1:4, : ] += (h/6) * (k1x + 2 * k2x + 2 * k3x + k4x)
-        master.state[4:7, : ] += (h/6) * (k1v + 2 * k2v + 2 * k3v + k4v)
\ No newline at end of file
+        # state variables (views, updated in place)
+        X = master.state[1:4, :]
+        V = master.state[4:7, :]
+
+        A, S = self.workspace(2)
+
+        c = 0
+        for d, k in zip(self.DRIFT, self.KICK + [None]):
+
+            # Drift, X += d * h * V in place
+            np.multiply(V, d * h, out=S)
+            X += S
+            c += d
+
+            # Kick at the time reached by the drifts, V += k * h * A in place
+            if k is not None:
+                run.pulse(X, t + c * h, A)
+                A *= k * h
+                V += A
+
+class Yoshida(Verlet):
+
+    # 4th order Forest-Ruth/Yoshida composition of three leapfrog steps
+    W1 = 1 / (2 - 2 ** (1 / 3))
+    W0 = 1 - 2 * W1
+
+    DRIFT = [W1 / 2, (W0 + W1) / 2, (W0 + W1) / 2, W1 / 2]
+    KICK = [W1, W0, W1]
+
+    def __init__(self, master):
+        super().__init__(master)
\ No newline at end of file
@@ -1,11 +1,14 @@
 import numpy as np
 from numpy import ones, zeros
-import random as rng
 import csv
 from datetime import datetime
 from time import sleep
 import os
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
 from matplotlib import pyplot as plt
+from . import seeding
+from .telemetry import Telemetry, printer
 
 __all__ = ["State"]
 
@@ -18,6 +21,9 @@ class State:
         self.time = None
         self.state = None
         self.history = None
+        self.terminal = None # Time index at which each ion was lost or detected (see 'turn')
+        self.active = None # Ions still in flight during a turn (columns of the working state)
+        self.species = {} # Columns of each species in a merged batch (see 'gather')
         self.solver = None
         self.h = None
         
@@ -34,6 +40,9 @@ class State:
         self.sprVZ = None
         self.injSpeed = None
         self.iniPhase = None
+        self.seed = None # Seed of the initial conditions (int or SeedSequence), None for fresh entropy
+        self.profile = None # Optional 'Profile' of the turns (see 'instrument')
+        self.telemetry = Telemetry(subscribers=[printer]) # Throttled progress events, None to run silently
     
     def build(self, timepoints):
 
@@ -46,19 +55,19 @@ class State:
             tempo = t * self.h
             self.time[t] = tempo
 
-        # Set ion initial conditions
-        for n in range(self.number):
-            
-            delX = self.sprX * (2 * rng.random() - 1)
-            delY = self.sprY * (2 * rng.random() - 1)
-            
-            delVX = self.sprVX * (2 * rng.random() - 1)
-            delVY = self.sprVY * (2 * rng.random() - 1)
-            delVZ = self.sprVZ * rng.random() * 0.001
+        # Set ion initial conditions, drawn for every ion at once from a seeded stream
+        self.seed = seeding.sequence(self.seed)
+        rng = seeding.stream(self.seed)
+
+        delX, delY, delVX, delVY = seeding.spread(rng, self.number, [self.sprX, self.sprY, self.sprVX, self.sprVY])
+        delVZ = self.sprVZ * rng.random(self.number) * 0.001
 
-            self.state[0, n] = 1
-            self.state[1:4, n] += [delX, delY, 0]
-            self.state[4:7, n] += [delVX, delVY, self.injSpeed + delVZ]
+        self.state[0] = 1
+        self.state[1] += delX
+        self.state[2] += delY
+        self.state[4] += delVX
+        self.state[5] += delVY
+        self.state[6] += self.injSpeed + delVZ
     
     def load(self, name):
         
@@ -232,7 +241,6 @@ class State:
 
         # If the ion is lost, set that in L-vector
         L = r * z 
-        print(L, z, r)
 
         # Ensure zero velocity on loss or detection
         C = np.isin(L, [0, gizmo.NUMBER_OF_MODELS + 1])
@@ -242,21 +250,137 @@ class State:
         self.state[0, :] = L
         self.state[4:7, :] *= ~C[None, :]
 
+        return C
+
     def turn(self, gizmo):
 
         T = len(self.time)
+        N = self.number
+
+        # Scratch of this turn, the machine itself is only read (turns may share it)
+        run = gizmo.build(self, N)
+
+        # Shared table of the RF drive for this time step
+        run.tabulate(self.h, T)
+
+        if self.telemetry is not None:
+            self.telemetry.start(f"turn [{self.tag}]", T - 1)
+
+        # Ions still in flight (indices into the species set), the working state only holds these
+        active = np.arange(N)
+        self.active = active
+        detected = 0
+
+        # Time index at which each ion was lost or detected (-1 if still in flight at the end)
+        self.terminal = np.full(N, -1)
 
-        for t in range(T - 1):
+        with self.region(gizmo, run, T) as extra:
 
-            # Run forward calculations at each time point - the last
-            self.history[:, :, t] = self.state
-            self.solver.predict(gizmo, self.time[t])
+            # Ion-steps spent in each zone (0 is lost, the last one the detector), profiled runs only
+            zones = None if extra is None else zeros([gizmo.NUMBER_OF_MODELS + 2])
+            work = 0
 
-            # Check the zone of each ion in the species set
-            self.calibrate(gizmo)
+            for t in range(T - 1):
+
+                # Run forward calculations at each time point - the last
+                self.history[:, active, t] = self.state
+                self.solver.predict(run, self.time[t])
+                stepped = len(active)
+                work += stepped
+
+                # Check the zone of each ion in the species set
+                C = self.calibrate(gizmo)
+
+                if zones is not None:
+                    zones += np.bincount(self.state[0].astype(int), minlength=len(zones))
+
+                # Finished ions stay where they are: fill the rest of their history and drop them
+                if C.any():
+                    done = active[C]
+                    self.terminal[done] = t + 1
+                    self.history[:, done, t + 1 :] = self.state[:, C, None]
+
+                    detected += int(np.count_nonzero(self.state[0, C]))
+                    active = active[~C]
+                    self.state = self.state[:, ~C]
+                    self.active = active
+
+                # Survivors are the ions which have not been lost (detected ones included),
+                # the work only counts the ions integrated in this step
+                if self.telemetry is not None:
+                    if len(active) or t == T - 2:
+                        self.telemetry.update(len(active) + detected, work=stepped)
+                    else:
+                        self.telemetry.stop(detected, work=stepped)
+
+                # Every ion is lost or at the detector
+                if not len(active):
+                    break
+
+            if zones is not None:
+                extra["zones"] = zones.tolist()
+                extra["ionSteps"] = work
         
         # Add forward state to the final time instant
-        self.history[:, :, -1] = self.state
+        self.history[:, active, -1] = self.state
+
+        # Final state of the whole species set
+        self.state = self.history[:, :, -1].copy()
+
+    def gather(self, states):
+
+        # Merge built species into one batch, with per-ion charge, mass and phase arrays,
+        # so that a single turn (one pulse per stage) covers the whole group
+        longest = max(states, key=lambda s: len(s.time))
+
+        if any(s.h != longest.h for s in states):
+            raise ValueError("The merged species must share the same time step")
+
+        self.h = longest.h
+        self.time = longest.time.copy()
+        self.number = sum(s.number for s in states)
+        self.length = longest.length
+        self.rad = longest.rad
+
+        self.state = np.hstack([s.state for s in states])
+        self.history = zeros([7, self.number, len(self.time)])
+
+        self.charge = np.concatenate([np.full(s.number, s.charge, dtype=float) for s in states])
+        self.mass = np.concatenate([np.full(s.number, s.mass, dtype=float) for s in states])
+        self.iniPhase = np.concatenate([np.full(s.number, s.iniPhase, dtype=float) for s in states])
+
+        # Columns of each species, by tag
+        self.species = {}
+        a = 0
+        for s in states:
+            self.species[s.tag] = slice(a, a + s.number)
+            a += s.number
+
+    def split(self, states):
+
+        # Hand the results of a merged turn back to its species, each cut to its own time points
+        for s in states:
+            n = self.species[s.tag]
+            T = len(s.time)
+
+            s.history = self.history[:, n, :T].copy()
+            s.state = s.history[:, :, -1].copy()
+
+            # Ions finished after the last time point of the species were still in flight for it
+            s.terminal = self.terminal[n].copy()
+            s.terminal[s.terminal > T - 1] = -1
+
+    def region(self, gizmo, run, T):
+
+        # Profiled turn if a 'Profile' is attached, with the zones, solver and calibration timed
+        if self.profile is None:
+            return contextlib.nullcontext()
+
+        watch = [(self.solver, "predict", "solver.predict"), (run, "pulse", "gizmo.pulse"), (self, "calibrate", "calibrate")]
+        for k, zone in enumerate(gizmo._val):
+            watch.append((zone, "compute", f"{type(zone).__name__} {k + 1}"))
+
+        return self.profile.region(f"turn {self.tag}", "turn", self.number * (T - 1), watch)
 
 class Simulator:
 
@@ -265,6 +389,11 @@ class Simulator:
         # State storage attribute
         self.group = {}
         self.solver = None
+        self.seed = None # Parent seed of the species streams, None for fresh entropy
+        self.merge = False # Run every species in a single batch (see 'State.gather')
+        self.workers = None # Threads running the species turns concurrently on the shared gizmo, None for one by one
+        self.profile = None # Optional 'Profile' shared by the turns of every species (see 'instrument')
+        self.telemetry = Telemetry(subscribers=[printer]) # Progress events of every species, None to run silently
         self.date = None
         self.hour = None
         
@@ -331,21 +460,55 @@ class Simulator:
 
         self.clock()
 
+        # The regions of a profile are nested, they can't be recorded from several threads
+        threaded = self.workers and not self.merge
+        if threaded and self.profile is not None:
+            raise ValueError("A 'Profile' can only record a round without workers")
 
+        # Every species draws its initial conditions from its own stream
+        self.seed = seeding.sequence(self.seed)
+        streams = self.seed.spawn(len(self.group))
 
         # Loop through every single state
-        for code in self.group:
+        for k, code in enumerate(self.group):
 
             state = self.group[code]
             state.date, state.hour = self.date, self.hour
+            state.seed = streams[k]
+            state.profile = self.profile
+            state.telemetry = self.telemetry
+
+            # Concurrent turns report their own stages to the same subscribers
+            if threaded and self.telemetry is not None:
+                state.telemetry = Telemetry(self.telemetry.interval, self.telemetry.subscribers)
 
             state.h = gizmo.period() * 1e-2
             T = int(1.05 * (gizmo._dst[-1] / state.injSpeed) // state.h)
 
-            gizmo.build(state, state.number)
             state.build(T)
 
-            state.turn(gizmo)
+        # One turn per species, each with its own context on the shared gizmo
+        if threaded:
+            with ThreadPoolExecutor(self.workers) as pool:
+                list(pool.map(lambda state: state.turn(gizmo), self.group.values()))
+
+        elif not self.merge:
+            for code in self.group:
+                self.group[code].turn(gizmo)
+
+        # All species in a single batch, the results are split back by tag
+        if self.merge:
+            states = list(self.group.values())
+
+            batch = State()
+            batch.tag = self.name
+            batch.profile = self.profile
+            batch.telemetry = self.telemetry
+            batch.gather(states)
+            batch.solver = self.solver(batch)
+
+            batch.turn(gizmo)
+            batch.split(states)
         
         self.l = gizmo._dst[-1]
         self.r = gizmo.inscRadius
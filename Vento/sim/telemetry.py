@@ -0,0 +1,82 @@
+import time
+
+__all__ = ["Telemetry", "printer"]
+
+class Telemetry:
+
+    # Rate-limited progress events, same events as 'Q521/telemetry.py': the turns report every
+    # time step, the subscribers (callables taking one event dictionary) are only called once
+    # per interval and at the end of each stage, so nothing is printed from the hot loops
+
+    def __init__(self, interval=1.0, subscribers=()):
+
+        self.interval = interval
+        self.subscribers = list(subscribers)
+
+        self.stage = None
+        self.total = 0
+        self.step = 0
+        self.work = 0
+        self.origin = None
+        self.last = None
+
+    def subscribe(self, callback):
+
+        self.subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+
+        self.subscribers.remove(callback)
+
+    def start(self, stage, total):
+
+        # Begin a stage of TOTAL time steps
+        self.stage = stage
+        self.total = total
+        self.step = 0
+        self.work = 0
+        self.origin = time.perf_counter()
+        self.last = self.origin
+
+    def update(self, survivors, steps=1, work=None):
+
+        # WORK is the number of ion-steps actually integrated, SURVIVORS * STEPS if not given
+        # (survivors may include ions which are no longer integrated, e.g. detected ones)
+        self.step += steps
+        self.work += survivors * steps if work is None else work
+
+        # Only emit once per interval, and at the end of the stage
+        now = time.perf_counter()
+        if now - self.last < self.interval and self.step < self.total:
+            return
+
+        self.last = now
+        elapsed = now - self.origin
+        fraction = self.step / self.total if self.total else 1
+
+        event = {
+            "stage": self.stage,
+            "step": self.step,
+            "total": self.total,
+            "fraction": fraction,
+            "elapsed": elapsed,
+            "eta": elapsed * (1 - fraction) / fraction if fraction > 0 else float("inf"),
+            "rate": self.work / elapsed if elapsed > 0 else 0,
+            "survivors": survivors
+        }
+
+        for callback in self.subscribers:
+            callback(event)
+
+    def stop(self, survivors, steps=1, work=None):
+
+        # Last time steps of a stage ended early (every ion is done), its event is always emitted
+        self.total = self.step + steps
+        self.update(survivors, steps, work)
+
+def printer(event):
+
+    # Subscriber printing the events on one line each
+    print(f"{event['stage']}: {100 * event['fraction']:5.1f}% (step {event['step']}/{event['total']}), "
+          f"{event['rate']:.3g} ion-steps/s, {event['survivors']} ions, ETA {event['eta']:.1f} s")
\ No newline at end of file